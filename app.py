@@ -1,31 +1,25 @@
 # app.py
+import uuid
 import streamlit as st
-import sqlite3
-from db_setup import init_db
+from db_setup import bootstrap_db
+from utils import perf
 from utils.login import require_login
-from utils.data_sync import auto_sync
 from modules.dashboards.KAM_dashboard import show_kam_dashboard
 from modules.dashboards.admin_dashboard import show_admin_dashboard
 
 st.set_page_config(page_title="Muyu Lab", layout="wide")
 
-# Inicializar BD primero
+# Agrupar las consultas de este rerun para la sección "Rendimiento"
+if "perf_session_id" not in st.session_state:
+    st.session_state["perf_session_id"] = uuid.uuid4().hex[:8]
+perf.start_rerun(st.session_state["perf_session_id"])
+
+# Inicializar BD primero (solo una vez por proceso; los reruns lo saltan)
 try:
-    init_db()
-    # Sincronización simplificada
-    auto_sync()
+    bootstrap_db()
 except Exception as e:
     st.error(f"Error en inicialización: {e}")
 
-DB_PATH = "database/muyulab.db"
-
-def run_query(query, params=()):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(query, params)
-    conn.commit()
-    return cur
-
 require_login()
 user = st.session_state.get("user", {})
 
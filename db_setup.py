@@ -1,112 +1,39 @@
 # db_setup.py
-import sqlite3
 import os
-import json
-from datetime import datetime
+import time
+import hashlib
+import sqlite3
+import threading
 from utils.auth import hash_password
+from utils.db import DB_PATH, transaction, run_query, fetch_all, fetch_one
+from modules.utils import (normalizar_institucion, trigramas, sincronizar_claves_instituciones,
+                           SQL_INSTITUCIONES_SIN_CLAVE, SQL_UPDATE_CLAVE_INSTITUCION, SQL_INSERT_TRIGRAMA)
 
-DB_PATH = "database/muyulab.db"
-MIGRATIONS_PATH = "database/migrations"
-SCHEMA_VERSION_FILE = "database/schema_version.json"
-
-def get_current_schema_version():
-    """Obtiene la versión actual del esquema de la BD"""
-    if os.path.exists(SCHEMA_VERSION_FILE):
-        with open(SCHEMA_VERSION_FILE, 'r') as f:
-            data = json.load(f)
-            return data.get('version', 0)
-    return 0
-
-def set_schema_version(version):
-    """Establece la versión del esquema"""
-    os.makedirs("database", exist_ok=True)
-    with open(SCHEMA_VERSION_FILE, 'w') as f:
-        json.dump({
-            'version': version,
-            'updated_at': datetime.now().isoformat()
-        }, f, indent=2)
-
-def run_migrations():
-    """Ejecuta migraciones pendientes"""
-    current_version = get_current_schema_version()
-    
-    # Define las migraciones disponibles
-    migrations = [
-        # Migración 1: Datos básicos iniciales
-        {
-            'version': 1,
-            'description': 'Datos iniciales del sistema',
-            'sql': [
-                "INSERT OR IGNORE INTO roles (nombre) VALUES ('Directivo')",
-                "INSERT OR IGNORE INTO roles (nombre) VALUES ('Contraparte')",
-                "INSERT OR IGNORE INTO roles (nombre) VALUES ('Líder pedagógico')",
-                "INSERT OR IGNORE INTO roles (nombre) VALUES ('Docente acompañado')",
-                "INSERT OR IGNORE INTO roles (nombre) VALUES ('Usuario Muyu App')",
-            ]
-        },
-        # Migración 2: Datos de ejemplo (puedes agregar más aquí)
-        {
-            'version': 2,
-            'description': 'Datos de ejemplo actualizados',
-            'sql': [
-                # Aquí puedes agregar nuevos registros que quieras sincronizar
-            ]
-        },
-        # Migración 3: Nuevos campos para instituciones
-        {
-            'version': 3,
-            'description': 'Agregar campos País, Dirección, Tipo de programa y Plan a instituciones',
-            'sql': [
-                "ALTER TABLE instituciones ADD COLUMN pais TEXT",
-                "ALTER TABLE instituciones ADD COLUMN tipo_programa TEXT DEFAULT 'Muyu Lab'",
-                "ALTER TABLE instituciones ADD COLUMN plan TEXT DEFAULT 'Pago'"
-            ]
-        },
-        # Migración 4: Separar nombre y apellidos en contactos
-        {
-            'version': 4,
-            'description': 'Agregar campo apellidos a contactos',
-            'sql': [
-                "ALTER TABLE contactos ADD COLUMN apellidos TEXT"
-            ]
-        },
-        # Migración 5: Agregar credenciales de email para KAMs
-        {
-            'version': 5,
-            'description': 'Agregar campos de credenciales de email para KAMs',
-            'sql': [
-                "ALTER TABLE kams ADD COLUMN email_usuario TEXT",
-                "ALTER TABLE kams ADD COLUMN email_password TEXT"
-            ]
-        }
-    ]
-    
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    for migration in migrations:
-        if migration['version'] > current_version:
-            print(f"Ejecutando migración {migration['version']}: {migration['description']}")
-            try:
-                for sql in migration['sql']:
-                    cursor.execute(sql)
-                conn.commit()
-                set_schema_version(migration['version'])
-                print(f"Migración {migration['version']} completada")
-            except Exception as e:
-                print(f"Error en migración {migration['version']}: {e}")
-                conn.rollback()
-                break
-    
-    conn.close()
+_bootstrap_lock = threading.Lock()
+_bootstrapped = False
 
-def init_db():
-    # asegurar que existe la carpeta "database"
-    os.makedirs("database", exist_ok=True)
+# -------------------------------
+# Utilidades para las migraciones
+# -------------------------------
+
+def _columns(cursor, table):
+    """Columnas actuales de una tabla"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {col[1] for col in cursor.fetchall()}
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def _add_missing_columns(cursor, table, columns):
+    """Agrega las columnas que falten (bases de datos creadas con versiones viejas)"""
+    existing = _columns(cursor, table)
+    for name, decl in columns:
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
 
+# -------------------------------
+# Migraciones
+# -------------------------------
+
+def _esquema_base(cursor):
+    """Tablas del sistema, columnas de versiones anteriores y datos iniciales"""
     # Tabla de KAMs
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS kams (
@@ -118,15 +45,10 @@ def init_db():
         email_password TEXT
     )
     """)
-
-    # Verificar y agregar columnas faltantes para KAMs
-    cursor.execute("PRAGMA table_info(kams)")
-    kam_columns = [col[1] for col in cursor.fetchall()]
-    
-    if "email_usuario" not in kam_columns:
-        cursor.execute("ALTER TABLE kams ADD COLUMN email_usuario TEXT")
-    if "email_password" not in kam_columns:
-        cursor.execute("ALTER TABLE kams ADD COLUMN email_password TEXT")
+    _add_missing_columns(cursor, "kams", [
+        ("email_usuario", "TEXT"),
+        ("email_password", "TEXT"),
+    ])
 
     # Tabla de instituciones educativas
     cursor.execute("""
@@ -142,19 +64,14 @@ def init_db():
         plan TEXT DEFAULT 'Pago'
     )
     """)
-
-    # Verificar y agregar columnas faltantes para instituciones
-    cursor.execute("PRAGMA table_info(instituciones)")
-    columns = [col[1] for col in cursor.fetchall()]
-    
-    if "anio_programa" not in columns:
-        cursor.execute("ALTER TABLE instituciones ADD COLUMN anio_programa INTEGER")
-    if "pais" not in columns:
-        cursor.execute("ALTER TABLE instituciones ADD COLUMN pais TEXT")
-    if "tipo_programa" not in columns:
-        cursor.execute("ALTER TABLE instituciones ADD COLUMN tipo_programa TEXT DEFAULT 'Muyu Lab'")
-    if "plan" not in columns:
-        cursor.execute("ALTER TABLE instituciones ADD COLUMN plan TEXT DEFAULT 'Pago'")
+    _add_missing_columns(cursor, "instituciones", [
+        ("direccion", "TEXT"),
+        ("provincia", "TEXT"),
+        ("pais", "TEXT"),
+        ("anio_programa", "INTEGER"),
+        ("tipo_programa", "TEXT DEFAULT 'Muyu Lab'"),
+        ("plan", "TEXT DEFAULT 'Pago'"),
+    ])
 
     # Relación KAM ↔ Institución
     cursor.execute("""
@@ -180,18 +97,9 @@ def init_db():
         FOREIGN KEY (institucion_id) REFERENCES instituciones (id)
     )
     """)
+    _add_missing_columns(cursor, "contactos", [("apellidos", "TEXT")])
 
-    # Verificar y agregar columnas faltantes para migraciones
-    cursor.execute("PRAGMA table_info(contactos)")
-    contacto_columns = [col[1] for col in cursor.fetchall()]
-    
-    if "apellidos" not in contacto_columns:
-        cursor.execute("ALTER TABLE contactos ADD COLUMN apellidos TEXT")
-
-    # Migración robusta: eliminar CHECK constraint en contactos.cargo si existe
-    cursor.execute("PRAGMA table_info(contactos)")
-    contacto_cols = cursor.fetchall()
-    # Buscar si la tabla tiene el CHECK constraint (por definición de la columna cargo)
+    # Eliminar el antiguo CHECK constraint en contactos.cargo si existe
     cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='contactos'")
     contactos_sql = cursor.fetchone()
     if contactos_sql and "CHECK" in contactos_sql[0]:
@@ -200,6 +108,7 @@ def init_db():
         CREATE TABLE contactos (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             nombre TEXT NOT NULL,
+            apellidos TEXT,
             cargo TEXT NOT NULL,
             email TEXT NOT NULL,
             telefono TEXT,
@@ -207,7 +116,7 @@ def init_db():
             FOREIGN KEY (institucion_id) REFERENCES instituciones (id)
         )
         """)
-        cursor.execute("INSERT INTO contactos (id, nombre, cargo, email, telefono, institucion_id) SELECT id, nombre, cargo, email, telefono, institucion_id FROM contactos_old")
+        cursor.execute("INSERT INTO contactos (id, nombre, apellidos, cargo, email, telefono, institucion_id) SELECT id, nombre, apellidos, cargo, email, telefono, institucion_id FROM contactos_old")
         cursor.execute("DROP TABLE contactos_old")
 
     # Tabla de mensajes
@@ -222,7 +131,7 @@ def init_db():
     )
     """)
 
-    # Crear tabla users si no existe
+    # Tabla de usuarios y usuario admin por defecto
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS users (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -232,22 +141,20 @@ def init_db():
         rol TEXT NOT NULL
     )
     """)
-    # Insertar usuario admin si no existe
-    cursor.execute("SELECT * FROM users WHERE email = ?", ("admin@muyulab.com",))
+    cursor.execute("SELECT 1 FROM users WHERE email = ?", ("admin@muyulab.com",))
     if not cursor.fetchone():
         cursor.execute(
             "INSERT INTO users (nombre, email, password, rol) VALUES (?, ?, ?, ?)",
             ("Administrador", "admin@muyulab.com", hash_password("admin123"), "admin")
         )
 
-    # Tabla de roles
+    # Tabla de roles y roles por defecto
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS roles (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         nombre TEXT UNIQUE NOT NULL
     )
     """)
-    # Insertar roles por defecto si no existen
     default_roles = [
         "Directivo",
         "Contraparte",
@@ -255,15 +162,445 @@ def init_db():
         "Docente acompañado",
         "Usuario Muyu App"
     ]
-    for role in default_roles:
-        cursor.execute("INSERT OR IGNORE INTO roles (nombre) VALUES (?)", (role,))
+    cursor.executemany("INSERT OR IGNORE INTO roles (nombre) VALUES (?)", [(r,) for r in default_roles])
+
+# Tablas cuyas escrituras (de cualquier proceso) invalidan la caché de consultas
+TABLAS_VIGILADAS = ("contactos", "instituciones", "kam_institucion", "mensajes", "kams", "roles")
+
+def _contadores_cambios(cursor):
+    """Tabla cambios con un contador por tabla que incrementan los triggers"""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS cambios (
+        tabla TEXT PRIMARY KEY,
+        contador INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    cursor.executemany("INSERT OR IGNORE INTO cambios (tabla) VALUES (?)", [(t,) for t in TABLAS_VIGILADAS])
+    for tabla in TABLAS_VIGILADAS:
+        for evento in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_cambios_{tabla}_{evento.lower()}
+            AFTER {evento} ON {tabla}
+            BEGIN
+                UPDATE cambios SET contador = contador + 1 WHERE tabla = '{tabla}';
+            END
+            """)
+
+def _claves_instituciones(cursor):
+    """Clave normalizada de instituciones e índice de trigramas (ver modules/utils.py)"""
+    _add_missing_columns(cursor, "instituciones", [("nombre_norm", "TEXT")])
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_instituciones_nombre_norm ON instituciones (nombre_norm)")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS institucion_trigramas (
+        trigrama TEXT NOT NULL,
+        institucion_id INTEGER NOT NULL,
+        PRIMARY KEY (trigrama, institucion_id)
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_institucion_trigramas_institucion ON institucion_trigramas (institucion_id)")
+    # Al renombrar o borrar una institución (desde cualquier camino) su clave
+    # queda vacía y sincronizar_claves_instituciones la vuelve a calcular
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_instituciones_nombre_norm
+    AFTER UPDATE OF nombre ON instituciones
+    WHEN NEW.nombre IS NOT OLD.nombre
+    BEGIN
+        UPDATE instituciones SET nombre_norm = NULL WHERE id = NEW.id;
+        DELETE FROM institucion_trigramas WHERE institucion_id = NEW.id;
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_instituciones_trigramas_delete
+    AFTER DELETE ON instituciones
+    BEGIN
+        DELETE FROM institucion_trigramas WHERE institucion_id = OLD.id;
+    END
+    """)
+    # Las instituciones existentes se indexan aquí, una sola vez
+    claves = [(normalizar_institucion(nombre), inst_id)
+              for inst_id, nombre in cursor.execute(SQL_INSTITUCIONES_SIN_CLAVE).fetchall()]
+    cursor.executemany(SQL_UPDATE_CLAVE_INSTITUCION, claves)
+    cursor.executemany(SQL_INSERT_TRIGRAMA, [(t, inst_id) for clave, inst_id in claves for t in trigramas(clave)])
+
+def _sincronizacion_gmail(cursor):
+    """Estado de la sincronización de Gmail y contactos acumulados por KAM y carpeta"""
+    # Último UID leído de cada carpeta; si cambia la cuenta o el UIDVALIDITY
+    # los UID anteriores ya no valen y la carpeta se vuelve a leer desde cero
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS gmail_sync (
+        kam_id INTEGER NOT NULL,
+        carpeta TEXT NOT NULL,
+        cuenta TEXT NOT NULL,
+        uidvalidity INTEGER NOT NULL,
+        ultimo_uid INTEGER NOT NULL DEFAULT 0,
+        actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (kam_id, carpeta)
+    ) WITHOUT ROWID
+    """)
+    # Apariciones de cada dirección en los correos ya leídos; se guardan por
+    # carpeta para poder descartar solo la carpeta que se vuelve a leer
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS gmail_contactos (
+        kam_id INTEGER NOT NULL,
+        carpeta TEXT NOT NULL,
+        email_clave TEXT NOT NULL,
+        email TEXT NOT NULL,
+        nombre TEXT NOT NULL DEFAULT '',
+        frecuencia INTEGER NOT NULL DEFAULT 0,
+        ultimo_correo TEXT NOT NULL DEFAULT '',
+        PRIMARY KEY (kam_id, carpeta, email_clave)
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_kams_gmail_delete
+    AFTER DELETE ON kams
+    BEGIN
+        DELETE FROM gmail_sync WHERE kam_id = OLD.id;
+        DELETE FROM gmail_contactos WHERE kam_id = OLD.id;
+    END
+    """)
+
+# Campos que un contacto repetido completa en el que se conserva si allí están vacíos
+_CAMPOS_FUSION = ("nombre", "apellidos", "cargo", "telefono")
+# Primer valor no vacío del campo entre los repetidos de cada contacto conservado
+_FUSIONAR_CAMPO = """{0} = coalesce(nullif({0}, ''), (
+        SELECT d.{0} FROM temp.contactos_repetidos r JOIN contactos d ON d.id = r.id
+        WHERE r.conservado_id = contactos.id AND d.{0} <> '' ORDER BY d.id LIMIT 1), {0})"""
+
+def _clave_unica_contactos(cursor):
+    """Índice único (email normalizado, institución) sin perder contactos repetidos.
+
+    De cada clave repetida se conserva el contacto más antiguo; sus campos
+    vacíos se completan con los de los repetidos, que se copian completos a
+    contactos_duplicados (con el id conservado) antes de quitarlos de
+    contactos. Los contactos sin institución no se tocan: el índice único
+    no los compara entre sí. Devuelve un aviso si hubo repetidos.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS contactos_duplicados (
+        id INTEGER PRIMARY KEY,
+        conservado_id INTEGER NOT NULL,
+        nombre TEXT,
+        apellidos TEXT,
+        cargo TEXT,
+        email TEXT,
+        telefono TEXT,
+        institucion_id INTEGER,
+        archivado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cursor.execute("DROP TABLE IF EXISTS temp.contactos_repetidos")
+    cursor.execute("""
+    CREATE TEMP TABLE contactos_repetidos AS
+    SELECT c.id, g.conservado_id
+    FROM contactos c JOIN (
+        SELECT lower(trim(email)) AS clave, institucion_id, MIN(id) AS conservado_id
+        FROM contactos WHERE trim(email) <> '' AND institucion_id IS NOT NULL
+        GROUP BY lower(trim(email)), institucion_id HAVING COUNT(*) > 1
+    ) g ON lower(trim(c.email)) = g.clave AND c.institucion_id = g.institucion_id
+    WHERE c.id <> g.conservado_id
+    """)
+    repetidos = cursor.execute("SELECT COUNT(*) FROM temp.contactos_repetidos").fetchone()[0]
+    if repetidos:
+        cursor.execute(f"""
+        UPDATE contactos SET {", ".join(_FUSIONAR_CAMPO.format(campo) for campo in _CAMPOS_FUSION)}
+        WHERE id IN (SELECT conservado_id FROM temp.contactos_repetidos)
+        """)
+        cursor.execute("""
+        INSERT INTO contactos_duplicados (id, conservado_id, nombre, apellidos, cargo, email, telefono, institucion_id)
+        SELECT c.id, r.conservado_id, c.nombre, c.apellidos, c.cargo, c.email, c.telefono, c.institucion_id
+        FROM temp.contactos_repetidos r JOIN contactos c ON c.id = r.id
+        """)
+        cursor.execute("DELETE FROM contactos WHERE id IN (SELECT id FROM temp.contactos_repetidos)")
+    cursor.execute("DROP TABLE temp.contactos_repetidos")
+    cursor.execute("DROP INDEX IF EXISTS idx_contactos_email_norm")
+    cursor.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_contactos_clave
+    ON contactos (lower(trim(email)), institucion_id) WHERE trim(email) <> ''
+    """)
+    if repetidos:
+        return (f"{repetidos} contactos repetidos (mismo email e institución) se fusionaron en el más "
+                f"antiguo; los originales quedan en la tabla contactos_duplicados")
+
+# Cada migración se aplica una sola vez; la versión alcanzada se guarda en
+# PRAGMA user_version. Agregar siempre al final con la versión siguiente y
+# escribirlas idempotentes (IF NOT EXISTS, columnas verificadas), porque las
+# bases de datos anteriores a este motor parten de la versión 0.
+MIGRATIONS = [
+    {
+        'version': 1,
+        'description': 'Esquema base, columnas de versiones anteriores y datos iniciales',
+        'apply': _esquema_base
+    },
+    {
+        'version': 2,
+        'description': 'Índices secundarios en kam_institucion, contactos, instituciones y mensajes',
+        'sql': [
+            # El índice único requiere eliminar antes los pares repetidos (se conserva el primero)
+            """DELETE FROM kam_institucion WHERE id NOT IN (
+                SELECT MIN(id) FROM kam_institucion GROUP BY kam_id, institucion_id
+            )""",
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_kam_institucion_unique ON kam_institucion (kam_id, institucion_id)",
+            "CREATE INDEX IF NOT EXISTS idx_kam_institucion_institucion ON kam_institucion (institucion_id)",
+            "CREATE INDEX IF NOT EXISTS idx_contactos_institucion ON contactos (institucion_id)",
+            "CREATE INDEX IF NOT EXISTS idx_contactos_email ON contactos (email, institucion_id)",
+            "CREATE INDEX IF NOT EXISTS idx_instituciones_nombre ON instituciones (nombre)",
+            "CREATE INDEX IF NOT EXISTS idx_mensajes_tipo ON mensajes (tipo)",
+            "CREATE INDEX IF NOT EXISTS idx_mensajes_fecha ON mensajes (fecha_envio_programada)"
+        ]
+    },
+    {
+        'version': 3,
+        'description': 'Contadores de cambios por tabla para invalidar cachés entre procesos',
+        'apply': _contadores_cambios
+    },
+    {
+        'version': 4,
+        'description': 'Índices para los órdenes de los listados paginados de contactos',
+        'sql': [
+            # El id (rowid) va implícito al final de cada índice: (nombre, id), (cargo, id)
+            "CREATE INDEX IF NOT EXISTS idx_contactos_nombre ON contactos (nombre)",
+            "CREATE INDEX IF NOT EXISTS idx_contactos_cargo ON contactos (cargo)"
+        ]
+    },
+    {
+        'version': 5,
+        'description': 'Índice por email normalizado e institución para detectar contactos repetidos',
+        'sql': [
+            "CREATE INDEX IF NOT EXISTS idx_contactos_email_norm ON contactos (lower(trim(email)), institucion_id)"
+        ]
+    },
+    {
+        'version': 6,
+        'description': 'Clave única de contactos: email normalizado e institución',
+        'apply': _clave_unica_contactos
+    },
+    {
+        'version': 7,
+        'description': 'Área de carga de la importación masiva (cargas, carga_filas, carga_instituciones)',
+        'sql': [
+            # Tablas normales y no TEMP: cada operación toma una conexión
+            # cualquiera del pool y la carga debe seguir ahí cuando Streamlit
+            # vuelve a ejecutar la página
+            """CREATE TABLE IF NOT EXISTS cargas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                archivo TEXT,
+                creada TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )""",
+            """CREATE TABLE IF NOT EXISTS carga_filas (
+                carga_id INTEGER NOT NULL,
+                fila INTEGER NOT NULL,
+                nombre TEXT NOT NULL,
+                apellidos TEXT NOT NULL,
+                cargo TEXT NOT NULL,
+                email TEXT NOT NULL,
+                telefono TEXT NOT NULL,
+                institucion TEXT NOT NULL,
+                email_clave TEXT NOT NULL,
+                institucion_clave TEXT NOT NULL,
+                institucion_id INTEGER,
+                nuevo_cargo INTEGER,
+                errores TEXT,
+                estado TEXT,
+                contacto_id INTEGER,
+                PRIMARY KEY (carga_id, fila)
+            ) WITHOUT ROWID""",
+            # Instituciones contra las que se resuelve cada carga (clave -> id)
+            """CREATE TABLE IF NOT EXISTS carga_instituciones (
+                carga_id INTEGER NOT NULL,
+                clave TEXT NOT NULL,
+                institucion_id INTEGER NOT NULL,
+                PRIMARY KEY (carga_id, clave)
+            ) WITHOUT ROWID"""
+        ]
+    },
+    {
+        'version': 8,
+        'description': 'Nombre normalizado de instituciones e índice de trigramas para buscarlas',
+        'apply': _claves_instituciones
+    },
+    {
+        'version': 9,
+        'description': 'Sincronización incremental de Gmail (gmail_sync) y contactos acumulados por KAM (gmail_contactos)',
+        'apply': _sincronizacion_gmail
+    },
+    {
+        'version': 10,
+        'description': 'Índices para los órdenes por institución (contactos) y por ciudad (instituciones)',
+        'sql': [
+            # Las expresiones son las de ORDEN_CONTACTOS y ORDEN_INSTITUCIONES en modules/utils.py
+            "CREATE INDEX IF NOT EXISTS idx_contactos_institucion_orden ON contactos (COALESCE(institucion_id, 0))",
+            "CREATE INDEX IF NOT EXISTS idx_instituciones_ciudad_orden ON instituciones (COALESCE(ciudad, ''))"
+        ]
+    },
+]
+
+LATEST_VERSION = MIGRATIONS[-1]['version']
+
+# Versión mínima de la biblioteca SQLite: las consultas usan UPDATE ... FROM
+# (3.33), ventanas como ROW_NUMBER (3.25) y ON CONFLICT DO UPDATE (3.24)
+SQLITE_MINIMA = (3, 33, 0)
+
+def comprobar_sqlite():
+    """Falla con un mensaje claro si la biblioteca SQLite es anterior a SQLITE_MINIMA"""
+    if sqlite3.sqlite_version_info < SQLITE_MINIMA:
+        raise sqlite3.NotSupportedError(
+            f"SQLite {sqlite3.sqlite_version} es demasiado antiguo: se necesita "
+            f"{'.'.join(map(str, SQLITE_MINIMA))} o superior (actualiza Python o la biblioteca sqlite3)")
+
+def get_schema_version(db_path=None):
+    """Versión del esquema guardada en PRAGMA user_version"""
+    return fetch_one("PRAGMA user_version", db_path=db_path)[0]
+
+def _aplicar(cursor, migration):
+    """Ejecuta una migración sobre el cursor; devuelve su aviso (o None)"""
+    aviso = migration['apply'](cursor) if 'apply' in migration else None
+    for sql in migration.get('sql', []):
+        cursor.execute(sql)
+    return aviso
+
+def migrate(db_path=None, verbose=True):
+    """Aplica las migraciones pendientes en una única transacción.
+
+    Si alguna falla se revierten todas y la versión no cambia. Al terminar
+    guarda la huella del esquema (ver bootstrap_db). Devuelve una lista con
+    la versión, descripción, duración (ms) y aviso de cada paso aplicado;
+    los avisos (p. ej. filas fusionadas) se imprimen siempre.
+    """
+    comprobar_sqlite()
+    if get_schema_version(db_path) >= LATEST_VERSION:
+        return []
+
+    report = []
+    with transaction(db_path, immediate=True) as cursor:
+        # Releer dentro del bloqueo por si otro proceso migró mientras tanto
+        cursor.execute("PRAGMA user_version")
+        current = cursor.fetchone()[0]
+        for migration in MIGRATIONS:
+            if migration['version'] <= current:
+                continue
+            start = time.perf_counter()
+            aviso = _aplicar(cursor, migration)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            report.append({
+                'version': migration['version'],
+                'description': migration['description'],
+                'ms': elapsed_ms,
+                'aviso': aviso
+            })
+            if verbose:
+                print(f"Migración {migration['version']} ({migration['description']}): {elapsed_ms:.1f} ms")
+            if aviso:
+                print(f"AVISO migración {migration['version']}: {aviso}")
+        cursor.execute(f"PRAGMA user_version = {LATEST_VERSION}")
+    store_fingerprint(schema_fingerprint(db_path), db_path)
+    return report
+
+def esquema_esperado():
+    """Tablas, índices y triggers que dejan las migraciones: se aplican sobre
+    una base en memoria y se lee su sqlite_master"""
+    conn = sqlite3.connect(":memory:")
+    try:
+        cursor = conn.cursor()
+        for migration in MIGRATIONS:
+            _aplicar(cursor, migration)
+        return cursor.execute("""
+            SELECT type, name, sql FROM sqlite_master
+            WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+            ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 ELSE 2 END, name
+        """).fetchall()
+    finally:
+        conn.close()
+
+def reparar_esquema(db_path=None, verbose=True):
+    """Vuelve a crear las tablas, índices y triggers que falten.
+
+    Solo ejecuta DDL sin datos: las migraciones que transforman o borran
+    filas no se repiten. Devuelve los nombres de los objetos recreados.
+    """
+    recreados = []
+    with transaction(db_path, immediate=True) as cursor:
+        existentes = {name for (name,) in cursor.execute("SELECT name FROM sqlite_master")}
+        for tipo, nombre, sql in esquema_esperado():
+            if nombre in existentes:
+                continue
+            try:
+                cursor.execute(sql)
+            except sqlite3.IntegrityError as e:
+                raise sqlite3.IntegrityError(
+                    f"No se pudo recrear el índice {nombre}: hay filas que lo violan ({e})") from e
+            recreados.append(nombre)
+            if verbose:
+                print(f"Recreado {tipo} {nombre}")
+    store_fingerprint(schema_fingerprint(db_path), db_path)
+    return recreados
+
+def init_db():
+    # asegurar que existe la carpeta "database"
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    return migrate()
+
+# -------------------------------
+# Arranque una vez por proceso
+# -------------------------------
+
+def schema_fingerprint(db_path=None):
+    """Huella del esquema actual: hash de sqlite_master y de la versión"""
+    rows = fetch_all("""
+        SELECT type, name, sql FROM sqlite_master
+        WHERE name NOT LIKE 'sqlite_%' AND name != 'schema_meta'
+        ORDER BY type, name
+    """, db_path=db_path)
+    digest = hashlib.sha1(f"v{get_schema_version(db_path)}".encode())
+    for row in rows:
+        digest.update(repr(row).encode())
+    return digest.hexdigest()
+
+def get_stored_fingerprint(db_path=None):
+    """Huella guardada tras la última migración o reparación (None si no hay)"""
+    try:
+        row = fetch_one("SELECT valor FROM schema_meta WHERE clave = 'fingerprint'", db_path=db_path)
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+def store_fingerprint(fingerprint, db_path=None):
+    """Guarda la huella del esquema ya inicializado"""
+    run_query("CREATE TABLE IF NOT EXISTS schema_meta (clave TEXT PRIMARY KEY, valor TEXT)", db_path=db_path)
+    run_query("INSERT OR REPLACE INTO schema_meta (clave, valor) VALUES ('fingerprint', ?)",
+              (fingerprint,), db_path=db_path)
+
+def bootstrap_db():
+    """Inicializa el esquema una sola vez por proceso.
 
-    conn.commit()
-    conn.close()
-    
-    # Ejecutar migraciones después de crear las tablas
-    run_migrations()
+    Con la versión al día y la huella del esquema igual a la guardada no se
+    ejecuta ningún DDL. Si falta alguna versión se aplican las migraciones;
+    si la huella cambió (esquema modificado desde fuera) solo se recrean
+    las tablas, índices y triggers que falten.
+    Devuelve True si se ejecutó la inicialización completa.
+    """
+    global _bootstrapped
+    if _bootstrapped:
+        return False
+    with _bootstrap_lock:
+        if _bootstrapped:
+            return False
+        comprobar_sqlite()
+        ran = False
+        if not os.path.exists(DB_PATH) or get_schema_version() < LATEST_VERSION:
+            init_db()
+            ran = True
+        elif get_stored_fingerprint() != schema_fingerprint():
+            # Versión al día pero el esquema cambió desde fuera: reparar
+            reparar_esquema()
+            ran = True
+        # Claves de las instituciones escritas sin pasar por modules.utils
+        # (scripts, otras versiones de la app): una sola vez por proceso
+        sincronizar_claves_instituciones()
+        _bootstrapped = True
+        return ran
 
 if __name__ == "__main__":
-    init_db()
-    print("Base de datos inicializada en database/muyulab.db")
+    for step in init_db():
+        print(f"  v{step['version']}: {step['ms']:.1f} ms")
+    print(f"Base de datos inicializada en {DB_PATH} (versión {get_schema_version()})")
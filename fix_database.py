@@ -1,44 +1,28 @@
-import sqlite3
 import os
-
-DB_PATH = "database/muyulab.db"
+from utils.db import DB_PATH
+from db_setup import migrate, reparar_esquema, get_schema_version, LATEST_VERSION
 
 def fix_database():
-    """Agrega las columnas faltantes a la base de datos"""
+    """Aplica las migraciones pendientes (columnas faltantes, índices, etc.)"""
     if not os.path.exists(DB_PATH):
         print("La base de datos no existe. Ejecuta la aplicación primero.")
         return
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     try:
-        # Verificar columnas existentes en la tabla kams
-        cursor.execute("PRAGMA table_info(kams)")
-        columns = [col[1] for col in cursor.fetchall()]
-        print(f"Columnas actuales en kams: {columns}")
-        
-        # Agregar columnas faltantes
-        if "email_usuario" not in columns:
-            cursor.execute("ALTER TABLE kams ADD COLUMN email_usuario TEXT")
-            print("✅ Columna email_usuario agregada")
-        else:
-            print("ℹ️ Columna email_usuario ya existe")
-            
-        if "email_password" not in columns:
-            cursor.execute("ALTER TABLE kams ADD COLUMN email_password TEXT")
-            print("✅ Columna email_password agregada")
-        else:
-            print("ℹ️ Columna email_password ya existe")
-        
-        conn.commit()
+        print(f"Versión actual del esquema: {get_schema_version()} (última: {LATEST_VERSION})")
+        report = migrate(verbose=False)
+        for step in report:
+            print(f"✅ Migración {step['version']} ({step['description']}): {step['ms']:.1f} ms")
+            if step['aviso']:
+                print(f"⚠️ {step['aviso']}")
+        if not report:
+            print("ℹ️ No hay migraciones pendientes")
+            for nombre in reparar_esquema(verbose=False):
+                print(f"✅ Recreado {nombre}")
         print("🎉 Base de datos actualizada correctamente")
         
     except Exception as e:
         print(f"❌ Error al actualizar la base de datos: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
 
 if __name__ == "__main__":
     fix_database()
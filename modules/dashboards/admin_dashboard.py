@@ -1,34 +1,19 @@
-import streamlit as st
 import sqlite3
+import time
+import streamlit as st
 import pandas as pd
-from utils.auth import hash_password
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from utils import gmail_simple_contacts
-
-DB_PATH = "database/muyulab.db"
-
-def run_query(query, params=()):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(query, params)
-    conn.commit()
-    return cur
-
-def run_insert_query(query, params=()):
-    """Función específica para inserts que asegura el commit"""
-    conn = sqlite3.connect(DB_PATH)
-    try:
-        cur = conn.cursor()
-        cur.execute(query, params)
-        conn.commit()
-        return True
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+from utils.db import DB_PATH, fetch_all, run_query, transaction
+from utils import perf, query_cache
+from modules import utils as dao
+from modules.dashboards.carga_masiva import mostrar_carga_masiva
+from modules.dashboards.descargas import botones_exportacion
+from modules.dashboards.paginacion import controles_listado, tabla_paginada
+from modules.dashboards.seleccion_institucion import selector_institucion
+from modules.users import create_user
 
 def test_email_credentials(email_user, email_pass):
     """Prueba las credenciales de email sin enviar mensaje"""
@@ -41,6 +26,52 @@ def test_email_credentials(email_user, email_pass):
     except Exception:
         return False
 
+def show_rendimiento():
+    """Métricas de las consultas registradas por utils.perf"""
+    st.subheader(":blue[Rendimiento de la base de datos]")
+    if not perf.ENABLED:
+        st.info("La instrumentación está desactivada (MUYULAB_PERF=0).")
+        return
+
+    ventanas = {"Últimos 5 minutos": 300, "Última hora": 3600, "Todo lo registrado": None}
+    ventana = st.selectbox("Periodo", list(ventanas.keys()), index=1)
+    registros = perf.records()
+    if ventanas[ventana]:
+        desde = time.time() - ventanas[ventana]
+        registros = [r for r in registros if r["ts"] >= desde]
+    if not registros:
+        st.info("Todavía no hay consultas registradas en este periodo.")
+        return
+
+    tiempos = [r["ms"] for r in registros]
+    reruns = perf.summary_by_rerun(registros)
+    cache_stats = query_cache.stats()
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("Llamadas", len(registros))
+    col2.metric("p50", f"{perf.percentile(tiempos, 50):.2f} ms")
+    col3.metric("p95", f"{perf.percentile(tiempos, 95):.2f} ms")
+    col4.metric("Llamadas por rerun", f"{sum(r['llamadas'] for r in reruns) / len(reruns):.1f}" if reruns else "-")
+    col5.metric("Aciertos de caché", f"{cache_stats['hit_rate']:.0%}")
+
+    st.write("### Sentencias más costosas")
+    por_sentencia = pd.DataFrame(perf.summary_by_statement(registros)[:20])
+    st.dataframe(por_sentencia.round(2), use_container_width=True, hide_index=True)
+
+    st.write("### Últimos reruns")
+    if reruns:
+        df_reruns = pd.DataFrame(reruns[-20:][::-1])
+        df_reruns["inicio"] = pd.to_datetime(df_reruns["inicio"], unit="s")
+        st.dataframe(df_reruns.round(2), use_container_width=True, hide_index=True)
+
+    st.write("### Sesiones")
+    sesiones = perf.summary_by_session(registros)
+    if sesiones:
+        st.dataframe(pd.DataFrame(sesiones).round(2), use_container_width=True, hide_index=True)
+
+    if st.button("🗑️ Limpiar registros"):
+        perf.clear()
+        st.rerun()
+
 def show_admin_dashboard():
     # Obtener información del usuario
     user = st.session_state.get("user", {})
@@ -74,7 +105,7 @@ def show_admin_dashboard():
         st.info("Acceso solo a mensajes.")
         menu = "Mensajes"
     else:
-        menu = st.sidebar.radio("Navegación", ["KAMs", "Instituciones", "Contactos", "Mensajes"])
+        menu = st.sidebar.radio("Navegación", ["KAMs", "Instituciones", "Contactos", "Mensajes", "Rendimiento"])
 
     st.image("assets/muyu_logo.jpg", width=200)
     st.title(f"Muyu Lab Contact - :red[Gestión de Relaciones] ({user.get('rol','')})")
@@ -100,20 +131,15 @@ def show_admin_dashboard():
                 
                 if submitted and nombre and email and password:
                     # Verificar si el email ya existe
-                    existing_kam = run_query("SELECT email FROM kams WHERE email = ?", (email,)).fetchone()
-                    existing_user = run_query("SELECT email FROM users WHERE email = ?", (email,)).fetchone()
-                    
-                    if existing_kam or existing_user:
+                    if dao.email_registrado(email):
                         st.error(f"❌ El email '{email}' ya está registrado en el sistema. Por favor usa un email diferente.")
                     else:
                         try:
                             # Insertar KAM
-                            run_query("INSERT INTO kams (nombre, email, telefono, email_usuario, email_password) VALUES (?, ?, ?, ?, ?)", 
-                                     (nombre, email, telefono, email_usuario if email_usuario else None, email_password if email_password else None))
+                            dao.create_kam(nombre, email, telefono, email_usuario or None, email_password or None)
                             
                             # Insertar usuario
-                            run_query("INSERT INTO users (nombre, email, password, rol) VALUES (?, ?, ?, ?)",
-                                      (nombre, email, hash_password(password), "KAM"))
+                            create_user(nombre, email, password, "KAM")
                             
                             st.success("✅ KAM y usuario creados correctamente")
                             
@@ -130,12 +156,12 @@ def show_admin_dashboard():
 
         elif accion_kam == "Configurar Email":
             st.write("### Configurar Credenciales de Email para KAMs")
-            kams = run_query("SELECT id, nombre, email, email_usuario FROM kams").fetchall()
+            kams = dao.list_kams()
             if kams:
-                kam_dict = {f"{k[1]} | {k[2]}": k[0] for k in kams}
+                kam_dict = {f"{k.nombre} | {k.email}": k.id for k in kams}
                 kam_sel = st.selectbox("Selecciona KAM", list(kam_dict.keys()), key="config_kam")
                 kam_id = kam_dict[kam_sel]
-                kam_data = run_query("SELECT nombre, email, email_usuario, email_password FROM kams WHERE id = ?", (kam_id,)).fetchone()
+                kam = dao.get_kam(kam_id)
                 
                 st.info("Configura las credenciales de email que usará este KAM para enviar mensajes")
                 
@@ -166,7 +192,7 @@ def show_admin_dashboard():
                 with st.form("email_config_form"):
                     email_usuario = st.text_input(
                         "Email para envío (Gmail)", 
-                        value=kam_data[2] or "", 
+                        value=kam.email_usuario or "", 
                         help="Debe ser una cuenta de Gmail válida"
                     )
                     email_password = st.text_input(
@@ -191,10 +217,9 @@ def show_admin_dashboard():
                             
                             if test_result:
                                 # Guardar credenciales
-                                run_query("UPDATE kams SET email_usuario = ?, email_password = ? WHERE id = ?", 
-                                         (email_usuario, email_password, kam_id))
+                                dao.update_kam_email_config(kam_id, email_usuario, email_password)
                                 st.success("✅ Credenciales configuradas y probadas correctamente")
-                                st.info(f"📧 **Email configurado para:** {kam_data[1]} → {email_usuario}")
+                                st.info(f"📧 **Email configurado para:** {kam.email} → {email_usuario}")
                                 st.balloons()
                             else:
                                 st.error("❌ Las credenciales no funcionan. Verifica:")
@@ -211,18 +236,18 @@ def show_admin_dashboard():
 
         elif accion_kam == "Modificar KAM":
             st.write("### Modificar KAM")
-            kams = run_query("SELECT id, nombre, email, telefono FROM kams").fetchall()
+            kams = dao.list_kams()
             if kams:
-                kam_dict = {f"{k[1]} | {k[2]} | {k[3]}": k[0] for k in kams}
+                kam_dict = {f"{k.nombre} | {k.email} | {k.telefono}": k.id for k in kams}
                 kam_sel = st.selectbox("Selecciona KAM", list(kam_dict.keys()), key="mod_kam")
                 kam_id = kam_dict[kam_sel]
-                kam_data = run_query("SELECT nombre, email, telefono FROM kams WHERE id = ?", (kam_id,)).fetchone()
-                new_nombre = st.text_input("Nuevo nombre", value=kam_data[0], key="edit_kam_nombre")
-                new_email = st.text_input("Nuevo email", value=kam_data[1], key="edit_kam_email")
-                new_telefono = st.text_input("Nuevo teléfono", value=kam_data[2], key="edit_kam_tel")
+                kam = dao.get_kam(kam_id)
+                new_nombre = st.text_input("Nuevo nombre", value=kam.nombre, key="edit_kam_nombre")
+                new_email = st.text_input("Nuevo email", value=kam.email, key="edit_kam_email")
+                new_telefono = st.text_input("Nuevo teléfono", value=kam.telefono, key="edit_kam_tel")
                 if st.button("Guardar cambios KAM"):
-                    run_query("UPDATE kams SET nombre = ?, email = ?, telefono = ? WHERE id = ?", (new_nombre, new_email, new_telefono, kam_id))
-                    run_query("UPDATE users SET nombre = ?, email = ? WHERE email = ? AND rol = ?", (new_nombre, new_email, kam_data[1], "KAM"))
+                    dao.update_kam(kam_id, new_nombre, new_email, new_telefono)
+                    dao.update_user_kam(kam.email, new_nombre, new_email)
                     st.success("KAM modificado correctamente")
                     st.rerun()
             else:
@@ -230,15 +255,15 @@ def show_admin_dashboard():
 
         elif accion_kam == "Borrar KAM":
             st.write("### Borrar KAM")
-            kams = run_query("SELECT id, nombre, email, telefono FROM kams").fetchall()
+            kams = dao.list_kams()
             if kams:
-                kam_dict = {f"{k[1]} | {k[2]} | {k[3]}": k[0] for k in kams}
+                kam_dict = {f"{k.nombre} | {k.email} | {k.telefono}": k.id for k in kams}
                 kam_sel = st.selectbox("Selecciona KAM", list(kam_dict.keys()), key="del_kam")
                 kam_id = kam_dict[kam_sel]
-                kam_data = run_query("SELECT nombre, email FROM kams WHERE id = ?", (kam_id,)).fetchone()
+                kam = dao.get_kam(kam_id)
                 if st.button("Borrar KAM"):
-                    run_query("DELETE FROM kams WHERE id = ?", (kam_id,))
-                    run_query("DELETE FROM users WHERE email = ? AND rol = ?", (kam_data[1], "KAM"))
+                    dao.delete_kam(kam_id)
+                    dao.delete_user_kam(kam.email)
                     st.success("KAM eliminado correctamente")
                     st.rerun()
             else:
@@ -246,18 +271,16 @@ def show_admin_dashboard():
 
         elif accion_kam == "Asignar Instituciones":
             st.write("### Asignar Instituciones a KAM")
-            kams = run_query("SELECT id, nombre FROM kams").fetchall()
-            instituciones = run_query("SELECT id, nombre FROM instituciones").fetchall()
+            kams = dao.list_kams()
+            instituciones = dao.list_instituciones()
             if kams and instituciones:
-                kam_dict = {k[1]: k[0] for k in kams}
-                inst_dict = {i[1]: i[0] for i in instituciones}
+                kam_dict = {k.nombre: k.id for k in kams}
+                inst_dict = {i.nombre: i.id for i in instituciones}
                 selected_kam = st.selectbox("Selecciona KAM", list(kam_dict.keys()), key="asig_kam")
                 selected_insts = st.multiselect("Selecciona instituciones", list(inst_dict.keys()), key="asig_insts")
                 if st.button("Asignar instituciones") and selected_kam and selected_insts:
                     kam_id = kam_dict[selected_kam]
-                    for inst_name in selected_insts:
-                        inst_id = inst_dict[inst_name]
-                        run_query("INSERT OR IGNORE INTO kam_institucion (kam_id, institucion_id) VALUES (?, ?)", (kam_id, inst_id))
+                    dao.assign_instituciones(kam_id, [inst_dict[inst_name] for inst_name in selected_insts])
                     st.success("Instituciones asignadas al KAM correctamente")
         elif accion_kam == "Limpiar duplicados asignaciones KAM":
             st.write("### Limpiar duplicados en kam_institucion")
@@ -280,16 +303,16 @@ def show_admin_dashboard():
                 return dest
 
             def _find_duplicates():
-                rows = run_query("""
+                rows = fetch_all("""
                     SELECT kam_id, institucion_id, COUNT(*) as cnt
                     FROM kam_institucion
                     GROUP BY kam_id, institucion_id
                     HAVING cnt > 1
-                """).fetchall()
+                """)
                 return rows
 
             def _get_rows_for_pair(kam_id, inst_id):
-                return run_query("SELECT id FROM kam_institucion WHERE kam_id = ? AND institucion_id = ? ORDER BY id", (kam_id, inst_id)).fetchall()
+                return fetch_all("SELECT id FROM kam_institucion WHERE kam_id = ? AND institucion_id = ? ORDER BY id", (kam_id, inst_id))
 
             if do_run or do_apply:
                 db_path = DB_PATH
@@ -333,12 +356,12 @@ def show_admin_dashboard():
 
         elif accion_kam == "Ver KAMs":
             st.write("### Lista de KAMs")
-            kams = run_query("SELECT id, nombre, email, telefono, email_usuario FROM kams").fetchall()
+            kams = dao.list_kams()
             if kams:
                 st.write("**Formato:** Nombre | Email | Teléfono | Estado Email")
                 for k in kams:
-                    email_status = "✅ Configurado" if k[4] else "⚠️ No configurado"
-                    st.write(f"**{k[1]}** | {k[2]} | {k[3] or 'Sin teléfono'} | {email_status}")
+                    email_status = "✅ Configurado" if k.email_usuario else "⚠️ No configurado"
+                    st.write(f"**{k.nombre}** | {k.email} | {k.telefono or 'Sin teléfono'} | {email_status}")
             else:
                 st.info("No hay KAMs registrados.")
 
@@ -360,55 +383,84 @@ def show_admin_dashboard():
                 plan = st.selectbox("Plan", ["Pago", "Apadrinado"])
                 submitted = st.form_submit_button("Guardar")
                 if submitted and nombre:
-                    run_query("INSERT INTO instituciones (nombre, direccion, ciudad, provincia, pais, anio_programa, tipo_programa, plan) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                              (nombre, direccion, ciudad, provincia, pais, anio_programa, tipo_programa, plan))
+                    dao.create_institucion(nombre, direccion, ciudad, provincia, pais, anio_programa, tipo_programa, plan)
                     st.success("Institución agregada correctamente")
 
         elif accion == "Ver instituciones":
             st.write("### Lista de Instituciones")
-            insts = run_query("SELECT id, nombre, direccion, ciudad, provincia, pais, anio_programa, tipo_programa, plan FROM instituciones").fetchall()
-            for i in insts:
-                st.write(f"**{i[1]}** | {i[2] or 'Sin dirección'} | {i[3] or 'Sin ciudad'}, {i[4] or 'Sin provincia'}, {i[5] or 'Sin país'} | {i[6] or 'Sin año'} | {i[7] or 'Muyu Lab'} | {i[8] or 'Pago'}")
+            texto, orden, descendente = controles_listado("ver_instituciones", {
+                "Nombre": ("nombre", False),
+                "Ciudad": ("ciudad", False),
+                "Más recientes": ("id", True),
+            }, "Nombre, ciudad o provincia")
+            col_tipo, col_plan = st.columns(2)
+            tipo_programa = col_tipo.selectbox("Tipo de programa", ["Todos", "Muyu Lab", "Muyu App", "Muyu Scalelab"], key="ver_instituciones_tipo")
+            plan = col_plan.selectbox("Plan", ["Todos", "Pago", "Apadrinado"], key="ver_instituciones_plan")
+            filtros = {
+                "texto": texto,
+                "tipo_programa": None if tipo_programa == "Todos" else tipo_programa,
+                "plan": None if plan == "Todos" else plan,
+            }
+            botones_exportacion("exportar_instituciones", "instituciones")
+            total = dao.count_page_instituciones(**filtros)
+            if total:
+                tabla_paginada(
+                    "ver_instituciones",
+                    lambda despues, limite: dao.page_instituciones(orden, descendente, despues, limite, **filtros),
+                    total,
+                    [
+                        ("Nombre", lambda i: i.nombre),
+                        ("Dirección", lambda i: i.direccion or ""),
+                        ("Ciudad", lambda i: i.ciudad or ""),
+                        ("Provincia", lambda i: i.provincia or ""),
+                        ("País", lambda i: i.pais or ""),
+                        ("Año", lambda i: i.anio_programa or ""),
+                        ("Programa", lambda i: i.tipo_programa or "Muyu Lab"),
+                        ("Plan", lambda i: i.plan or "Pago"),
+                    ],
+                    firma=(orden, descendente, tuple(filtros.values())),
+                )
+            else:
+                st.info("No hay instituciones que coincidan con la búsqueda.")
 
         elif accion == "Modificar institución":
             st.write("### Modificar Institución")
-            insts = run_query("SELECT id, nombre, direccion, ciudad, provincia, pais, anio_programa, tipo_programa, plan FROM instituciones").fetchall()
+            insts = dao.list_instituciones()
             if insts:
-                inst_dict = {f"{i[1]} ({i[3]}, {i[5]}) - {i[6]} - {i[7]}": i[0] for i in insts}
+                inst_dict = {f"{i.nombre} ({i.ciudad}, {i.pais}) - {i.anio_programa} - {i.tipo_programa}": i.id for i in insts}
                 inst_sel = st.selectbox("Selecciona institución", list(inst_dict.keys()), key="mod_inst")
                 inst_id = inst_dict[inst_sel]
-                inst_data = run_query("SELECT nombre, direccion, ciudad, provincia, pais, anio_programa, tipo_programa, plan FROM instituciones WHERE id = ?", (inst_id,)).fetchone()
+                inst = dao.get_institucion(inst_id)
                 
-                new_nombre = st.text_input("Nuevo nombre", value=inst_data[0] or "", key="edit_nombre")
-                new_direccion = st.text_input("Nueva dirección", value=inst_data[1] or "", key="edit_direccion")
-                new_ciudad = st.text_input("Nueva ciudad", value=inst_data[2] or "", key="edit_ciudad")
-                new_provincia = st.text_input("Nueva provincia/estado", value=inst_data[3] or "", key="edit_provincia")
-                new_pais = st.text_input("Nuevo país", value=inst_data[4] or "", key="edit_pais")
+                new_nombre = st.text_input("Nuevo nombre", value=inst.nombre or "", key="edit_nombre")
+                new_direccion = st.text_input("Nueva dirección", value=inst.direccion or "", key="edit_direccion")
+                new_ciudad = st.text_input("Nueva ciudad", value=inst.ciudad or "", key="edit_ciudad")
+                new_provincia = st.text_input("Nueva provincia/estado", value=inst.provincia or "", key="edit_provincia")
+                new_pais = st.text_input("Nuevo país", value=inst.pais or "", key="edit_pais")
                 
                 anios = [f"Año {i}" for i in range(1, 7)]
                 try:
-                    anio_index = anios.index(inst_data[5]) if inst_data[5] else 0
+                    anio_index = anios.index(inst.anio_programa) if inst.anio_programa else 0
                 except (ValueError, TypeError):
                     anio_index = 0
                 new_anio = st.selectbox("Nuevo año de programa", anios, index=anio_index, key="edit_anio")
                 
                 tipos_programa = ["Muyu Lab", "Muyu App", "Muyu Scalelab"]
                 try:
-                    tipo_index = tipos_programa.index(inst_data[6]) if inst_data[6] else 0
+                    tipo_index = tipos_programa.index(inst.tipo_programa) if inst.tipo_programa else 0
                 except (ValueError, TypeError):
                     tipo_index = 0
                 new_tipo_programa = st.selectbox("Nuevo tipo de programa", tipos_programa, index=tipo_index, key="edit_tipo")
                 
                 planes = ["Pago", "Apadrinado"]
                 try:
-                    plan_index = planes.index(inst_data[7]) if inst_data[7] else 0
+                    plan_index = planes.index(inst.plan) if inst.plan else 0
                 except (ValueError, TypeError):
                     plan_index = 0
                 new_plan = st.selectbox("Nuevo plan", planes, index=plan_index, key="edit_plan")
                 
                 if st.button("Guardar cambios"):
-                    run_query("UPDATE instituciones SET nombre = ?, direccion = ?, ciudad = ?, provincia = ?, pais = ?, anio_programa = ?, tipo_programa = ?, plan = ? WHERE id = ?", 
-                             (new_nombre, new_direccion, new_ciudad, new_provincia, new_pais, new_anio, new_tipo_programa, new_plan, inst_id))
+                    dao.update_institucion(inst_id, new_nombre, new_direccion, new_ciudad, new_provincia, new_pais, new_anio, new_tipo_programa, new_plan)
                     st.success("Institución modificada correctamente")
                     st.rerun()
             else:
@@ -416,13 +468,13 @@ def show_admin_dashboard():
 
         elif accion == "Borrar institución":
             st.write("### Borrar Institución")
-            insts = run_query("SELECT id, nombre, ciudad, pais, tipo_programa, plan FROM instituciones").fetchall()
+            insts = dao.list_instituciones()
             if insts:
-                inst_dict = {f"{i[1]} ({i[2]}, {i[3]}) - {i[4]} - {i[5]}": i[0] for i in insts}
+                inst_dict = {f"{i.nombre} ({i.ciudad}, {i.pais}) - {i.tipo_programa} - {i.plan}": i.id for i in insts}
                 inst_sel = st.selectbox("Selecciona institución", list(inst_dict.keys()), key="del_inst")
                 inst_id = inst_dict[inst_sel]
                 if st.button("Borrar institución"):
-                    run_query("DELETE FROM instituciones WHERE id = ?", (inst_id,))
+                    dao.delete_institucion(inst_id)
                     st.success("Institución eliminada correctamente")
                     st.rerun()
             else:
@@ -434,14 +486,12 @@ def show_admin_dashboard():
         acciones_contacto = ["Registrar contacto", "Modificar contacto", "Borrar contacto", "Ver contactos", "Carga masiva", "Importar desde Gmail"]
         accion_contacto = st.selectbox("Selecciona una acción:", acciones_contacto)
 
-        instituciones = run_query("SELECT id, nombre FROM instituciones").fetchall()
-        institucion_dict = {nombre: iid for iid, nombre in instituciones}
-        roles = run_query("SELECT nombre FROM roles").fetchall()
-        roles_list = [r[0] for r in roles] if roles else []
+        instituciones = dao.list_instituciones()
+        institucion_dict = {i.nombre: i.id for i in instituciones}
+        roles_list = dao.list_roles()
 
         if accion_contacto == "Registrar contacto":
-            institucion_nombre = st.selectbox("Institución", list(institucion_dict.keys())) if instituciones else None
-            institucion_id = institucion_dict[institucion_nombre] if institucion_nombre else None
+            institucion_id = selector_institucion(instituciones, "reg_contacto_inst")
             nombre = st.text_input("Nombre")
             apellidos = st.text_input("Apellidos")
             cargo = st.selectbox("Cargo", roles_list)
@@ -449,57 +499,85 @@ def show_admin_dashboard():
             telefono = st.text_input("Teléfono celular, :red[número compatible con WhatsApp]")
             if st.button("Guardar Contacto"):
                 if institucion_id:
-                    run_query("INSERT INTO contactos (nombre, apellidos, cargo, email, telefono, institucion_id) VALUES (?, ?, ?, ?, ?, ?)",
-                              (nombre, apellidos, cargo, email, telefono, institucion_id))
-                    st.success("Contacto agregado correctamente")
+                    try:
+                        dao.create_contacto(nombre, apellidos, cargo, email, telefono, institucion_id)
+                    except sqlite3.IntegrityError:
+                        st.error("Ya existe un contacto con ese email en la institución")
+                    else:
+                        st.success("Contacto agregado correctamente")
                 else:
                     st.warning("Debes registrar al menos una institución antes de agregar contactos.")
 
         elif accion_contacto == "Ver contactos":
             st.write("### Lista de Contactos")
-            contactos = run_query("SELECT nombre, apellidos, cargo, email, telefono FROM contactos").fetchall()
-            for c in contactos:
-                nombre_completo = f"{c[0]} {c[1] or ''}".strip()
-                st.write(f"{nombre_completo} - {c[2]} | {c[3]} | {c[4]}")
+            texto, orden, descendente = controles_listado("ver_contactos", {
+                "Nombre": ("nombre", False),
+                "Cargo": ("cargo", False),
+                "Institución": ("institucion", False),
+                "Más recientes": ("id", True),
+            }, "Nombre, apellidos, email o institución")
+            cargo = st.selectbox("Cargo", ["Todos"] + roles_list, key="ver_contactos_cargo")
+            filtros = {"texto": texto, "cargo": None if cargo == "Todos" else cargo}
+            botones_exportacion("exportar_contactos", "contactos")
+            total = dao.count_page_contactos(**filtros)
+            if total:
+                tabla_paginada(
+                    "ver_contactos",
+                    lambda despues, limite: dao.page_contactos(orden, descendente, despues, limite, **filtros),
+                    total,
+                    [
+                        ("Nombre", lambda c: c.nombre_completo),
+                        ("Cargo", lambda c: c.cargo),
+                        ("Email", lambda c: c.email),
+                        ("Teléfono", lambda c: c.telefono or ""),
+                        ("Institución", lambda c: c.institucion or ""),
+                    ],
+                    firma=(orden, descendente, tuple(filtros.values())),
+                )
+            else:
+                st.info("No hay contactos que coincidan con la búsqueda.")
 
         elif accion_contacto == "Modificar contacto":
             st.write("### Modificar Contacto")
-            contactos = run_query("SELECT id, nombre, apellidos, cargo, email, telefono, institucion_id FROM contactos").fetchall()
+            contactos = dao.list_contactos()
             if contactos:
-                contacto_dict = {f"{c[1]} {c[2] or ''} - {c[3]} | {c[4]} | {c[5]}".strip(): c[0] for c in contactos}
+                contacto_dict = {f"{c.nombre_completo} - {c.cargo} | {c.email} | {c.telefono}": c.id for c in contactos}
                 contacto_sel = st.selectbox("Selecciona contacto", list(contacto_dict.keys()), key="mod_contacto")
                 contacto_id = contacto_dict[contacto_sel]
-                contacto_data = run_query("SELECT nombre, apellidos, cargo, email, telefono, institucion_id FROM contactos WHERE id = ?", (contacto_id,)).fetchone()
-                new_nombre = st.text_input("Nuevo nombre", value=contacto_data[0], key="edit_contacto_nombre")
-                new_apellidos = st.text_input("Nuevos apellidos", value=contacto_data[1] or "", key="edit_contacto_apellidos")
-                new_cargo = st.selectbox("Nuevo cargo", roles_list, index=roles_list.index(contacto_data[2]) if contacto_data[2] in roles_list else 0, key="edit_contacto_cargo")
-                new_email = st.text_input("Nuevo email", value=contacto_data[3], key="edit_contacto_email")
-                new_telefono = st.text_input("Nuevo teléfono", value=contacto_data[4], key="edit_contacto_tel")
+                contacto = dao.get_contacto(contacto_id)
+                new_nombre = st.text_input("Nuevo nombre", value=contacto.nombre, key="edit_contacto_nombre")
+                new_apellidos = st.text_input("Nuevos apellidos", value=contacto.apellidos or "", key="edit_contacto_apellidos")
+                new_cargo = st.selectbox("Nuevo cargo", roles_list, index=roles_list.index(contacto.cargo) if contacto.cargo in roles_list else 0, key="edit_contacto_cargo")
+                new_email = st.text_input("Nuevo email", value=contacto.email, key="edit_contacto_email")
+                new_telefono = st.text_input("Nuevo teléfono", value=contacto.telefono, key="edit_contacto_tel")
                 inst_names = list(institucion_dict.keys())
                 inst_ids = list(institucion_dict.values())
                 try:
-                    inst_index = inst_ids.index(contacto_data[5])
+                    inst_index = inst_ids.index(contacto.institucion_id)
                 except ValueError:
                     inst_index = 0
                 new_inst = st.selectbox("Nueva institución", inst_names, index=inst_index, key="edit_contacto_inst")
                 new_inst_id = institucion_dict[new_inst]
                 if st.button("Guardar cambios contacto"):
-                    run_query("UPDATE contactos SET nombre = ?, apellidos = ?, cargo = ?, email = ?, telefono = ?, institucion_id = ? WHERE id = ?",
-                              (new_nombre, new_apellidos, new_cargo, new_email, new_telefono, new_inst_id, contacto_id))
-                    st.success("Contacto modificado correctamente")
-                    st.rerun()
+                    try:
+                        dao.update_contacto(contacto_id, new_nombre, new_apellidos, new_cargo, new_email, new_telefono, new_inst_id)
+                    except sqlite3.IntegrityError:
+                        st.error("Ya existe otro contacto con ese email en la institución")
+                    else:
+                        st.success("Contacto modificado correctamente")
+                        st.rerun()
             else:
                 st.info("No hay contactos registrados.")
 
         elif accion_contacto == "Borrar contacto":
             st.write("### Borrar Contacto")
-            contactos = run_query("SELECT id, nombre, apellidos, cargo, email, telefono FROM contactos").fetchall()
+            contactos = dao.list_contactos()
             if contactos:
-                contacto_dict = {f"{c[1]} {c[2] or ''} - {c[3]} | {c[4]} | {c[5]}".strip(): c[0] for c in contactos}
+                contacto_dict = {f"{c.nombre_completo} - {c.cargo} | {c.email} | {c.telefono}": c.id for c in contactos}
                 contacto_sel = st.selectbox("Selecciona contacto", list(contacto_dict.keys()), key="del_contacto")
                 contacto_id = contacto_dict[contacto_sel]
                 if st.button("Borrar contacto"):
-                    run_query("DELETE FROM contactos WHERE id = ?", (contacto_id,))
+                    dao.delete_contacto(contacto_id)
                     st.success("Contacto eliminado correctamente")
                     st.rerun()
             else:
@@ -548,292 +626,7 @@ María,López Ruiz,Coordinador,maria.lopez@tecnologico.edu,+34987654321,Institut
             # Permitir subir CSV o Excel
             csv_file = st.file_uploader("Subir archivo CSV o Excel de contactos", type=["csv", "xlsx"])
             if csv_file is not None:
-                # Detectar tipo de archivo y leer
-                if csv_file.name.endswith(".csv"):
-                    df = pd.read_csv(csv_file)
-                elif csv_file.name.endswith(".xlsx"):
-                    df = pd.read_excel(csv_file)
-                else:
-                    st.error("Formato de archivo no soportado. Usa CSV o Excel (.xlsx)")
-                    return
-                required_cols = {"nombre", "apellidos", "cargo", "email", "telefono", "institucion"}
-                if required_cols.issubset(df.columns):
-                    # Crear mapeos con nombres normalizados
-                    inst_map_display = {nombre.strip(): iid for iid, nombre in instituciones}
-                    roles_set = set(roles_list)
-                    
-                    st.info(f"📊 **Archivo cargado:** {len(df)} filas encontradas")
-                    
-                    # Mostrar datos de referencia en columnas
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        st.write("**🏛️ Instituciones disponibles:**")
-                        for nombre in inst_map_display.keys():
-                            st.write(f"• {nombre}")
-                    
-                    with col2:
-                        st.write("**👥 Cargos/Roles disponibles:**")
-                        for role in roles_list:
-                            st.write(f"• {role}")
-                    
-                    # PASO 1: VISTA PREVIA DE LOS DATOS
-                    st.subheader("📋 Vista previa de los datos a cargar:")
-                    
-                    # Mostrar valores únicos del CSV para debugging
-                    st.write("**🔍 Valores encontrados en tu CSV:**")
-                    col_debug1, col_debug2 = st.columns(2)
-                    
-                    with col_debug1:
-                        st.write("**Instituciones en tu CSV:**")
-                        instituciones_csv = df['institucion'].unique()
-                        for inst in instituciones_csv:
-                            st.write(f"• '{inst}'")
-                    
-                    with col_debug2:
-                        st.write("**Cargos en tu CSV:**")
-                        cargos_csv = df['cargo'].unique()
-                        for cargo in cargos_csv:
-                            st.write(f"• '{cargo}'")
-                    
-                    # Análisis de coincidencias para ayudar al usuario
-                    st.markdown("---")
-                    st.write("**🔍 Análisis de coincidencias:**")
-                    
-                    # Verificar instituciones
-                    st.write("**Instituciones:**")
-                    instituciones_nuevas = []
-                    for inst_csv in instituciones_csv:
-                        encontrada = False
-                        for inst_bd in inst_map_display.keys():
-                            if inst_bd.lower().strip() == str(inst_csv).lower().strip():
-                                st.write(f"✅ '{inst_csv}' → Coincide con '{inst_bd}'")
-                                encontrada = True
-                                break
-                        if not encontrada:
-                            st.write(f"🆕 '{inst_csv}' → **Nueva institución** (se creará automáticamente)")
-                            instituciones_nuevas.append(str(inst_csv).strip())
-                    
-                    # Verificar cargos
-                    st.write("**Cargos:**")
-                    cargos_nuevos = []
-                    for cargo_csv in cargos_csv:
-                        if str(cargo_csv) in roles_set:
-                            st.write(f"✅ '{cargo_csv}' → Válido")
-                        else:
-                            st.write(f"🆕 '{cargo_csv}' → **Nuevo cargo** (se creará automáticamente)")
-                            cargos_nuevos.append(str(cargo_csv).strip())
-                    
-                    # Mostrar resumen de elementos nuevos
-                    if instituciones_nuevas or cargos_nuevos:
-                        st.info("ℹ️ **Se crearán automáticamente los siguientes elementos nuevos:**")
-                        if instituciones_nuevas:
-                            st.write(f"**Nuevas instituciones:** {', '.join(instituciones_nuevas)}")
-                        if cargos_nuevos:
-                            st.write(f"**Nuevos cargos:** {', '.join(cargos_nuevos)}")
-                    
-                    # RE-VALIDAR con creación automática
-                    st.subheader("📋 Validación final con creación automática:")
-                    validated_data_final = []
-                    
-                    for index, row in df.iterrows():
-                        row_data = {
-                            'fila': index + 1,
-                            'nombre': str(row["nombre"]).strip(),
-                            'apellidos': str(row["apellidos"]).strip(),
-                            'cargo': str(row["cargo"]).strip(),
-                            'email': str(row["email"]).strip(),
-                            'telefono': str(row["telefono"]).strip(),
-                            'institucion': str(row["institucion"]).strip(),
-                            'errores': [],
-                            'valido': True,
-                            'nueva_institucion': False,
-                            'nuevo_cargo': False
-                        }
-                        
-                        # Verificar institución (existente o nueva)
-                        institucion_id = None
-                        for inst_name, inst_id in inst_map_display.items():
-                            if inst_name.lower().strip() == row_data['institucion'].lower().strip():
-                                institucion_id = inst_id
-                                break
-                        
-                        if not institucion_id:
-                            # Marcar como nueva institución
-                            row_data['nueva_institucion'] = True
-                            row_data['institucion_id'] = 'NUEVA'
-                        else:
-                            row_data['institucion_id'] = institucion_id
-                        
-                        # Verificar cargo (existente o nuevo)
-                        if row_data['cargo'] not in roles_set:
-                            row_data['nuevo_cargo'] = True
-                        
-                        # Validaciones básicas (solo datos obligatorios)
-                        if not row_data['nombre']:
-                            row_data['errores'].append("Nombre vacío")
-                            row_data['valido'] = False
-                        
-                        if not row_data['email'] or "@" not in row_data['email']:
-                            row_data['errores'].append("Email inválido")
-                            row_data['valido'] = False
-                        
-                        validated_data_final.append(row_data)
-                    
-                    # Crear DataFrame para mostrar vista final
-                    preview_final_df = pd.DataFrame([
-                        {
-                            'Fila': d['fila'],
-                            'Nombre': d['nombre'],
-                            'Apellidos': d['apellidos'],
-                            'Cargo': f"🆕 {d['cargo']}" if d['nuevo_cargo'] else d['cargo'],
-                            'Email': d['email'],
-                            'Teléfono': d['telefono'],
-                            'Institución': f"🆕 {d['institucion']}" if d['nueva_institucion'] else d['institucion'],
-                            'Estado': '✅ Válido' if d['valido'] else f"❌ {', '.join(d['errores'])}"
-                        }
-                        for d in validated_data_final
-                    ])
-                    
-                    st.dataframe(preview_final_df, use_container_width=True)
-                    
-                    # Resumen final
-                    validos_final = sum(1 for d in validated_data_final if d['valido'])
-                    invalidos_final = len(validated_data_final) - validos_final
-                    
-                    col_res1, col_res2, col_res3 = st.columns(3)
-                    with col_res1:
-                        st.metric("📊 Total filas", len(validated_data_final))
-                    with col_res2:
-                        st.metric("✅ Filas válidas", validos_final)
-                    with col_res3:
-                        st.metric("❌ Filas con errores", invalidos_final)
-
-                    # PASO 2: BOTÓN PARA CONFIRMAR INSERCIÓN
-                    if validos_final > 0:
-                        st.markdown("---")
-                        st.subheader("💾 Confirmar inserción a la base de datos")
-                        
-                        opciones_insercion = st.radio(
-                            "¿Qué deseas hacer?",
-                            [
-                                f"Insertar las {validos_final} filas válidas (creando automáticamente elementos nuevos)",
-                                "Cancelar - No insertar nada"
-                            ]
-                        )
-                        
-                        if opciones_insercion.startswith("Insertar"):
-                            if st.button("🚀 CONFIRMAR INSERCIÓN A LA BASE DE DATOS", type="primary"):
-                                # PASO 3: INSERCIÓN REAL CON CREACIÓN AUTOMÁTICA
-                                progress_bar = st.progress(0)
-                                status_text = st.empty()
-                                
-                                success_count = 0
-                                datos_insertados = []
-                                elementos_creados = []
-                                
-                                filas_validas = [d for d in validated_data_final if d['valido']]
-                                total_steps = len(filas_validas) + len(instituciones_nuevas) + len(cargos_nuevos)
-                                current_step = 0
-                                
-                                # CREAR NUEVAS INSTITUCIONES
-                                instituciones_creadas = {}
-                                for nueva_inst in instituciones_nuevas:
-                                    current_step += 1
-                                    progress_bar.progress(current_step / total_steps)
-                                    status_text.text(f"Creando nueva institución: {nueva_inst}")
-                                    
-                                    try:
-                                        run_insert_query(
-                                            "INSERT INTO instituciones (nombre, ciudad, anio_programa) VALUES (?, ?, ?)",
-                                            (nueva_inst, "Ciudad por definir", "2024")
-                                        )
-                                        # Obtener el ID de la institución recién creada
-                                        new_inst_id = run_query("SELECT id FROM instituciones WHERE nombre = ?", (nueva_inst,)).fetchall()[0][0]
-                                        instituciones_creadas[nueva_inst] = new_inst_id
-                                        elementos_creados.append(f"✅ Institución creada: {nueva_inst}")
-                                    except Exception as e:
-                                        elementos_creados.append(f"❌ Error creando institución {nueva_inst}: {str(e)}")
-                                
-                                # CREAR NUEVOS CARGOS/ROLES
-                                for nuevo_cargo in cargos_nuevos:
-                                    current_step += 1
-                                    progress_bar.progress(current_step / total_steps)
-                                    status_text.text(f"Creando nuevo cargo: {nuevo_cargo}")
-                                    
-                                    try:
-                                        run_insert_query(
-                                            "INSERT INTO roles (nombre) VALUES (?)",
-                                            (nuevo_cargo,)
-                                        )
-                                        elementos_creados.append(f"✅ Cargo creado: {nuevo_cargo}")
-                                    except Exception as e:
-                                        elementos_creados.append(f"❌ Error creando cargo {nuevo_cargo}: {str(e)}")
-                                
-                                # INSERTAR CONTACTOS
-                                for row_data in filas_validas:
-                                    current_step += 1
-                                    progress_bar.progress(current_step / total_steps)
-                                    status_text.text(f"Insertando contacto: {row_data['nombre']} {row_data['apellidos']}")
-                                    
-                                    try:
-                                        # Determinar ID de institución
-                                        if row_data['nueva_institucion']:
-                                            final_inst_id = instituciones_creadas.get(row_data['institucion'])
-                                        else:
-                                            final_inst_id = row_data['institucion_id']
-                                        
-                                        if final_inst_id:
-                                            run_insert_query(
-                                                "INSERT INTO contactos (nombre, apellidos, cargo, email, telefono, institucion_id) VALUES (?, ?, ?, ?, ?, ?)",
-                                                (row_data['nombre'], row_data['apellidos'], row_data['cargo'], 
-                                                 row_data['email'], row_data['telefono'], final_inst_id)
-                                            )
-                                            
-                                            success_count += 1
-                                            datos_insertados.append(f"✅ Fila {row_data['fila']}: {row_data['nombre']} {row_data['apellidos']}")
-                                        else:
-                                            datos_insertados.append(f"❌ Fila {row_data['fila']}: Error con institución")
-                                            
-                                    except Exception as e:
-                                        datos_insertados.append(f"❌ Fila {row_data['fila']}: Error - {str(e)}")
-                                
-                                # Limpiar barra de progreso
-                                progress_bar.empty()
-                                status_text.empty()
-                                
-                                # Mostrar resultados finales
-                                st.success(f"🎉 **¡INSERCIÓN COMPLETADA!**")
-                                st.info(f"📊 **{success_count} contactos insertados correctamente**")
-                                
-                                # Verificar total en base de datos
-                                total_contactos = run_query("SELECT COUNT(*) FROM contactos").fetchall()[0][0]
-                                st.info(f"📈 Total de contactos en la base de datos: {total_contactos}")
-                                
-                                # Mostrar elementos creados
-                                if elementos_creados:
-                                    st.subheader("🆕 Elementos nuevos creados:")
-                                    for elemento in elementos_creados:
-                                        st.write(elemento)
-                                
-                                # Mostrar detalle de inserción
-                                st.subheader("📋 Detalle de la inserción:")
-                                detalles_text = "\n".join(datos_insertados)
-                                st.text_area("Resultados de inserción:", value=detalles_text, height=200, disabled=True)
-                    else:
-                        st.error("❌ No hay filas válidas para insertar. Corrige los errores en tu archivo CSV.")
-                        
-                else:
-                    st.error(f"❌ El CSV debe tener las columnas: {', '.join(required_cols)}")
-                    st.info("📝 **Formato correcto del CSV:**")
-                    st.code("nombre,apellidos,cargo,email,telefono,institucion")
-                    
-                    st.markdown("**Ejemplo de archivo CSV válido:**")
-                    ejemplo_csv = """nombre,apellidos,cargo,email,telefono,institucion
-Juan,Pérez García,Director,juan.perez@universidad.edu,+34123456789,Universidad Nacional
-María,López Ruiz,Coordinador,maria.lopez@tecnologico.edu,+34987654321,Instituto Tecnológico"""
-
-                    st.code(ejemplo_csv)
+                mostrar_carga_masiva(csv_file, instituciones, roles_list)
 
         elif accion_contacto == "Importar desde Gmail":
             st.write("### Importar contactos desde Gmail")
@@ -850,9 +643,9 @@ María,López Ruiz,Coordinador,maria.lopez@tecnologico.edu,+34987654321,Institut
             admin_email = user.get("email", "")
             
             # Obtener credenciales del admin desde la BD
-            admin_data = run_query("SELECT email_usuario, email_password FROM kams WHERE email = ?", (admin_email,)).fetchone()
+            admin_kam = dao.get_kam_by_email(admin_email)
             
-            if not admin_data:
+            if not admin_kam:
                 # Intentar desde users si no está en kams
                 st.warning("No se encontraron credenciales de email configuradas.")
                 st.info("""
@@ -862,7 +655,7 @@ María,López Ruiz,Coordinador,maria.lopez@tecnologico.edu,+34987654321,Institut
                 """)
                 return
             
-            email_usuario, email_password = admin_data[0], admin_data[1]
+            email_usuario, email_password = admin_kam.email_usuario, admin_kam.email_password
             
             if not email_usuario or not email_password:
                 st.warning("⚠️ **Credenciales de email no configuradas**")
@@ -880,11 +673,15 @@ María,López Ruiz,Coordinador,maria.lopez@tecnologico.edu,+34987654321,Institut
             if is_authenticated:
                 st.success(f"✅ Usando credenciales de: {email_usuario}")
                 
-                # Configuración
-                max_emails = st.slider("Número de correos a analizar", min_value=50, max_value=500, value=200, step=50,
-                                      help="Más correos = más contactos pero tarda más tiempo")
+                # Solo se leen los correos que llegaron desde la última sincronización
+                estado_gmail = dao.gmail_sync(admin_kam.id)
+                if estado_gmail:
+                    ultima = max(c.actualizado for c in estado_gmail.values())
+                    st.caption(f"Última sincronización: {ultima} UTC. Solo se analizarán los correos nuevos.")
+                else:
+                    st.caption("Primera sincronización: se analizará todo el buzón; puede tardar unos minutos.")
                 
-                if st.button("📥 Extraer contactos desde Gmail", type="primary"):
+                if st.button("📥 Sincronizar contactos desde Gmail", type="primary"):
                     progress_bar = st.progress(0)
                     status_text = st.empty()
                     
@@ -892,16 +689,17 @@ María,López Ruiz,Coordinador,maria.lopez@tecnologico.edu,+34987654321,Institut
                         status_text.text(message)
                         progress_bar.progress(progress)
                     
-                    with st.spinner(f"Analizando últimos {max_emails} correos..."):
-                        contactos_gmail, error = gmail_simple_contacts.get_contacts_from_gmail_simple(
+                    with st.spinner("Sincronizando correos..."):
+                        nuevos, error = gmail_simple_contacts.sync_gmail_contacts(
+                            admin_kam.id,
                             email_usuario, 
                             email_password, 
-                            max_emails=max_emails,
                             progress_callback=update_progress
                         )
                     
                     progress_bar.empty()
                     status_text.empty()
+                    contactos_gmail = None if error else gmail_simple_contacts.stored_contacts(admin_kam.id)
                     
                     if error:
                         st.error(f"❌ {error}")
@@ -913,7 +711,7 @@ María,López Ruiz,Coordinador,maria.lopez@tecnologico.edu,+34987654321,Institut
                         """)
                     elif contactos_gmail:
                         st.session_state['contactos_gmail'] = contactos_gmail
-                        st.success(f"✅ Se extrajeron {len(contactos_gmail)} contactos únicos")
+                        st.success(f"✅ {nuevos:,} correos nuevos analizados; {len(contactos_gmail)} contactos únicos")
                         st.rerun()
                     else:
                         st.warning("No se encontraron contactos en los correos analizados")
@@ -971,102 +769,73 @@ María,López Ruiz,Coordinador,maria.lopez@tecnologico.edu,+34987654321,Institut
                         elif "nueva institución" in opcion_institucion and not institucion_nueva_nombre:
                             st.error("Debes especificar el nombre de la nueva institución")
                         else:
-                            progress_bar = st.progress(0)
-                            status_text = st.empty()
-                            
-                            success_count = 0
-                            error_count = 0
                             skip_count = 0
+                            filas = []
                             
-                            # Crear institución nueva si es necesario
-                            if "nueva institución" in opcion_institucion:
-                                try:
-                                    run_insert_query(
-                                        "INSERT INTO instituciones (nombre, ciudad, anio_programa) VALUES (?, ?, ?)",
-                                        (institucion_nueva_nombre, "Ciudad por definir", "2024")
-                                    )
-                                    institucion_especifica_id = run_query(
-                                        "SELECT id FROM instituciones WHERE nombre = ?",
-                                        (institucion_nueva_nombre,)
-                                    ).fetchone()[0]
-                                except Exception as e:
-                                    st.error(f"Error creando institución: {e}")
-                                    institucion_especifica_id = None
-                            
-                            # Importar contactos
-                            for i, contacto in enumerate(contactos_gmail):
-                                progress_bar.progress((i + 1) / len(contactos_gmail))
-                                status_text.text(f"Importando: {contacto['nombre']} {contacto['apellidos']}")
-                                
-                                try:
-                                    # Determinar institución
-                                    if "institución específica" in opcion_institucion or "nueva institución" in opcion_institucion:
-                                        inst_id = institucion_especifica_id
-                                    else:
-                                        # Buscar o crear institución del contacto
-                                        inst_nombre = contacto['institucion']
-                                        inst_existing = run_query(
-                                            "SELECT id FROM instituciones WHERE nombre = ?",
-                                            (inst_nombre,)
-                                        ).fetchone()
-                                        
-                                        if inst_existing:
-                                            inst_id = inst_existing[0]
-                                        else:
-                                            # Crear nueva institución
-                                            run_insert_query(
-                                                "INSERT INTO instituciones (nombre, ciudad, anio_programa) VALUES (?, ?, ?)",
-                                                (inst_nombre, "Ciudad por definir", "2024")
-                                            )
-                                            inst_id = run_query(
-                                                "SELECT id FROM instituciones WHERE nombre = ?",
-                                                (inst_nombre,)
-                                            ).fetchone()[0]
-                                    
-                                    # Verificar si ya existe el contacto
-                                    existing = run_query(
-                                        "SELECT id FROM contactos WHERE email = ? AND institucion_id = ?",
-                                        (contacto['email'], inst_id)
-                                    ).fetchone()
-                                    
-                                    if existing:
-                                        skip_count += 1
-                                        continue
-                                    
-                                    # Determinar cargo
-                                    cargo = contacto['cargo'] if contacto['cargo'] and contacto['cargo'] != 'Contacto' else cargo_por_defecto
+                            # Una sola transacción (instituciones, cargos y contactos):
+                            # se guardan todos los contactos o ninguno
+                            try:
+                                with st.spinner("Guardando contactos..."), \
+                                        transaction(tables=["instituciones", "institucion_trigramas", "roles", "contactos"]):
+                                    # Crear institución nueva si es necesario
+                                    if "nueva institución" in opcion_institucion:
+                                        institucion_especifica_id = dao.create_institucion(
+                                            institucion_nueva_nombre, ciudad="Ciudad por definir", anio_programa="2024"
+                                        )
                                     
-                                    # Crear rol si no existe
-                                    if cargo not in roles_list:
-                                        try:
-                                            run_insert_query("INSERT INTO roles (nombre) VALUES (?)", (cargo,))
-                                            roles_list.append(cargo)
-                                        except:
-                                            pass
+                                    # Contactos ya registrados (email normalizado, institución): una sola
+                                    # consulta para toda la selección. Las instituciones que se creen
+                                    # durante la importación no tienen contactos previos.
+                                    if "institución específica" in opcion_institucion:
+                                        claves = [(dao.clave_email(c['email']), institucion_especifica_id) for c in contactos_gmail]
+                                    elif "nueva institución" in opcion_institucion:
+                                        claves = []
+                                    else:
+                                        claves = [(dao.clave_email(c['email']), institucion_dict[c['institucion']])
+                                                  for c in contactos_gmail if c['institucion'] in institucion_dict]
+                                    existentes = set(dao.contactos_existentes(claves))
                                     
-                                    # Insertar contacto
-                                    run_insert_query(
-                                        "INSERT INTO contactos (nombre, apellidos, cargo, email, telefono, institucion_id) VALUES (?, ?, ?, ?, ?, ?)",
-                                        (
-                                            contacto['nombre'],
-                                            contacto['apellidos'],
-                                            cargo,
-                                            contacto['email'],
-                                            contacto['telefono'],
-                                            inst_id
-                                        )
-                                    )
-                                    success_count += 1
+                                    cargos_nuevos = []
+                                    for contacto in contactos_gmail:
+                                        # Determinar institución
+                                        if "institución específica" in opcion_institucion or "nueva institución" in opcion_institucion:
+                                            inst_id = institucion_especifica_id
+                                        else:
+                                            # Buscar o crear institución del contacto
+                                            inst_nombre = contacto['institucion']
+                                            inst_id = dao.get_institucion_id_by_nombre(inst_nombre)
+                                            
+                                            if not inst_id:
+                                                # Crear nueva institución
+                                                inst_id = dao.create_institucion(inst_nombre, ciudad="Ciudad por definir", anio_programa="2024")
+                                        
+                                        # Verificar si ya existe el contacto (o se repite en la selección)
+                                        clave = (dao.clave_email(contacto['email']), inst_id)
+                                        if clave in existentes:
+                                            skip_count += 1
+                                            continue
+                                        existentes.add(clave)
+                                        
+                                        # Determinar cargo
+                                        cargo = contacto['cargo'] if contacto['cargo'] and contacto['cargo'] != 'Contacto' else cargo_por_defecto
+                                        if cargo not in roles_list and cargo not in cargos_nuevos:
+                                            cargos_nuevos.append(cargo)
+                                        
+                                        filas.append((contacto['nombre'], contacto['apellidos'], cargo,
+                                                      contacto['email'], contacto['telefono'], inst_id))
                                     
-                                except Exception as e:
-                                    error_count += 1
-                                    st.warning(f"Error con {contacto['email']}: {e}")
-                            
-                            progress_bar.empty()
-                            status_text.empty()
+                                    if cargos_nuevos:
+                                        dao.create_roles(cargos_nuevos)
+                                    if filas:
+                                        dao.create_contactos(filas)
+                            except Exception as e:
+                                st.error(f"❌ No se importó ningún contacto (se revirtió toda la importación): {e}")
+                                success_count, error_count = 0, len(filas)
+                            else:
+                                st.success(f"✅ Importación completada")
+                                success_count, error_count = len(filas), 0
                             
                             # Mostrar resumen
-                            st.success(f"✅ Importación completada")
                             col1, col2, col3 = st.columns(3)
                             with col1:
                                 st.metric("✅ Importados", success_count)
@@ -1104,27 +873,25 @@ María,López Ruiz,Coordinador,maria.lopez@tecnologico.edu,+34987654321,Institut
                 fecha = st.date_input("Fecha programada")
                 submitted = st.form_submit_button("Guardar")
                 if submitted and cuerpo:
-                    run_query("INSERT INTO mensajes (titulo, cuerpo, tipo, fecha_envio_programada) VALUES (?, ?, ?, ?)",
-                              (titulo, cuerpo, tipo, str(fecha)))
+                    dao.create_mensaje(titulo, cuerpo, tipo, str(fecha))
                     st.success("Mensaje guardado correctamente")
 
         elif accion_msg == "Ver mensajes":
             st.write("### Lista de Mensajes")
-            mensajes = run_query("SELECT titulo, tipo, fecha_envio_programada, enviado FROM mensajes").fetchall()
-            for m in mensajes:
-                status = "✅ Enviado" if m[3] else "⏳ Pendiente"
-                st.write(f"{m[0]} | {m[1]} | {m[2]} | {status}")
+            for m in dao.list_mensajes():
+                status = "✅ Enviado" if m.enviado else "⏳ Pendiente"
+                st.write(f"{m.titulo} | {m.tipo} | {m.fecha_envio_programada} | {status}")
 
         elif accion_msg == "Modificar mensaje":
             st.write("### Modificar Mensaje")
-            mensajes = run_query("SELECT id, titulo, tipo, fecha_envio_programada, cuerpo FROM mensajes").fetchall()
+            mensajes = dao.list_mensajes()
             if mensajes:
-                msg_dict = {f"{m[1]} | {m[2]} | {m[3]}": m[0] for m in mensajes}
+                msg_dict = {f"{m.titulo} | {m.tipo} | {m.fecha_envio_programada}": m.id for m in mensajes}
                 msg_sel = st.selectbox("Selecciona mensaje", list(msg_dict.keys()), key="mod_msg")
                 msg_id = msg_dict[msg_sel]
-                msg_data = run_query("SELECT titulo, cuerpo, tipo, fecha_envio_programada FROM mensajes WHERE id = ?", (msg_id,)).fetchone()
-                new_titulo = st.text_input("Nuevo título", value=msg_data[0], key="edit_msg_titulo")
-                new_cuerpo = st.text_area("Nuevo cuerpo", value=msg_data[1], key="edit_msg_cuerpo")
+                mensaje = dao.get_mensaje(msg_id)
+                new_titulo = st.text_input("Nuevo título", value=mensaje.titulo, key="edit_msg_titulo")
+                new_cuerpo = st.text_area("Nuevo cuerpo", value=mensaje.cuerpo, key="edit_msg_cuerpo")
                 tipos = [
                     "Recordatorio de agenda",
                     "Entrega de informe",
@@ -1134,14 +901,13 @@ María,López Ruiz,Coordinador,maria.lopez@tecnologico.edu,+34987654321,Institut
                     "Tendencias"
                 ]
                 try:
-                    tipo_index = tipos.index(msg_data[2])
+                    tipo_index = tipos.index(mensaje.tipo)
                 except ValueError:
                     tipo_index = 0
                 new_tipo = st.selectbox("Nuevo tipo", tipos, index=tipo_index, key="edit_msg_tipo")
-                new_fecha = st.date_input("Nueva fecha programada", value=msg_data[3], key="edit_msg_fecha")
+                new_fecha = st.date_input("Nueva fecha programada", value=mensaje.fecha_envio_programada, key="edit_msg_fecha")
                 if st.button("Guardar cambios mensaje"):
-                    run_query("UPDATE mensajes SET titulo = ?, cuerpo = ?, tipo = ?, fecha_envio_programada = ? WHERE id = ?",
-                              (new_titulo, new_cuerpo, new_tipo, str(new_fecha), msg_id))
+                    dao.update_mensaje(msg_id, new_titulo, new_cuerpo, new_tipo, str(new_fecha))
                     st.success("Mensaje modificado correctamente")
                     st.rerun()
 
@@ -1150,18 +916,22 @@ María,López Ruiz,Coordinador,maria.lopez@tecnologico.edu,+34987654321,Institut
 
         elif accion_msg == "Borrar mensaje":
             st.write("### Borrar Mensaje")
-            mensajes = run_query("SELECT id, titulo, tipo, fecha_envio_programada FROM mensajes").fetchall()
+            mensajes = dao.list_mensajes()
             if mensajes:
-                msg_dict = {f"{m[1]} | {m[2]} | {m[3]}": m[0] for m in mensajes}
+                msg_dict = {f"{m.titulo} | {m.tipo} | {m.fecha_envio_programada}": m.id for m in mensajes}
                 msg_sel = st.selectbox("Selecciona mensaje", list(msg_dict.keys()), key="del_msg")
                 msg_id = msg_dict[msg_sel]
                 if st.button("Borrar mensaje"):
-                    run_query("DELETE FROM mensajes WHERE id = ?", (msg_id,))
+                    dao.delete_mensaje(msg_id)
                     st.success("Mensaje eliminado correctamente")
                     st.rerun()
             else:
                 st.info("No hay mensajes registrados.")
 
+    # ---------------- Rendimiento ----------------
+    elif menu == "Rendimiento":
+        show_rendimiento()
+
     # Footer
     st.markdown("---")
     st.markdown(
@@ -0,0 +1,299 @@
+"""
+Vista previa y confirmación de la carga masiva de contactos.
+
+La comparten los paneles de administración y de KAM; cada panel muestra sus
+instrucciones y su plantilla, y pasa aquí el archivo subido. La lectura,
+validación y escritura están en modules/importacion.py.
+
+Cada archivo se lee y valida una sola vez: la carga queda en el área de carga
+de la BD y su resumen (Carga) en st.session_state, bajo la huella sha256 del
+contenido. Las siguientes ejecuciones de la página (elegir una opción,
+marcar una casilla) la reutilizan, y volver a subir el mismo archivo
+tampoco lo lee de nuevo; solo el botón de confirmar escribe. Cada sesión
+conserva hasta MAX_CARGAS_SESION cargas: al pasar el límite se descarta la
+menos usada y, cuando termina la sesión, todas.
+"""
+
+import sqlite3
+import weakref
+from collections import OrderedDict
+
+import streamlit as st
+
+from modules import importacion, utils as dao
+
+# Clave de st.session_state con las CargasSesion
+CLAVE_SESION = "cargas_masivas"
+
+# Cargas validadas que conserva cada sesión
+MAX_CARGAS_SESION = 3
+
+EJEMPLO_CSV = """nombre,apellidos,cargo,email,telefono,institucion
+Juan,Pérez García,Director,juan.perez@universidad.edu,+34123456789,Universidad Nacional
+María,López Ruiz,Coordinador,maria.lopez@tecnologico.edu,+34987654321,Instituto Tecnológico"""
+
+
+class CargasSesion:
+    """Cargas validadas de una sesión por (huella del archivo, instituciones), en orden LRU.
+
+    Las cargas que salen (por LRU o porque se liberó la sesión) se borran del
+    área de carga; si algo falla al borrarlas, limpiar_cargas las quita al
+    vencer.
+    """
+
+    def __init__(self, maximo=MAX_CARGAS_SESION):
+        self.maximo = maximo
+        self._cargas = OrderedDict()
+        # Streamlit libera st.session_state al terminar la sesión
+        weakref.finalize(self, _descartar_todas, self._cargas)
+
+    def obtener(self, clave):
+        """Carga guardada bajo `clave` si sigue en el área de carga, o None"""
+        carga = self._cargas.get(clave)
+        if carga is None:
+            return None
+        if not carga.faltantes and not importacion.carga_disponible(carga.id):
+            del self._cargas[clave]
+            return None
+        self._cargas.move_to_end(clave)
+        return carga
+
+    def guardar(self, clave, carga):
+        self._cargas[clave] = carga
+        self._cargas.move_to_end(clave)
+        while len(self._cargas) > self.maximo:
+            _, vieja = self._cargas.popitem(last=False)
+            importacion.descartar(vieja.id)
+
+    def quitar(self, clave):
+        """Olvida una carga que ya se escribió"""
+        self._cargas.pop(clave, None)
+
+
+def _descartar_todas(cargas):
+    for carga in list(cargas.values()):
+        try:
+            importacion.descartar(carga.id)
+        except sqlite3.Error:
+            pass
+    cargas.clear()
+
+
+def _obtener_carga(archivo, instituciones):
+    """(clave, Carga) del archivo: la de la sesión si ya se validó, o una nueva"""
+    cargas = st.session_state.get(CLAVE_SESION)
+    if cargas is None:
+        cargas = st.session_state[CLAVE_SESION] = CargasSesion()
+    clave = (importacion.huella(archivo), hash(tuple((inst.id, inst.nombre) for inst in instituciones)))
+    carga = cargas.obtener(clave)
+    if carga is None:
+        carga = importacion.cargar(importacion.leer_bloques(archivo), instituciones, archivo=archivo.name)
+        cargas.guardar(clave, carga)
+    return clave, carga
+
+
+def mostrar_carga_masiva(archivo, instituciones, roles_list):
+    """Valida `archivo` (st.file_uploader), muestra la vista previa y, al confirmar, lo inserta.
+
+    `instituciones` son las instituciones contra las que se resuelven los
+    nombres del archivo (las demás se crean) y `roles_list` los cargos
+    existentes. Se insertan las filas nuevas y se omiten las repetidas dentro
+    del archivo; los contactos que ya existen (mismo email e institución) y
+    traen cambios se actualizan solo si el usuario lo elige.
+    """
+    if not importacion.formato_soportado(archivo.name):
+        st.error("Formato de archivo no soportado. Usa CSV o Excel (.xlsx)")
+        return
+
+    # Validación en SQL de todo el archivo, guardado por bloques en el área de carga
+    clave, validacion = _obtener_carga(archivo, instituciones)
+    if validacion.faltantes:
+        st.error(f"❌ El CSV debe tener las columnas: {', '.join(importacion.COLUMNAS)}")
+        st.info("📝 **Formato correcto del CSV:**")
+        st.code("nombre,apellidos,cargo,email,telefono,institucion")
+
+        st.markdown("**Ejemplo de archivo CSV válido:**")
+        st.code(EJEMPLO_CSV)
+        return
+
+    instituciones_nuevas = validacion.instituciones_nuevas
+    cargos_nuevos = validacion.cargos_nuevos
+    roles_set = set(roles_list)
+
+    st.info(f"📊 **Archivo cargado:** {validacion.total} filas encontradas")
+
+    # Mostrar datos de referencia en columnas
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.write("**🏛️ Instituciones disponibles:**")
+        for inst in instituciones:
+            st.write(f"• {inst.nombre.strip()}")
+
+    with col2:
+        st.write("**👥 Cargos/Roles disponibles:**")
+        for role in roles_list:
+            st.write(f"• {role}")
+
+    # PASO 1: VISTA PREVIA DE LOS DATOS
+    st.subheader("📋 Vista previa de los datos a cargar:")
+
+    # Mostrar valores únicos del CSV para debugging
+    st.write("**🔍 Valores encontrados en tu CSV:**")
+    col_debug1, col_debug2 = st.columns(2)
+
+    with col_debug1:
+        st.write("**Instituciones en tu CSV:**")
+        for inst_csv, _ in validacion.coincidencias:
+            st.write(f"• '{inst_csv}'")
+
+    with col_debug2:
+        st.write("**Cargos en tu CSV:**")
+        cargos_csv = validacion.cargos
+        for cargo in cargos_csv:
+            st.write(f"• '{cargo}'")
+
+    # Análisis de coincidencias para ayudar al usuario
+    st.markdown("---")
+    st.write("**🔍 Análisis de coincidencias:**")
+
+    # Verificar instituciones
+    st.write("**Instituciones:**")
+    for inst_csv, inst_bd in validacion.coincidencias:
+        if inst_bd:
+            st.write(f"✅ '{inst_csv}' → Coincide con '{inst_bd}'")
+        elif inst_csv in validacion.sugerencias:
+            parecida, parecido = validacion.sugerencias[inst_csv]
+            st.write(f"🆕 '{inst_csv}' → **Nueva institución** (se creará automáticamente). "
+                     f"⚠️ ¿Es '{parecida.nombre.strip()}'? ({parecido:.0%} de parecido): "
+                     "si es la misma, corrige el nombre en el archivo")
+        else:
+            st.write(f"🆕 '{inst_csv}' → **Nueva institución** (se creará automáticamente)")
+
+    # Verificar cargos
+    st.write("**Cargos:**")
+    for cargo_csv in cargos_csv:
+        if cargo_csv in roles_set:
+            st.write(f"✅ '{cargo_csv}' → Válido")
+        else:
+            st.write(f"🆕 '{cargo_csv}' → **Nuevo cargo** (se creará automáticamente)")
+
+    # Mostrar resumen de elementos nuevos
+    if instituciones_nuevas or cargos_nuevos:
+        st.info("ℹ️ **Se crearán automáticamente los siguientes elementos nuevos:**")
+        if instituciones_nuevas:
+            st.write(f"**Nuevas instituciones:** {', '.join(instituciones_nuevas)}")
+        if cargos_nuevos:
+            st.write(f"**Nuevos cargos:** {', '.join(cargos_nuevos)}")
+
+    # Validación final con creación automática
+    st.subheader("📋 Validación final con creación automática:")
+    st.dataframe(importacion.vista_previa(validacion.muestra), use_container_width=True)
+    if validacion.total > validacion.max_vista:
+        st.caption(f"Se muestran las primeras {validacion.max_vista} de {validacion.total} filas.")
+    if validacion.invalidos:
+        st.write("**❌ Filas con errores:**")
+        st.dataframe(importacion.vista_previa(validacion.muestra_errores), use_container_width=True)
+
+    # Resumen final
+    nuevos_final = validacion.nuevos
+    cambiados_final = validacion.cambiados
+
+    col_res1, col_res2, col_res3 = st.columns(3)
+    with col_res1:
+        st.metric("📊 Total filas", validacion.total)
+    with col_res2:
+        st.metric("✅ Filas válidas", validacion.validos)
+    with col_res3:
+        st.metric("❌ Filas con errores", validacion.invalidos)
+
+    col_dup1, col_dup2, col_dup3, col_dup4 = st.columns(4)
+    with col_dup1:
+        st.metric("🆕 Contactos nuevos", nuevos_final)
+    with col_dup2:
+        st.metric("⏭️ Ya existen, sin cambios", validacion.existentes)
+    with col_dup3:
+        st.metric("✏️ Ya existen, con cambios", cambiados_final)
+    with col_dup4:
+        st.metric("🔁 Repetidos en el archivo", validacion.duplicados)
+
+    if validacion.validos == 0:
+        st.error("❌ No hay filas válidas para insertar. Corrige los errores en tu archivo CSV.")
+        return
+
+    actualizar = False
+    if cambiados_final:
+        st.write("**✏️ Cambios en contactos existentes:**")
+        st.write(", ".join(f"{campo}: {n}" for campo, n in validacion.cambios_por_campo.items()))
+        st.dataframe(validacion.muestra_cambios, use_container_width=True, hide_index=True)
+        actualizar = st.checkbox(
+            f"Actualizar los {cambiados_final} contactos existentes con los datos del archivo "
+            "(las celdas vacías no borran datos)"
+        )
+
+    if nuevos_final == 0 and not actualizar:
+        st.info("ℹ️ Todos los contactos válidos del archivo ya existen en la base de datos. No hay nada que insertar.")
+        return
+
+    # PASO 2: BOTÓN PARA CONFIRMAR INSERCIÓN
+    st.markdown("---")
+    st.subheader("💾 Confirmar inserción a la base de datos")
+
+    opciones_insercion = st.radio(
+        "¿Qué deseas hacer?",
+        [
+            f"Insertar los {nuevos_final} contactos nuevos"
+            + (f" y actualizar {cambiados_final} existentes" if actualizar else "")
+            + " (creando automáticamente elementos nuevos)",
+            "Cancelar - No insertar nada"
+        ]
+    )
+
+    if not opciones_insercion.startswith("Insertar"):
+        return
+    if not st.button("🚀 CONFIRMAR INSERCIÓN A LA BASE DE DATOS", type="primary"):
+        return
+
+    # PASO 3: INSERCIÓN EN UNA SOLA TRANSACCIÓN (todo o nada)
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+
+    def _avance(hechos, total, mensaje):
+        progress_bar.progress(hechos / total if total else 1.0)
+        status_text.text(mensaje)
+
+    try:
+        resultado = importacion.escribir(validacion, actualizar=actualizar, progreso=_avance)
+    except Exception as e:
+        st.error(f"❌ No se insertó ningún contacto (se revirtió toda la carga): {e}")
+        return
+    finally:
+        # Limpiar barra de progreso
+        progress_bar.empty()
+        status_text.empty()
+
+    # La carga ya se escribió y se borró del área de carga
+    st.session_state[CLAVE_SESION].quitar(clave)
+
+    # Mostrar resultados finales
+    st.success("🎉 **¡INSERCIÓN COMPLETADA!**")
+    st.info(f"📊 **{resultado['insertados']} contactos insertados correctamente**")
+    if resultado['actualizados']:
+        st.info(f"✏️ **{resultado['actualizados']} contactos actualizados** ("
+                + ", ".join(f"{campo}: {n}" for campo, n in resultado['cambios_por_campo'].items()) + ")")
+    if resultado['existentes']:
+        st.warning(f"⚠️ {resultado['existentes']} contactos ya existían (mismo email e institución) y no se modificaron")
+    if resultado['duplicados']:
+        st.warning(f"⚠️ {resultado['duplicados']} filas repetían un contacto anterior del archivo y se omitieron")
+
+    # Verificar total en base de datos
+    total_contactos = dao.count_contactos()
+    st.info(f"📈 Total de contactos en la base de datos: {total_contactos}")
+
+    # Mostrar elementos creados
+    elementos_creados = [f"✅ Institución creada: {i}" for i in resultado['instituciones_creadas']]
+    elementos_creados += [f"✅ Cargo creado: {c}" for c in resultado['cargos_creados']]
+    if elementos_creados:
+        st.subheader("🆕 Elementos nuevos creados:")
+        for elemento in elementos_creados:
+            st.write(elemento)
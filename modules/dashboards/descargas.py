@@ -0,0 +1,37 @@
+"""
+Botones de descarga de las exportaciones (modules/exportacion.py).
+
+El archivo se genera recién cuando se pulsa el botón (st.download_button con
+una función en lugar de los datos, desde Streamlit 1.52), así que mostrar el
+listado no cuesta una exportación en cada rerun. Streamlit guarda el archivo
+generado en memoria hasta que se descarga.
+"""
+
+import functools
+
+import streamlit as st
+
+from modules import exportacion
+
+# formato -> etiqueta del botón
+ETIQUETAS = {
+    "xlsx": "Excel (.xlsx)",
+    "csv.gz": "CSV comprimido (.csv.gz)",
+}
+
+
+def botones_exportacion(key, tipo, kam_id=None):
+    """Un botón por formato para descargar todos los "contactos" o "instituciones".
+
+    Con kam_id solo se exportan las instituciones asignadas al KAM y sus contactos.
+    """
+    columnas = st.columns(len(ETIQUETAS))
+    for columna, (formato, etiqueta) in zip(columnas, ETIQUETAS.items()):
+        columna.download_button(
+            f"📥 Exportar {tipo} a {etiqueta}",
+            data=functools.partial(exportacion.archivo_exportacion, tipo, formato, kam_id),
+            file_name=f"{tipo}.{formato}",
+            mime=exportacion.FORMATOS[formato],
+            key=f"{key}_{formato}",
+            on_click="ignore",
+        )
@@ -0,0 +1,71 @@
+"""
+Listados paginados para los paneles.
+
+Cada página se pide a la base de datos con paginación por clave (ver
+modules/utils.py) y se muestra en un único st.dataframe, de modo que solo
+viajan al navegador las filas visibles. Los cursores de las páginas visitadas
+se guardan en st.session_state para poder volver atrás; se reinician cuando
+cambian los filtros o el orden.
+"""
+
+import math
+
+import pandas as pd
+import streamlit as st
+
+from modules import utils as dao
+
+
+def controles_listado(key, ordenes, ayuda_busqueda):
+    """Campo de búsqueda y selector de orden; devuelve (texto, orden, descendente).
+
+    `ordenes` es un dict {etiqueta: (orden, descendente)}.
+    """
+    col_busqueda, col_orden = st.columns([3, 1])
+    texto = col_busqueda.text_input("Buscar", key=f"{key}_texto", placeholder=ayuda_busqueda)
+    etiqueta = col_orden.selectbox("Ordenar por", list(ordenes), key=f"{key}_orden")
+    orden, descendente = ordenes[etiqueta]
+    return texto, orden, descendente
+
+
+def _estado(key, firma):
+    estado = st.session_state.get(key)
+    if estado is None or estado["firma"] != firma:
+        estado = {"firma": firma, "cursores": [None], "pagina": 0}
+        st.session_state[key] = estado
+    return estado
+
+
+def _anterior(key):
+    estado = st.session_state[key]
+    estado["pagina"] = max(0, estado["pagina"] - 1)
+
+
+def _siguiente(key, cursor):
+    estado = st.session_state[key]
+    del estado["cursores"][estado["pagina"] + 1:]
+    estado["cursores"].append(cursor)
+    estado["pagina"] += 1
+
+
+def tabla_paginada(key, cargar_pagina, total, columnas, firma=(), page_size=dao.PAGE_SIZE):
+    """Muestra una página en un st.dataframe con botones Anterior/Siguiente.
+
+    cargar_pagina(despues, limite) devuelve (filas, cursor siguiente o None),
+    como dao.page_contactos. `columnas` es una lista de (título, función que
+    recibe la fila y devuelve el valor). `firma` identifica filtros y orden.
+    """
+    estado = _estado(key, firma)
+    filas, siguiente = cargar_pagina(estado["cursores"][estado["pagina"]], page_size)
+
+    df = pd.DataFrame([[valor(f) for _, valor in columnas] for f in filas],
+                      columns=[titulo for titulo, _ in columnas])
+    st.dataframe(df, use_container_width=True, hide_index=True)
+
+    paginas = max(1, math.ceil(total / page_size))
+    col_prev, col_info, col_next = st.columns([1, 3, 1])
+    col_prev.button("← Anterior", key=f"{key}_prev", disabled=estado["pagina"] == 0,
+                    on_click=_anterior, args=(key,))
+    col_info.caption(f"Página {estado['pagina'] + 1} de {paginas} · {total:,} registros")
+    col_next.button("Siguiente →", key=f"{key}_next", disabled=siguiente is None,
+                    on_click=_siguiente, args=(key, siguiente))
@@ -0,0 +1,40 @@
+"""
+Selector de institución con búsqueda aproximada para los formularios.
+
+Con muchas instituciones el selectbox completo es difícil de recorrer: el
+campo de búsqueda reduce las opciones a las más parecidas al texto escrito,
+sin importar tildes, mayúsculas ni abreviaturas ("UE San Jose" encuentra
+"Unidad Educativa San José"). La búsqueda usa el índice de trigramas de
+modules/utils.py, así que no recorre la tabla completa.
+"""
+
+import streamlit as st
+
+from modules import utils as dao
+
+# Opciones que se muestran al buscar y parecido mínimo para listarlas; es más
+# bajo que el de la importación porque aquí el texto suele ser un fragmento.
+MAX_OPCIONES = 15
+UMBRAL_BUSQUEDA = 0.2
+
+
+def selector_institucion(instituciones, key, etiqueta="Institución", solo_estas=False):
+    """Campo de búsqueda y selectbox de instituciones; devuelve el id elegido o None.
+
+    Con `solo_estas` la búsqueda se limita a `instituciones` (p. ej. las
+    asignadas a un KAM); si no, busca en todas.
+    """
+    if not instituciones:
+        return None
+    texto = st.text_input(f"Buscar {etiqueta.lower()}", key=f"{key}_buscar",
+                          placeholder="Nombre, sin importar tildes ni abreviaturas")
+    opciones = instituciones
+    if texto.strip():
+        ids = [i.id for i in instituciones] if solo_estas else None
+        encontradas = dao.buscar_instituciones(texto, limite=MAX_OPCIONES, ids=ids, umbral=UMBRAL_BUSQUEDA)
+        if encontradas:
+            opciones = [inst for inst, _ in encontradas]
+        else:
+            st.caption("Sin coincidencias; se muestran todas las instituciones.")
+    por_id = {i.id: i.nombre for i in opciones}
+    return st.selectbox(etiqueta, list(por_id), format_func=por_id.get, key=key)
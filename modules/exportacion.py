@@ -0,0 +1,181 @@
+"""
+Exportación de contactos e instituciones a Excel (.xlsx) o CSV comprimido (.csv.gz).
+
+Las filas salen de un cursor por bloques (utils.db.iter_rows) y se escriben
+en el destino a medida que llegan, sin armar un DataFrame: el Excel se
+escribe con xlsxwriter en modo constant_memory (cada fila se vuelca a disco
+al pasar a la siguiente) y el CSV pasa por gzip en streaming. Generar el
+archivo no ocupa más memoria con más filas; la descarga desde la app sí la
+ocupa (ver archivo_exportacion), por eso scripts/exportar_contactos.py
+escribe directamente a disco.
+
+En el CSV los textos que empiezan con =, +, -, @, tabulador o retorno de
+carro llevan delante un apóstrofo para que Excel no los tome como fórmulas.
+
+Los contactos se leen en el orden del índice idx_contactos_institucion
+(institución y luego id), así que la consulta no ordena en memoria y la
+primera fila está disponible enseguida. Con kam_id solo se exportan las
+instituciones asignadas al KAM y sus contactos.
+"""
+
+import csv
+import gzip
+import io
+import tempfile
+
+import xlsxwriter
+
+from utils.db import iter_rows
+
+# Filas por bloque leídas del cursor
+TAMANO_BLOQUE = 5000
+
+# Filas de datos por hoja de Excel (el máximo es 1.048.576 contando el encabezado);
+# las que sobran siguen en otra hoja
+MAX_FILAS_HOJA = 1048575
+
+# Compresión del CSV: casi el mismo tamaño que el nivel 9 y bastante más rápido
+NIVEL_GZIP = 6
+
+# extensión -> tipo MIME de la descarga
+FORMATOS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv.gz": "application/gzip",
+}
+
+# Primeros caracteres con los que una hoja de cálculo interpreta una celda como fórmula
+_INICIO_FORMULA = ("=", "+", "-", "@", "\t", "\r")
+
+_FILTRO_KAM = "WHERE {} IN (SELECT institucion_id FROM kam_institucion WHERE kam_id = ?)"
+
+COLUMNAS_CONTACTOS = ["Institución", "Ciudad", "Nombre", "Apellidos", "Cargo", "Email", "Teléfono"]
+SQL_EXPORTAR_CONTACTOS = """
+    SELECT i.nombre, i.ciudad, c.nombre, c.apellidos, c.cargo, c.email, c.telefono
+    FROM contactos c
+    LEFT JOIN instituciones i ON i.id = c.institucion_id
+    {filtro}
+    ORDER BY c.institucion_id, c.id
+"""
+
+COLUMNAS_INSTITUCIONES = ["Nombre", "Dirección", "Ciudad", "Provincia", "País",
+                          "Año del programa", "Tipo de programa", "Plan"]
+SQL_EXPORTAR_INSTITUCIONES = """
+    SELECT i.nombre, i.direccion, i.ciudad, i.provincia, i.pais, i.anio_programa, i.tipo_programa, i.plan
+    FROM instituciones i
+    {filtro}
+    ORDER BY i.id
+"""
+
+# tipo -> (columnas, consulta, nombre de la hoja, columna del id de institución)
+EXPORTACIONES = {
+    "contactos": (COLUMNAS_CONTACTOS, SQL_EXPORTAR_CONTACTOS, "Contactos", "c.institucion_id"),
+    "instituciones": (COLUMNAS_INSTITUCIONES, SQL_EXPORTAR_INSTITUCIONES, "Instituciones", "i.id"),
+}
+
+
+def formato_de(nombre_archivo):
+    """Formato de exportación según la extensión del archivo (o None)"""
+    for formato in FORMATOS:
+        if nombre_archivo.lower().endswith("." + formato):
+            return formato
+    return None
+
+
+def _bloques(tipo, kam_id=None):
+    _, sql, _, columna = EXPORTACIONES[tipo]
+    if kam_id is None:
+        return iter_rows(sql.format(filtro=""), size=TAMANO_BLOQUE)
+    return iter_rows(sql.format(filtro=_FILTRO_KAM.format(columna)), (kam_id,), size=TAMANO_BLOQUE)
+
+
+def escribir_xlsx(destino, columnas, bloques, hoja="Datos", progreso=None):
+    """Escribe las filas en un .xlsx con xlsxwriter (constant_memory); devuelve cuántas.
+
+    `destino` es una ruta o un archivo binario abierto. Los textos se
+    escriben tal cual: sin convertirlos en números, enlaces ni fórmulas.
+    """
+    libro = xlsxwriter.Workbook(destino, {
+        "constant_memory": True,
+        "strings_to_numbers": False,
+        "strings_to_urls": False,
+        "strings_to_formulas": False,
+    })
+    encabezado = libro.add_format({"bold": True})
+    total = 0
+    hoja_actual, fila = None, MAX_FILAS_HOJA
+    try:
+        for filas in bloques:
+            for valores in filas:
+                if fila == MAX_FILAS_HOJA:
+                    numero = len(libro.worksheets()) + 1
+                    hoja_actual = libro.add_worksheet(hoja if numero == 1 else f"{hoja} {numero}")
+                    hoja_actual.write_row(0, 0, columnas, encabezado)
+                    hoja_actual.freeze_panes(1, 0)
+                    hoja_actual.set_column(0, len(columnas) - 1, 20)
+                    fila = 0
+                fila += 1
+                hoja_actual.write_row(fila, 0, valores)
+            total += len(filas)
+            if progreso:
+                progreso(total)
+        if hoja_actual is None:
+            libro.add_worksheet(hoja).write_row(0, 0, columnas, encabezado)
+    finally:
+        libro.close()
+    return total
+
+
+def _celda_csv(valor):
+    """Valor con un apóstrofo delante si una hoja de cálculo lo leería como fórmula"""
+    if isinstance(valor, str) and valor.startswith(_INICIO_FORMULA):
+        return "'" + valor
+    return valor
+
+
+def escribir_csv_gz(destino, columnas, bloques, progreso=None):
+    """Escribe las filas como CSV UTF-8 comprimido con gzip; devuelve cuántas.
+
+    `destino` es una ruta o un archivo binario abierto. Los textos que una
+    hoja de cálculo tomaría como fórmula se escriben con un apóstrofo delante.
+    """
+    total = 0
+    with gzip.open(destino, "wb", compresslevel=NIVEL_GZIP) as comprimido:
+        texto = io.TextIOWrapper(comprimido, encoding="utf-8-sig", newline="")
+        escritor = csv.writer(texto)
+        escritor.writerow(columnas)
+        for filas in bloques:
+            escritor.writerows([_celda_csv(v) for v in fila] for fila in filas)
+            total += len(filas)
+            if progreso:
+                progreso(total)
+        texto.flush()
+        texto.detach()
+    return total
+
+
+def exportar(tipo, destino, formato="xlsx", kam_id=None, progreso=None):
+    """Exporta "contactos" o "instituciones" a `destino`; devuelve cuántas filas.
+
+    `formato` es una clave de FORMATOS y `progreso(filas)` se llama después
+    de cada bloque.
+    """
+    columnas, _, hoja, _ = EXPORTACIONES[tipo]
+    if formato == "xlsx":
+        return escribir_xlsx(destino, columnas, _bloques(tipo, kam_id), hoja=hoja, progreso=progreso)
+    if formato == "csv.gz":
+        return escribir_csv_gz(destino, columnas, _bloques(tipo, kam_id), progreso=progreso)
+    raise ValueError(f"Formato de exportación no soportado: {formato}")
+
+
+def archivo_exportacion(tipo, formato="xlsx", kam_id=None):
+    """Exporta a un archivo temporal en disco y devuelve su contenido (bytes).
+
+    Es la función que recibe st.download_button: se ejecuta al pulsar el
+    botón, dentro de ese rerun. El archivo temporal se cierra (y se borra)
+    antes de devolver; Streamlit guarda los bytes en memoria para servirlos.
+    Para exportaciones muy grandes está scripts/exportar_contactos.py.
+    """
+    with tempfile.TemporaryFile() as archivo:
+        exportar(tipo, archivo, formato=formato, kam_id=kam_id)
+        archivo.seek(0)
+        return archivo.read()
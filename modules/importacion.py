@@ -0,0 +1,614 @@
+"""
+Carga masiva de contactos desde CSV/Excel.
+
+Es el único camino de importación: lo usan los paneles de administración y de
+KAM (modules/dashboards/carga_masiva.py) y el script
+scripts/importar_contactos.py. Las etapas son leer_bloques (lectura y
+encabezados), cargar (guarda el archivo en el área de carga y lo valida) y
+escribir (creación de instituciones y cargos e inserción).
+
+Los encabezados se reconocen con un mapa de variantes que se compila una vez
+al importar el módulo ("Email institucional", "Teléfono celular, número
+compatible con WhatsApp", "Directivo", ...); el mapa de cada combinación de
+encabezados se guarda en caché, de modo que los bloques siguientes solo
+copian columnas.
+
+El archivo se lee por bloques de texto (leer_bloques): CSV con
+pd.read_csv(chunksize=...) y Excel con openpyxl en modo read_only, siempre
+con dtype str para que los teléfonos no se conviertan en números.
+
+Área de carga: cada bloque se guarda en la tabla carga_filas bajo el id de
+la carga y se descarta, así que la memoria no crece con el tamaño del
+archivo. La validación es SQL: al guardar cada fila, el mismo INSERT
+resuelve su institución contra carga_instituciones por nombre normalizado
+("U.E. San José" = "Unidad Educativa San Jose", ver
+dao.normalizar_institucion), marca el cargo nuevo y los errores (nombre
+vacío, email mal formado); después unas pocas sentencias sobre toda la
+carga (clasificar) marcan las filas repetidas dentro del archivo (se
+conserva la primera de cada email normalizado e institución, con
+ROW_NUMBER) y los contactos que ya existen (UPDATE ... FROM contactos sobre
+el índice único idx_contactos_clave). De los existentes se comparan los
+CAMPOS_ACTUALIZABLES (las celdas vacías no cuentan como cambio). La vista
+previa lee contadores y muestras acotadas de la carga, que sigue disponible
+entre ejecuciones de la página sin volver a leer el archivo.
+
+La escritura (escribir) crea instituciones, cargos y contactos dentro de una
+única transacción: los contactos se copian con un solo INSERT ... SELECT
+desde carga_filas (con actualizar=True, con ON CONFLICT DO UPDATE sobre la
+clave única para las filas con cambios). Si algo falla no se guarda nada.
+Las cargas que no se confirman se borran pasadas HORAS_CARGA horas.
+"""
+
+import functools
+import hashlib
+import json
+import re
+import unicodedata
+
+import openpyxl
+import pandas as pd
+
+from modules import utils as dao
+from utils.db import fetch_all, fetch_one, run_many, run_query, transaction
+
+# Columnas que debe tener el archivo (después de normalizar encabezados)
+COLUMNAS = ["nombre", "apellidos", "cargo", "email", "telefono", "institucion"]
+
+# Extensiones que se pueden leer
+FORMATOS = (".csv", ".xlsx")
+
+# Filas por bloque al leer; es también el tamaño de cada executemany en carga_filas
+# y de cada tramo que escribir copia a contactos
+TAMANO_BLOQUE = 5000
+
+# Filas que se guardan para la vista previa (y filas con errores aparte)
+MAX_VISTA_PREVIA = 1000
+
+# Encabezados aceptados para cada columna, en orden de prioridad: si el archivo
+# trae varios (p. ej. "Cargo" y "Directivo") se usa el primero no vacío
+VARIANTES = {
+    "nombre": ["nombre", "name"],
+    "apellidos": ["apellidos", "apellido", "surname"],
+    "cargo": ["cargo", "directivo", "puesto", "rol", "position"],
+    "email": ["email", "email institucional"],
+    "telefono": ["telefono", "telefono celular", "telefono celular, numero compatible con whatsapp"],
+    "institucion": ["institucion", "institucion nombre"],
+}
+
+_NO_ALFANUMERICO = re.compile(r"[^a-z0-9]")
+
+
+# -------------------------------
+# Encabezados
+# -------------------------------
+
+def normalizar_encabezado(texto):
+    """Minúsculas, sin acentos y solo letras y números: 'Teléfono celular' -> 'telefonocelular'"""
+    texto = unicodedata.normalize("NFKD", str(texto or "").lower().strip())
+    return _NO_ALFANUMERICO.sub("", "".join(c for c in texto if not unicodedata.combining(c)))
+
+
+# Encabezado normalizado -> (columna, prioridad)
+_ENCABEZADOS = {
+    normalizar_encabezado(variante): (columna, prioridad)
+    for columna, variantes in VARIANTES.items()
+    for prioridad, variante in enumerate(variantes)
+}
+
+
+@functools.lru_cache(maxsize=64)
+def mapa_encabezados(encabezados):
+    """Para una tupla de encabezados devuelve ((columna, (encabezados...)), ...).
+
+    Los encabezados de cada columna van en orden de prioridad y, a igual
+    prioridad, en el orden del archivo.
+    """
+    candidatos = {}
+    for posicion, encabezado in enumerate(encabezados):
+        columna, prioridad = _ENCABEZADOS.get(normalizar_encabezado(encabezado), (None, None))
+        if columna:
+            candidatos.setdefault(columna, []).append((prioridad, posicion, encabezado))
+    return tuple((columna, tuple(e for _, _, e in sorted(candidatos[columna])))
+                 for columna in COLUMNAS if columna in candidatos)
+
+
+def canonicalizar(df):
+    """Añade al bloque las COLUMNAS a partir de las variantes de encabezado que tenga"""
+    for columna, originales in mapa_encabezados(tuple(df.columns)):
+        if originales == (columna,):
+            continue
+        if len(originales) == 1:
+            df[columna] = df[originales[0]]
+        else:
+            # Las celdas vacías llegan como "": se toma la primera no vacía
+            df[columna] = df[list(originales)].replace("", pd.NA).bfill(axis=1).iloc[:, 0].fillna("")
+    return df
+
+
+# -------------------------------
+# Lectura
+# -------------------------------
+
+def formato_soportado(nombre):
+    return nombre.lower().endswith(FORMATOS)
+
+
+def huella(archivo, tamano=1 << 20):
+    """sha256 (hex) del contenido de un objeto tipo archivo, leído por partes"""
+    resumen = hashlib.sha256()
+    archivo.seek(0)
+    for parte in iter(lambda: archivo.read(tamano), b""):
+        resumen.update(parte)
+    archivo.seek(0)
+    return resumen.hexdigest()
+
+
+def leer_bloques(archivo, nombre=None, tamano=TAMANO_BLOQUE):
+    """Genera DataFrames de hasta `tamano` filas con todas las celdas como texto.
+
+    `archivo` es una ruta o un objeto tipo archivo (st.file_uploader); se
+    vuelve al inicio en cada llamada para poder recorrerlo más de una vez.
+    El índice continúa de un bloque al siguiente (fila 0 = primera de datos)
+    y cada bloque pasa por canonicalizar.
+    """
+    nombre = (nombre or getattr(archivo, "name", None) or str(archivo)).lower()
+    if hasattr(archivo, "seek"):
+        archivo.seek(0)
+    if nombre.endswith(".csv"):
+        with pd.read_csv(archivo, dtype=str, keep_default_na=False, na_filter=False,
+                         encoding="utf-8-sig", chunksize=tamano) as lector:
+            for bloque in lector:
+                yield canonicalizar(bloque)
+    elif nombre.endswith(".xlsx"):
+        for bloque in _bloques_xlsx(archivo, tamano):
+            yield canonicalizar(bloque)
+    else:
+        raise ValueError("Formato de archivo no soportado. Usa CSV o Excel (.xlsx)")
+
+
+def _celda(valor):
+    """Texto de una celda de Excel (los enteros guardados como float pierden el .0)"""
+    if valor is None:
+        return ""
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+def _encabezados(fila):
+    """Nombres de columna como los de pandas: vacíos -> 'Unnamed: i', repetidos -> 'x.1'"""
+    columnas, vistos = [], {}
+    for i, valor in enumerate(fila):
+        nombre = _celda(valor).strip() or f"Unnamed: {i}"
+        if nombre in vistos:
+            vistos[nombre] += 1
+            nombre = f"{nombre}.{vistos[nombre]}"
+        else:
+            vistos[nombre] = 0
+        columnas.append(nombre)
+    return columnas
+
+
+def _bloques_xlsx(archivo, tamano):
+    libro = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        encabezado = next(filas, None)
+        if encabezado is None:
+            return
+        columnas = _encabezados(encabezado)
+        ancho = len(columnas)
+        bloque, inicio = [], 0
+        for fila in filas:
+            if all(v is None for v in fila):
+                continue
+            valores = [_celda(v) for v in fila[:ancho]]
+            valores += [""] * (ancho - len(valores))
+            bloque.append(valores)
+            if len(bloque) >= tamano:
+                yield pd.DataFrame(bloque, columns=columnas, index=range(inicio, inicio + len(bloque)))
+                inicio += len(bloque)
+                bloque = []
+        if bloque or inicio == 0:
+            yield pd.DataFrame(bloque, columns=columnas, index=range(inicio, inicio + len(bloque)))
+    finally:
+        libro.close()
+
+
+# -------------------------------
+# Área de carga
+# -------------------------------
+
+# Estado de cada fila válida
+NUEVO, EXISTENTE, CAMBIADO, DUPLICADO = "nuevo", "existente", "cambiado", "duplicado"
+
+# Campos de un contacto existente que una nueva carga puede actualizar
+CAMPOS_ACTUALIZABLES = ("nombre", "apellidos", "cargo", "telefono")
+
+# Horas que se conserva una carga sin confirmar
+HORAS_CARGA = 24
+
+SQL_INSERT_CARGA = "INSERT INTO cargas (archivo) VALUES (?)"
+SQL_CARGA_EXISTE = "SELECT 1 FROM cargas WHERE id = ?"
+SQL_INSERT_CARGA_INSTITUCION = "INSERT OR IGNORE INTO carga_instituciones (carga_id, clave, institucion_id) VALUES (?, ?, ?)"
+# Instituciones de referencia por su nombre normalizado, en el orden del arreglo
+# JSON de ids (si dos comparten clave se queda la primera)
+SQL_REFERENCIAS_CARGA = """
+    INSERT OR IGNORE INTO carga_instituciones (carga_id, clave, institucion_id)
+    SELECT ?, i.nombre_norm, i.id FROM json_each(?) j JOIN instituciones i ON i.id = j.value
+    ORDER BY j.key
+"""
+SQL_IDS_CARGA = "SELECT institucion_id FROM carga_instituciones WHERE carga_id = ?"
+SQL_TOTAL_INSTITUCIONES = "SELECT COUNT(*) FROM instituciones"
+SQL_DELETE_CARGA = [
+    "DELETE FROM carga_filas WHERE carga_id = ?",
+    "DELETE FROM carga_instituciones WHERE carga_id = ?",
+    "DELETE FROM cargas WHERE id = ?",
+]
+SQL_CARGAS_VENCIDAS = "SELECT id FROM cargas WHERE creada < datetime('now', ?)"
+
+# Algo@dominio.tld, sin espacios y con una sola @
+_EMAIL_VALIDO = """({0} GLOB '?*@?*.?*' AND {0} NOT GLOB '*@*@*'
+                   AND {0} NOT GLOB '*[' || char(32, 9, 10, 11, 12, 13) || ']*')"""
+
+# Cada fila se valida al guardarla, con expresiones sobre sus parámetros
+# (?1 carga, ?3 nombre, ?5 cargo, ?6 email, ?9 clave de institución): la
+# institución se resuelve contra carga_instituciones (por nombre normalizado),
+# el cargo debe existir en roles y las filas sin nombre o con un email mal
+# formado quedan con errores
+SQL_INSERT_CARGA_FILA = f"""
+    INSERT INTO carga_filas (carga_id, fila, nombre, apellidos, cargo, email, telefono, institucion,
+                             email_clave, institucion_clave, institucion_id, nuevo_cargo, errores)
+    VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, lower(trim(?6)), ?9,
+            (SELECT institucion_id FROM carga_instituciones WHERE carga_id = ?1 AND clave = ?9),
+            NOT EXISTS (SELECT 1 FROM roles WHERE nombre = ?5),
+            rtrim(CASE WHEN ?3 = '' THEN 'Nombre vacío, ' ELSE '' END
+                  || CASE WHEN {_EMAIL_VALIDO.format("?6")} THEN '' ELSE 'Email inválido, ' END, ', '))
+"""
+
+# Válidas: nuevas salvo las que repiten una fila anterior del archivo (se
+# conserva la primera de cada clave: email normalizado e institución)
+SQL_MARCAR_NUEVOS = f"""
+    UPDATE carga_filas SET contacto_id = NULL, estado = CASE
+        WHEN errores <> '' THEN NULL
+        WHEN fila IN (SELECT fila FROM (
+                SELECT fila, ROW_NUMBER() OVER (PARTITION BY email_clave, institucion_clave ORDER BY fila) AS orden
+                FROM carga_filas WHERE carga_id = ?1 AND errores = '') WHERE orden > 1) THEN '{DUPLICADO}'
+        ELSE '{NUEVO}' END
+    WHERE carga_id = ?1
+"""
+# Diferencia de un campo entre la fila (f) y el contacto (c); vacío no es cambio
+_DIFERENCIA = "(f.{0} <> '' AND f.{0} <> coalesce(c.{0}, ''))"
+# Las condiciones sobre contactos repiten las del índice único idx_contactos_clave;
+# el + quita la afinidad TEXT de email_clave, que impediría usar el índice por expresión
+SQL_MARCAR_EXISTENTES = f"""
+    UPDATE carga_filas AS f SET
+        contacto_id = c.id,
+        estado = CASE WHEN {" OR ".join(_DIFERENCIA.format(campo) for campo in CAMPOS_ACTUALIZABLES)}
+                      THEN '{CAMBIADO}' ELSE '{EXISTENTE}' END
+    FROM contactos c
+    WHERE f.carga_id = ? AND f.estado = '{NUEVO}'
+      AND lower(trim(c.email)) = +f.email_clave AND c.institucion_id = f.institucion_id AND trim(c.email) <> ''
+"""
+
+SQL_RESUMEN_CARGA = f"""
+    SELECT COUNT(*), coalesce(SUM(errores = ''), 0), coalesce(SUM(estado = '{NUEVO}'), 0),
+           coalesce(SUM(estado = '{EXISTENTE}'), 0), coalesce(SUM(estado = '{CAMBIADO}'), 0),
+           coalesce(SUM(estado = '{DUPLICADO}'), 0)
+    FROM carga_filas WHERE carga_id = ?
+"""
+SQL_CAMBIOS_POR_CAMPO = f"""
+    SELECT {", ".join(f"coalesce(SUM({_DIFERENCIA.format(campo)}), 0)" for campo in CAMPOS_ACTUALIZABLES)}
+    FROM carga_filas f JOIN contactos c ON c.id = f.contacto_id
+    WHERE f.carga_id = ? AND f.estado = '{CAMBIADO}'
+"""
+SQL_MUESTRA_CAMBIOS = " UNION ALL ".join(f"""
+    SELECT f.fila, f.email, f.institucion, {orden} AS orden, '{campo}', coalesce(c.{campo}, ''), f.{campo}
+    FROM carga_filas f JOIN contactos c ON c.id = f.contacto_id
+    WHERE f.carga_id = ? AND f.estado = '{CAMBIADO}' AND {_DIFERENCIA.format(campo)}
+""" for orden, campo in enumerate(CAMPOS_ACTUALIZABLES)) + " ORDER BY 1, 4 LIMIT ?"
+# SQLite toma las columnas sueltas de la fila de MIN(fila): el nombre como aparece primero
+SQL_INSTITUCIONES_NUEVAS = """
+    SELECT institucion, MIN(fila) FROM carga_filas
+    WHERE carga_id = ? AND institucion_id IS NULL {filtro}
+    GROUP BY institucion_clave ORDER BY 2
+"""
+SQL_CARGOS_CARGA = """
+    SELECT cargo, nuevo_cargo, MIN(fila) FROM carga_filas
+    WHERE carga_id = ? {filtro}
+    GROUP BY cargo ORDER BY 3
+"""
+SQL_COINCIDENCIAS = """
+    SELECT f.institucion, trim(i.nombre)
+    FROM (SELECT institucion, institucion_id, MIN(fila) AS primera FROM carga_filas
+          WHERE carga_id = ? GROUP BY institucion) f
+    LEFT JOIN instituciones i ON i.id = f.institucion_id
+    ORDER BY f.primera
+"""
+SQL_MUESTRA_CARGA = f"""
+    SELECT fila, {", ".join(COLUMNAS)}, institucion_id, institucion_id IS NULL AS nueva_institucion,
+           nuevo_cargo, errores, errores = '' AS valido, estado
+    FROM carga_filas WHERE carga_id = ? {{filtro}} ORDER BY fila LIMIT ?
+"""
+# Filas que se escriben según actualizar
+_FILTRO_ESCRITURA = {False: f"AND estado = '{NUEVO}'", True: f"AND estado IN ('{NUEVO}', '{CAMBIADO}')"}
+SQL_ACTUALIZAR_INSTITUCIONES = """
+    UPDATE carga_filas SET
+        institucion_id = (SELECT ci.institucion_id FROM carga_instituciones ci
+                          WHERE ci.carga_id = carga_filas.carga_id AND ci.clave = carga_filas.institucion_clave)
+    WHERE carga_id = ? AND institucion_id IS NULL
+"""
+# Un INSERT ... SELECT por tramo de filas (fila > ?2 AND fila <= ?3), en el
+# orden del archivo; la clave primaria (carga_id, fila) acota cada tramo
+SQL_INSERT_CONTACTOS_CARGA = """
+    INSERT INTO contactos (nombre, apellidos, cargo, email, telefono, institucion_id)
+    SELECT nombre, apellidos, cargo, email, telefono, institucion_id FROM carga_filas
+    WHERE carga_id = ?1 AND fila > ?2 AND fila <= ?3 {filtro} ORDER BY fila
+"""
+SQL_ULTIMA_FILA_CARGA = "SELECT coalesce(MAX(fila), 0) FROM carga_filas WHERE carga_id = ?"
+
+
+# Instituciones nuevas de una carga para las que se busca una parecida en la BD
+MAX_SUGERENCIAS = 50
+
+
+def clave_institucion(serie):
+    """Clave de comparación de nombres de institución (dao.normalizar_institucion)"""
+    return serie.map(dao.normalizar_institucion)
+
+
+class Carga:
+    """Archivo guardado en el área de carga y el resumen de su validación.
+
+    Las filas quedan en carga_filas bajo `carga_id` hasta que se escriben o
+    se descartan, así que el objeto se puede guardar en st.session_state y
+    reutilizar en cada ejecución de la página sin volver a leer el archivo.
+    Guarda contadores (las filas válidas se reparten en nuevos, existentes
+    sin cambios, cambiados y duplicados, y los cambios se cuentan por campo),
+    los elementos nuevos (una vez cada uno, en el orden en que aparecen), la
+    institución de la BD que corresponde a cada institución distinta del
+    archivo, la institución parecida (índice de trigramas) de cada una de las
+    primeras MAX_SUGERENCIAS instituciones nuevas y tres muestras acotadas:
+    las primeras filas, las primeras filas con errores y los primeros cambios
+    sobre contactos existentes.
+    `faltantes` lista las columnas requeridas que no tiene el archivo (si hay
+    alguna no se guarda nada).
+    """
+
+    def __init__(self, carga_id, max_vista=MAX_VISTA_PREVIA):
+        self.id = carga_id
+        self.max_vista = max_vista
+        self.faltantes = []
+        self.total = 0
+        self.validos = 0
+        self.nuevos = 0
+        self.existentes = 0
+        self.cambiados = 0
+        self.duplicados = 0
+        self.cambios_por_campo = {}
+        self.instituciones_nuevas = []
+        self.cargos = []
+        self.cargos_nuevos = []
+        self.coincidencias = []
+        self.sugerencias = {}
+        self.muestra = _muestra([])
+        self.muestra_errores = _muestra([])
+        self.muestra_cambios = pd.DataFrame(columns=COLUMNAS_CAMBIOS)
+
+    @property
+    def invalidos(self):
+        return self.total - self.validos
+
+    def resumir(self):
+        """Lee del área de carga los contadores, los elementos nuevos y las muestras"""
+        (self.total, self.validos, self.nuevos, self.existentes,
+         self.cambiados, self.duplicados) = fetch_one(SQL_RESUMEN_CARGA, (self.id,))
+        self.cambios_por_campo = _cambios_por_campo(self.id) if self.cambiados else {}
+        self.instituciones_nuevas = [nombre for nombre, _ in fetch_all(
+            SQL_INSTITUCIONES_NUEVAS.format(filtro=""), (self.id,))]
+        cargos = fetch_all(SQL_CARGOS_CARGA.format(filtro=""), (self.id,))
+        self.cargos = [cargo for cargo, _, _ in cargos]
+        self.cargos_nuevos = [cargo for cargo, nuevo, _ in cargos if nuevo]
+        self.coincidencias = fetch_all(SQL_COINCIDENCIAS, (self.id,))
+        self.sugerencias = _sugerencias(self.id, self.instituciones_nuevas[:MAX_SUGERENCIAS])
+        self.muestra = _muestra(fetch_all(SQL_MUESTRA_CARGA.format(filtro=""), (self.id, self.max_vista)))
+        self.muestra_errores = _muestra(fetch_all(SQL_MUESTRA_CARGA.format(filtro="AND errores <> ''"),
+                                                  (self.id, self.max_vista)))
+        if self.cambiados:
+            self.muestra_cambios = pd.DataFrame(
+                [fila[:3] + fila[4:] for fila in fetch_all(
+                    SQL_MUESTRA_CAMBIOS, (self.id,) * len(CAMPOS_ACTUALIZABLES) + (self.max_vista,))],
+                columns=COLUMNAS_CAMBIOS)
+        return self
+
+
+COLUMNAS_CAMBIOS = ["Fila", "Email", "Institución", "Campo", "Antes", "Después"]
+
+
+def _muestra(filas):
+    return pd.DataFrame(filas, columns=["fila"] + COLUMNAS + ["institucion_id", "nueva_institucion",
+                                                              "nuevo_cargo", "errores", "valido", "estado"])
+
+
+def _sugerencias(carga_id, nombres):
+    """{nombre en el archivo: (institución parecida, similitud)} para instituciones nuevas"""
+    if not nombres:
+        return {}
+    ids = [inst_id for (inst_id,) in fetch_all(SQL_IDS_CARGA, (carga_id,))]
+    if len(ids) == fetch_one(SQL_TOTAL_INSTITUCIONES)[0]:
+        ids = None  # La carga ve todas las instituciones: la búsqueda no necesita el filtro
+    sugerencias = {}
+    for nombre in nombres:
+        parecidas = dao.buscar_instituciones(nombre, limite=1, ids=ids)
+        if parecidas:
+            sugerencias[nombre] = parecidas[0]
+    return sugerencias
+
+
+def _cambios_por_campo(carga_id):
+    conteo = fetch_one(SQL_CAMBIOS_POR_CAMPO, (carga_id,))
+    return {campo: n for campo, n in zip(CAMPOS_ACTUALIZABLES, conteo) if n}
+
+
+def faltan_columnas(df):
+    """Columnas requeridas que no están en el DataFrame"""
+    return [c for c in COLUMNAS if c not in df.columns]
+
+
+def normalizar(df):
+    """Copia con las COLUMNAS como texto sin espacios extremos (vacío en lugar de NaN)"""
+    filas = pd.DataFrame({"fila": df.index + 1})
+    for col in COLUMNAS:
+        filas[col] = df[col].fillna("").astype(str).str.strip().to_numpy()
+    return filas
+
+
+def clasificar(carga_id):
+    """Reparte las filas válidas de una carga según los contactos de la BD.
+
+    Las filas quedan como nuevas, duplicadas dentro del archivo, existentes
+    sin cambios o cambiadas. Son dos sentencias sobre toda la carga, sin
+    recorrer filas en Python; se puede repetir (escribir lo hace dentro de su
+    transacción, por si la BD cambió desde la vista previa).
+    """
+    run_query(SQL_MARCAR_NUEVOS, (carga_id,))
+    run_query(SQL_MARCAR_EXISTENTES, (carga_id,))
+
+
+def cargar(bloques, instituciones, archivo=None, max_vista=MAX_VISTA_PREVIA):
+    """Guarda un archivo en el área de carga, lo valida y devuelve su Carga.
+
+    `bloques` es un DataFrame o un iterable de DataFrames (leer_bloques);
+    cada bloque se escribe con un executemany y se descarta, así que la
+    memoria no depende del tamaño del archivo. `instituciones` son filas con
+    nombre e id (dao.Institucion) contra las que se resuelven los nombres del
+    archivo por su nombre normalizado (si dos comparten nombre normalizado se
+    usa la primera). Los cargos se comparan con la tabla roles. Antes se borran las cargas vencidas.
+    """
+    if isinstance(bloques, pd.DataFrame):
+        bloques = [bloques]
+    limpiar_cargas()
+    carga = Carga(run_query(SQL_INSERT_CARGA, (archivo,)).lastrowid, max_vista)
+    try:
+        dao.sincronizar_claves_instituciones()
+        run_query(SQL_REFERENCIAS_CARGA, (carga.id, json.dumps([inst.id for inst in instituciones])))
+        for df in bloques:
+            carga.faltantes = faltan_columnas(df)
+            if carga.faltantes:
+                descartar(carga.id)
+                return carga
+            filas = normalizar(df)
+            run_many(SQL_INSERT_CARGA_FILA, zip(
+                [carga.id] * len(filas), filas["fila"].tolist(),
+                *(filas[col].tolist() for col in COLUMNAS), clave_institucion(filas["institucion"]).tolist()))
+        clasificar(carga.id)
+    except Exception:
+        descartar(carga.id)
+        raise
+    return carga.resumir()
+
+
+def carga_disponible(carga_id):
+    """Indica si la carga sigue en el área de carga (no se escribió, descartó ni venció)"""
+    return fetch_one(SQL_CARGA_EXISTE, (carga_id,)) is not None
+
+
+def descartar(carga_id):
+    """Borra una carga del área de carga"""
+    with transaction(tables=["carga_filas", "carga_instituciones", "cargas"]):
+        for sql in SQL_DELETE_CARGA:
+            run_query(sql, (carga_id,))
+
+
+def limpiar_cargas(horas=HORAS_CARGA):
+    """Borra las cargas creadas hace más de `horas` horas"""
+    for (carga_id,) in fetch_all(SQL_CARGAS_VENCIDAS, (f"-{horas} hours",)):
+        descartar(carga_id)
+
+
+ESTADOS_VISTA = {
+    NUEVO: "✅ Nuevo",
+    EXISTENTE: "⏭️ Ya existe",
+    CAMBIADO: "✏️ Ya existe, con cambios",
+    DUPLICADO: "🔁 Repetido en el archivo",
+}
+
+
+def vista_previa(filas):
+    """DataFrame para mostrar: marca con 🆕 lo que se creará y el estado de cada fila"""
+    estado = filas["estado"].map(ESTADOS_VISTA).fillna("✅ Válido")
+    return pd.DataFrame({
+        "Fila": filas["fila"],
+        "Nombre": filas["nombre"],
+        "Apellidos": filas["apellidos"],
+        "Cargo": filas["cargo"].mask(filas["nuevo_cargo"].astype(bool), "🆕 " + filas["cargo"]),
+        "Email": filas["email"],
+        "Teléfono": filas["telefono"],
+        "Institución": filas["institucion"].mask(filas["nueva_institucion"].astype(bool), "🆕 " + filas["institucion"]),
+        "Estado": ("❌ " + filas["errores"]).where(~filas["valido"].astype(bool), estado),
+    })
+
+
+# -------------------------------
+# Escritura
+# -------------------------------
+
+def escribir(carga, actualizar=False, progreso=None):
+    """Escribe una carga en contactos en una sola transacción y la descarta.
+
+    Dentro de la transacción se vuelve a clasificar la carga (pudo cambiar
+    la BD desde la vista previa), se crean las instituciones y cargos nuevos
+    de las filas que se escriben y los contactos se copian con un
+    INSERT ... SELECT por cada tramo de TAMANO_BLOQUE filas del archivo: las
+    filas nuevas y, con actualizar=True, también las de contactos existentes
+    que traen cambios (ON CONFLICT DO UPDATE). Si algo falla no se guarda
+    nada y la carga se conserva.
+    `progreso(hechos, total, mensaje)` se llama antes de copiar y después de
+    cada tramo.
+    Devuelve un dict con instituciones_creadas, cargos_creados, insertados,
+    actualizados, existentes (contactos existentes que no se tocaron),
+    duplicados y cambios_por_campo (de los actualizados).
+    """
+    carga_id = carga.id
+    filtro = _FILTRO_ESCRITURA[actualizar]
+
+    # Inmediata: nadie más puede escribir entre la clasificación y la escritura
+    with transaction(immediate=True):
+        if not carga_disponible(carga_id):
+            raise ValueError("La carga ya no está disponible; vuelve a subir el archivo")
+        clasificar(carga_id)
+        _, _, nuevos, existentes, cambiados, duplicados = fetch_one(SQL_RESUMEN_CARGA, (carga_id,))
+        resultado = {"instituciones_creadas": [], "cargos_creados": [], "insertados": nuevos,
+                     "actualizados": cambiados if actualizar else 0,
+                     "existentes": existentes + (0 if actualizar else cambiados), "duplicados": duplicados,
+                     "cambios_por_campo": _cambios_por_campo(carga_id) if actualizar and cambiados else {}}
+        total = nuevos + resultado["actualizados"]
+
+        nuevas = []
+        for nombre, _ in fetch_all(SQL_INSTITUCIONES_NUEVAS.format(filtro=filtro), (carga_id,)):
+            inst_id = dao.create_institucion(nombre, ciudad="Ciudad por definir", anio_programa="2024")
+            nuevas.append((carga_id, dao.normalizar_institucion(nombre), inst_id))
+            resultado["instituciones_creadas"].append(nombre)
+        if nuevas:
+            run_many(SQL_INSERT_CARGA_INSTITUCION, nuevas)
+            run_query(SQL_ACTUALIZAR_INSTITUCIONES, (carga_id,))
+
+        cargos = [cargo for cargo, nuevo, _ in fetch_all(SQL_CARGOS_CARGA.format(filtro=filtro), (carga_id,))
+                  if nuevo]
+        if cargos:
+            dao.create_roles(cargos)
+            resultado["cargos_creados"] = cargos
+
+        if progreso:
+            progreso(0, total, f"Guardando {total} contactos...")
+        sql = SQL_INSERT_CONTACTOS_CARGA.format(filtro=filtro)
+        if actualizar:
+            sql += dao.SQL_CONFLICTO_CONTACTO
+        hechos = 0
+        ultima = fetch_one(SQL_ULTIMA_FILA_CARGA, (carga_id,))[0]
+        for desde in range(0, ultima, TAMANO_BLOQUE):
+            hechos += run_query(sql, (carga_id, desde, desde + TAMANO_BLOQUE)).rowcount
+            if progreso:
+                progreso(hechos, total, f"Contactos procesados: {hechos} de {total}")
+        descartar(carga_id)
+    return resultado
@@ -0,0 +1,805 @@
+"""
+Acceso a datos de la plataforma (KAMs, instituciones, contactos, roles y mensajes).
+
+El texto de cada consulta se define una sola vez como constante de módulo, de
+modo que la caché de sentencias preparadas de la conexión (cached_statements)
+la reutiliza entre llamadas. Las filas se devuelven como objetos compactos con
+__slots__ en lugar de tuplas indexadas por posición.
+
+Las lecturas indican de qué tablas dependen y se sirven desde utils.query_cache
+hasta que alguna escritura las modifica. Las comprobaciones puntuales de
+existencia y los conteos van siempre a la base de datos.
+
+Los listados de contactos e instituciones de los paneles se leen por páginas
+con paginación por clave (keyset): cada página continúa después de la última
+fila de la anterior en lugar de usar OFFSET, así que su costo no depende de
+cuántas páginas se hayan recorrido.
+
+Los nombres de institución se comparan por su clave normalizada
+(normalizar_institucion: sin acentos, sin puntuación y con las abreviaturas
+habituales expandidas), guardada en instituciones.nombre_norm, y se buscan
+por parecido con un índice de trigramas (institucion_trigramas). Los
+triggers de la migración 8 borran la clave y los trigramas de una
+institución renombrada o borrada; sincronizar_claves_instituciones los
+vuelve a calcular para las que no los tengan. Se ejecuta al crear o
+renombrar instituciones con este módulo y una vez al arrancar el proceso
+para las escritas por otros caminos, nunca en cada búsqueda.
+
+Los contactos extraídos de Gmail se acumulan por KAM y carpeta
+(gmail_contactos) junto con el último UID leído de cada carpeta
+(gmail_sync), de modo que cada importación solo lee los correos nuevos.
+"""
+
+import functools
+import json
+import re
+import string
+import unicodedata
+
+from utils.db import run_query, run_many, fetch_all, fetch_one, fetch_all_cached, transaction
+
+# Filas por página de los listados paginados
+PAGE_SIZE = 50
+
+
+class _Row:
+    """Base de las filas: asigna los valores en el orden de __slots__."""
+
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        campos = ", ".join(f"{name}={getattr(self, name, None)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({campos})"
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name, None) == getattr(other, name, None) for name in self.__slots__
+        )
+
+    @classmethod
+    def factory(cls, cursor, row):
+        """row_factory de sqlite3 que construye la fila directamente"""
+        return cls(*row)
+
+
+class Kam(_Row):
+    __slots__ = ("id", "nombre", "email", "telefono", "email_usuario", "email_password")
+
+
+class Institucion(_Row):
+    __slots__ = ("id", "nombre", "direccion", "ciudad", "provincia", "pais", "anio_programa", "tipo_programa", "plan")
+
+
+class Contacto(_Row):
+    __slots__ = ("id", "nombre", "apellidos", "cargo", "email", "telefono", "institucion_id", "institucion")
+
+    @property
+    def nombre_completo(self):
+        return f"{self.nombre} {self.apellidos or ''}".strip()
+
+
+class GmailCarpeta(_Row):
+    __slots__ = ("carpeta", "cuenta", "uidvalidity", "ultimo_uid", "actualizado")
+
+
+class GmailContacto(_Row):
+    __slots__ = ("email", "nombre", "frecuencia", "ultimo_correo")
+
+
+class Mensaje(_Row):
+    __slots__ = ("id", "titulo", "cuerpo", "tipo", "fecha_envio_programada", "enviado")
+
+
+def _fetch_all(cls, query, params=(), tables=()):
+    return fetch_all_cached(query, params, tables, row_factory=cls.factory)
+
+
+def _fetch_one(cls, query, params=(), tables=()):
+    rows = fetch_all_cached(query, params, tables, row_factory=cls.factory)
+    return rows[0] if rows else None
+
+
+def _scalar(query, params=()):
+    row = fetch_one(query, params)
+    return row[0] if row else None
+
+
+def _like(texto):
+    """Patrón LIKE que busca `texto` en cualquier posición (escapa % y _)"""
+    texto = texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{texto}%"
+
+
+def _page_sql(select, where, params, orden, descendente, despues, limite):
+    """Consulta de una página: filtros + (columnas de orden) > cursor, LIMIT limite + 1
+
+    La fila extra solo sirve para saber si hay una página siguiente.
+    """
+    columnas = [expr for expr, _, _ in orden]
+    where, params = list(where), list(params)
+    if despues is not None:
+        marcadores = ", ".join("?" * len(columnas))
+        where.append(f"({', '.join(columnas)}) {'<' if descendente else '>'} ({marcadores})")
+        params.extend(despues)
+        if len(columnas) > 1:
+            # Redundante, pero SQLite no usa la comparación de filas para
+            # buscar en un índice sobre una expresión; esta cota sí
+            where.append(f"{columnas[0]} {'<=' if descendente else '>='} ?")
+            params.append(despues[0])
+    sql = select
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sentido = " DESC" if descendente else ""
+    sql += " ORDER BY " + ", ".join(c + sentido for c in columnas) + " LIMIT ?"
+    params.append(limite + 1)
+    return sql, tuple(params)
+
+
+def _page(cls, sql, params, tables, orden, limite):
+    """(filas, cursor de la página siguiente o None)"""
+    filas = _fetch_all(cls, sql, params, tables)
+    if len(filas) <= limite:
+        return filas, None
+    filas = filas[:limite]
+    ultima = filas[-1]
+    siguiente = []
+    for _, attr, nulo in orden:
+        valor = getattr(ultima, attr)
+        siguiente.append(nulo if valor is None else valor)
+    return filas, tuple(siguiente)
+
+
+def _count(query, params, tables):
+    return fetch_all_cached(query, params, tables)[0][0]
+
+
+# -------------------------------
+# KAMs
+# -------------------------------
+
+_KAM_COLS = "id, nombre, email, telefono, email_usuario, email_password"
+_KAM_TABLES = ("kams",)
+
+SQL_KAM_BY_EMAIL = f"SELECT {_KAM_COLS} FROM kams WHERE email = ?"
+SQL_KAM_BY_ID = f"SELECT {_KAM_COLS} FROM kams WHERE id = ?"
+SQL_KAMS = f"SELECT {_KAM_COLS} FROM kams ORDER BY nombre"
+SQL_INSERT_KAM = "INSERT INTO kams (nombre, email, telefono, email_usuario, email_password) VALUES (?, ?, ?, ?, ?)"
+SQL_UPDATE_KAM = "UPDATE kams SET nombre = ?, email = ?, telefono = ? WHERE id = ?"
+SQL_UPDATE_KAM_EMAIL_CONFIG = "UPDATE kams SET email_usuario = ?, email_password = ? WHERE id = ?"
+SQL_DELETE_KAM = "DELETE FROM kams WHERE id = ?"
+SQL_ASSIGN_INSTITUCION = "INSERT OR IGNORE INTO kam_institucion (kam_id, institucion_id) VALUES (?, ?)"
+
+
+def get_kam_by_email(email):
+    return _fetch_one(Kam, SQL_KAM_BY_EMAIL, (email,), _KAM_TABLES)
+
+
+def get_kam(kam_id):
+    return _fetch_one(Kam, SQL_KAM_BY_ID, (kam_id,), _KAM_TABLES)
+
+
+def list_kams():
+    return _fetch_all(Kam, SQL_KAMS, (), _KAM_TABLES)
+
+
+def get_kam_email_credentials(kam_email):
+    """(email_usuario, email_password) del KAM, o (None, None) si no están configuradas"""
+    kam = get_kam_by_email(kam_email)
+    if kam and kam.email_usuario and kam.email_password:
+        return kam.email_usuario, kam.email_password
+    return None, None
+
+
+def create_kam(nombre, email, telefono, email_usuario=None, email_password=None):
+    return run_query(SQL_INSERT_KAM, (nombre, email, telefono, email_usuario, email_password)).lastrowid
+
+
+def update_kam(kam_id, nombre, email, telefono):
+    run_query(SQL_UPDATE_KAM, (nombre, email, telefono, kam_id))
+
+
+def update_kam_email_config(kam_id, email_usuario, email_password):
+    run_query(SQL_UPDATE_KAM_EMAIL_CONFIG, (email_usuario, email_password, kam_id))
+
+
+def delete_kam(kam_id):
+    run_query(SQL_DELETE_KAM, (kam_id,))
+
+
+def assign_instituciones(kam_id, institucion_ids):
+    run_many(SQL_ASSIGN_INSTITUCION, [(kam_id, iid) for iid in institucion_ids])
+
+
+# -------------------------------
+# Usuarios
+# -------------------------------
+
+SQL_EMAIL_REGISTRADO = "SELECT 1 FROM kams WHERE email = ? UNION ALL SELECT 1 FROM users WHERE email = ? LIMIT 1"
+SQL_UPDATE_USER_KAM = "UPDATE users SET nombre = ?, email = ? WHERE email = ? AND rol = ?"
+SQL_DELETE_USER_KAM = "DELETE FROM users WHERE email = ? AND rol = ?"
+
+
+def email_registrado(email):
+    """True si el email ya pertenece a un KAM o a un usuario"""
+    return _scalar(SQL_EMAIL_REGISTRADO, (email, email)) is not None
+
+
+def update_user_kam(old_email, nombre, email):
+    run_query(SQL_UPDATE_USER_KAM, (nombre, email, old_email, "KAM"))
+
+
+def delete_user_kam(email):
+    run_query(SQL_DELETE_USER_KAM, (email, "KAM"))
+
+
+# -------------------------------
+# Instituciones
+# -------------------------------
+
+_INST_COLS = "i.id, i.nombre, i.direccion, i.ciudad, i.provincia, i.pais, i.anio_programa, i.tipo_programa, i.plan"
+_INST_TABLES = ("instituciones",)
+_INST_KAM_TABLES = ("instituciones", "kam_institucion")
+
+SQL_INSTITUCIONES = f"SELECT {_INST_COLS} FROM instituciones i"
+SQL_INSTITUCION_BY_ID = f"SELECT {_INST_COLS} FROM instituciones i WHERE i.id = ?"
+SQL_INSTITUCIONES_KAM = f"""
+    SELECT {_INST_COLS}
+    FROM instituciones i
+    JOIN kam_institucion ki ON i.id = ki.institucion_id
+    WHERE ki.kam_id = ?
+"""
+SQL_INSTITUCION_ID_BY_NOMBRE = "SELECT id FROM instituciones WHERE nombre = ?"
+SQL_INSERT_INSTITUCION = "INSERT INTO instituciones (nombre, direccion, ciudad, provincia, pais, anio_programa, tipo_programa, plan) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+SQL_UPDATE_INSTITUCION = "UPDATE instituciones SET nombre = ?, direccion = ?, ciudad = ?, provincia = ?, pais = ?, anio_programa = ?, tipo_programa = ?, plan = ? WHERE id = ?"
+SQL_DELETE_INSTITUCION = "DELETE FROM instituciones WHERE id = ?"
+
+
+def list_instituciones():
+    return _fetch_all(Institucion, SQL_INSTITUCIONES, (), _INST_TABLES)
+
+
+def get_institucion(institucion_id):
+    return _fetch_one(Institucion, SQL_INSTITUCION_BY_ID, (institucion_id,), _INST_TABLES)
+
+
+def list_instituciones_kam(kam_id):
+    """Instituciones asignadas a un KAM"""
+    return _fetch_all(Institucion, SQL_INSTITUCIONES_KAM, (kam_id,), _INST_KAM_TABLES)
+
+
+def get_institucion_id_by_nombre(nombre):
+    rows = fetch_all_cached(SQL_INSTITUCION_ID_BY_NOMBRE, (nombre,), _INST_TABLES)
+    return rows[0][0] if rows else None
+
+
+def create_institucion(nombre, direccion=None, ciudad=None, provincia=None, pais=None,
+                       anio_programa=None, tipo_programa="Muyu Lab", plan="Pago"):
+    """Crea una institución (con su clave normalizada) y devuelve su id"""
+    with transaction(tables=["instituciones", "institucion_trigramas"]):
+        inst_id = run_query(SQL_INSERT_INSTITUCION, (nombre, direccion, ciudad, provincia, pais,
+                                                     anio_programa, tipo_programa, plan)).lastrowid
+        sincronizar_claves_instituciones()
+    return inst_id
+
+
+def update_institucion(institucion_id, nombre, direccion, ciudad, provincia, pais, anio_programa, tipo_programa, plan):
+    # Si cambia el nombre, el trigger borra la clave y aquí se recalcula
+    with transaction(tables=["instituciones", "institucion_trigramas"]):
+        run_query(SQL_UPDATE_INSTITUCION, (nombre, direccion, ciudad, provincia, pais,
+                                           anio_programa, tipo_programa, plan, institucion_id))
+        sincronizar_claves_instituciones()
+
+
+def delete_institucion(institucion_id):
+    run_query(SQL_DELETE_INSTITUCION, (institucion_id,))
+
+
+# Abreviaturas que se expanden al normalizar nombres de institución
+ABREVIATURAS_INSTITUCION = {
+    "ue": "unidad educativa",
+    "uep": "unidad educativa particular",
+    "uef": "unidad educativa fiscal",
+    "uefm": "unidad educativa fiscomisional",
+    "cecib": "centro educativo comunitario intercultural bilingue",
+    "col": "colegio",
+    "esc": "escuela",
+    "inst": "instituto",
+    "univ": "universidad",
+}
+
+# Similitud mínima (trigramas en común / trigramas distintos) para sugerir una institución
+UMBRAL_SIMILITUD = 0.5
+
+# Candidatas que se traen del índice de trigramas antes de calcular la similitud
+MAX_CANDIDATAS = 50
+
+_NO_ALFANUMERICO = re.compile(r"[^a-z0-9]+")
+
+
+@functools.lru_cache(maxsize=8192)
+def normalizar_institucion(nombre):
+    """Clave de comparación de un nombre de institución.
+
+    Minúsculas, sin acentos ni puntuación, con las letras sueltas seguidas
+    unidas (siglas como "U. E.") y las ABREVIATURAS_INSTITUCION expandidas:
+    "U.E. San José" y "Unidad Educativa San Jose" -> "unidad educativa san jose".
+    """
+    texto = unicodedata.normalize("NFKD", str(nombre or "").lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    palabras, sigla = [], ""
+    for palabra in _NO_ALFANUMERICO.split(texto):
+        if len(palabra) == 1 and palabra.isalpha():
+            sigla += palabra
+            continue
+        if sigla:
+            palabras.append(sigla)
+            sigla = ""
+        if palabra:
+            palabras.append(palabra)
+    if sigla:
+        palabras.append(sigla)
+    return " ".join(ABREVIATURAS_INSTITUCION.get(p, p) for p in palabras)
+
+
+def trigramas(clave):
+    """Trigramas de cada palabra de una clave, con relleno como pg_trgm ("  ab " -> '  a', ' ab', 'ab ')"""
+    resultado = set()
+    for palabra in clave.split():
+        relleno = f"  {palabra} "
+        resultado.update(relleno[i:i + 3] for i in range(len(relleno) - 2))
+    return resultado
+
+
+def similitud(a, b):
+    """Trigramas en común sobre trigramas distintos (0 a 1) de dos claves normalizadas"""
+    ta, tb = trigramas(a), trigramas(b)
+    return len(ta & tb) / len(ta | tb) if ta or tb else 0.0
+
+
+SQL_INSTITUCIONES_SIN_CLAVE = "SELECT id, nombre FROM instituciones WHERE nombre_norm IS NULL"
+SQL_UPDATE_CLAVE_INSTITUCION = "UPDATE instituciones SET nombre_norm = ? WHERE id = ?"
+SQL_INSERT_TRIGRAMA = "INSERT OR IGNORE INTO institucion_trigramas (trigrama, institucion_id) VALUES (?, ?)"
+# Instituciones con más trigramas en común; la versión _EN se limita a los ids de un arreglo JSON
+SQL_CANDIDATAS_TRIGRAMAS = """
+    SELECT t.institucion_id, COUNT(*) AS comunes
+    FROM json_each(?) j JOIN institucion_trigramas t ON t.trigrama = j.value
+    GROUP BY t.institucion_id ORDER BY comunes DESC LIMIT ?
+"""
+# CROSS JOIN y el + fijan el plan: primero los trigramas buscados y luego el
+# filtro por ids. Si no, SQLite recorre los trigramas de cada id de la lista.
+SQL_CANDIDATAS_TRIGRAMAS_EN = """
+    SELECT t.institucion_id, COUNT(*) AS comunes
+    FROM json_each(?) j CROSS JOIN institucion_trigramas t ON t.trigrama = j.value
+    WHERE +t.institucion_id IN (SELECT value FROM json_each(?))
+    GROUP BY t.institucion_id ORDER BY comunes DESC LIMIT ?
+"""
+SQL_INSTITUCIONES_CLAVES = f"""
+    SELECT {_INST_COLS}, i.nombre_norm FROM json_each(?) j JOIN instituciones i ON i.id = j.value
+"""
+
+
+def sincronizar_claves_instituciones(db_path=None):
+    """Calcula nombre_norm y trigramas de las instituciones que no los tienen; devuelve cuántas.
+
+    Se llama al crear o renombrar una institución desde aquí y una vez al
+    arrancar (db_setup.bootstrap_db) para las escritas por otros caminos.
+    """
+    filas = fetch_all(SQL_INSTITUCIONES_SIN_CLAVE, db_path=db_path)
+    if not filas:
+        return 0
+    claves = [(normalizar_institucion(nombre), inst_id) for inst_id, nombre in filas]
+    with transaction(db_path, tables=["instituciones", "institucion_trigramas"]):
+        run_many(SQL_UPDATE_CLAVE_INSTITUCION, claves, db_path=db_path)
+        run_many(SQL_INSERT_TRIGRAMA, [(t, inst_id) for clave, inst_id in claves for t in trigramas(clave)],
+                 db_path=db_path)
+    return len(filas)
+
+
+def buscar_instituciones(nombre, limite=5, ids=None, umbral=UMBRAL_SIMILITUD):
+    """Instituciones parecidas a `nombre`: [(Institucion, similitud)] de mayor a menor.
+
+    Las candidatas salen del índice de trigramas (las que más comparten con
+    el nombre normalizado) y se ordenan por similitud. Con `ids` solo se
+    consideran esas instituciones (p. ej. las asignadas a un KAM).
+    """
+    clave = normalizar_institucion(nombre)
+    buscados = trigramas(clave)
+    if not buscados:
+        return []
+    if ids is None:
+        candidatas = fetch_all(SQL_CANDIDATAS_TRIGRAMAS, (json.dumps(sorted(buscados)), MAX_CANDIDATAS))
+    else:
+        candidatas = fetch_all(SQL_CANDIDATAS_TRIGRAMAS_EN, (json.dumps(sorted(buscados)),
+                                                              json.dumps(list(ids)), MAX_CANDIDATAS))
+    filas = fetch_all(SQL_INSTITUCIONES_CLAVES, (json.dumps([inst_id for inst_id, _ in candidatas]),))
+    resultado = []
+    for fila in filas:
+        parecido = similitud(clave, fila[-1])
+        if parecido >= umbral:
+            resultado.append((Institucion(*fila[:-1]), parecido))
+    resultado.sort(key=lambda r: (-r[1], r[0].nombre))
+    return resultado[:limite]
+
+
+# Órdenes de los listados paginados: (expresión SQL, atributo de la fila,
+# valor que reemplaza a NULL). Siempre terminan en el id para que el orden sea
+# total y el cursor identifique una única fila.
+ORDEN_INSTITUCIONES = {
+    "nombre": (("i.nombre", "nombre", None), ("i.id", "id", None)),
+    # Índice idx_instituciones_ciudad_orden (migración 10) sobre la misma expresión
+    "ciudad": (("COALESCE(i.ciudad, '')", "ciudad", ""), ("i.id", "id", None)),
+    "id": (("i.id", "id", None),),
+}
+
+_SELECT_PAGE_INSTITUCIONES = f"SELECT {_INST_COLS} FROM instituciones i"
+
+
+def _filtros_instituciones(texto=None, tipo_programa=None, plan=None, kam_id=None):
+    where, params = [], []
+    if kam_id is not None:
+        where.append("i.id IN (SELECT institucion_id FROM kam_institucion WHERE kam_id = ?)")
+        params.append(kam_id)
+    if tipo_programa:
+        where.append("i.tipo_programa = ?")
+        params.append(tipo_programa)
+    if plan:
+        where.append("i.plan = ?")
+        params.append(plan)
+    if texto and texto.strip():
+        patron = _like(texto.strip())
+        where.append("(i.nombre LIKE ? ESCAPE '\\' OR i.ciudad LIKE ? ESCAPE '\\' OR i.provincia LIKE ? ESCAPE '\\')")
+        params.extend([patron] * 3)
+    return where, params
+
+
+def page_instituciones_sql(orden="nombre", descendente=False, despues=None, limite=PAGE_SIZE, **filtros):
+    """(sql, parámetros) de una página de instituciones"""
+    where, params = _filtros_instituciones(**filtros)
+    return _page_sql(_SELECT_PAGE_INSTITUCIONES, where, params, ORDEN_INSTITUCIONES[orden],
+                     descendente, despues, limite)
+
+
+def page_instituciones(orden="nombre", descendente=False, despues=None, limite=PAGE_SIZE, **filtros):
+    """Página de instituciones: (filas, cursor de la siguiente página o None).
+
+    Filtros: texto (nombre, ciudad o provincia), tipo_programa, plan, kam_id.
+    """
+    sql, params = page_instituciones_sql(orden, descendente, despues, limite, **filtros)
+    return _page(Institucion, sql, params, _INST_KAM_TABLES, ORDEN_INSTITUCIONES[orden], limite)
+
+
+def count_page_instituciones(**filtros):
+    """Total de instituciones que cumplen los filtros de page_instituciones"""
+    where, params = _filtros_instituciones(**filtros)
+    sql = "SELECT COUNT(*) FROM instituciones i" + (" WHERE " + " AND ".join(where) if where else "")
+    return _count(sql, tuple(params), _INST_KAM_TABLES)
+
+
+# -------------------------------
+# Contactos
+# -------------------------------
+
+_CONTACTO_COLS = "c.id, c.nombre, c.apellidos, c.cargo, c.email, c.telefono, c.institucion_id"
+_CONTACTO_TABLES = ("contactos",)
+_CONTACTO_KAM_TABLES = ("contactos", "instituciones", "kam_institucion")
+
+SQL_CONTACTOS = f"SELECT {_CONTACTO_COLS}, NULL FROM contactos c"
+SQL_CONTACTO_BY_ID = f"SELECT {_CONTACTO_COLS}, NULL FROM contactos c WHERE c.id = ?"
+SQL_CONTACTOS_KAM = f"""
+    SELECT {_CONTACTO_COLS}, i.nombre
+    FROM contactos c
+    JOIN instituciones i ON c.institucion_id = i.id
+    JOIN kam_institucion ki ON i.id = ki.institucion_id
+    WHERE ki.kam_id = ?
+    ORDER BY i.nombre, c.nombre
+"""
+SQL_CONTACTOS_INSTITUCION = f"SELECT {_CONTACTO_COLS}, NULL FROM contactos c WHERE c.institucion_id = ?"
+SQL_CONTACTO_EXISTE = "SELECT id FROM contactos WHERE email = ? AND institucion_id = ?"
+SQL_COUNT_CONTACTOS = "SELECT COUNT(*) FROM contactos"
+SQL_INSERT_CONTACTO = "INSERT INTO contactos (nombre, apellidos, cargo, email, telefono, institucion_id) VALUES (?, ?, ?, ?, ?, ?)"
+# Contactos cuya clave (email normalizado, institucion_id) está en un arreglo
+# JSON. Las condiciones repiten las del índice único idx_contactos_clave (los
+# contactos sin email no tienen clave) para que SQLite pueda usarlo.
+SQL_CONTACTOS_EXISTENTES = f"""
+    SELECT lower(trim(c.email)), {_CONTACTO_COLS}, NULL
+    FROM json_each(?) j
+    JOIN contactos c
+      ON lower(trim(c.email)) = json_extract(j.value, '$[0]') AND c.institucion_id = json_extract(j.value, '$[1]')
+      AND trim(c.email) <> ''
+"""
+# Si ya hay un contacto con la misma clave, actualiza los campos que vienen con
+# valor (una celda vacía no borra el dato guardado)
+SQL_CONFLICTO_CONTACTO = """
+    ON CONFLICT (lower(trim(email)), institucion_id) WHERE trim(email) <> '' DO UPDATE SET
+        nombre = COALESCE(NULLIF(excluded.nombre, ''), nombre),
+        apellidos = COALESCE(NULLIF(excluded.apellidos, ''), apellidos),
+        cargo = COALESCE(NULLIF(excluded.cargo, ''), cargo),
+        telefono = COALESCE(NULLIF(excluded.telefono, ''), telefono)
+"""
+SQL_UPSERT_CONTACTO = SQL_INSERT_CONTACTO + SQL_CONFLICTO_CONTACTO
+SQL_UPDATE_CONTACTO = "UPDATE contactos SET nombre = ?, apellidos = ?, cargo = ?, email = ?, telefono = ?, institucion_id = ? WHERE id = ?"
+SQL_DELETE_CONTACTO = "DELETE FROM contactos WHERE id = ?"
+
+
+def list_contactos():
+    return _fetch_all(Contacto, SQL_CONTACTOS, (), _CONTACTO_TABLES)
+
+
+def get_contacto(contacto_id):
+    return _fetch_one(Contacto, SQL_CONTACTO_BY_ID, (contacto_id,), _CONTACTO_TABLES)
+
+
+def list_contactos_kam(kam_id):
+    """Contactos de las instituciones asignadas a un KAM (con el nombre de la institución)"""
+    return _fetch_all(Contacto, SQL_CONTACTOS_KAM, (kam_id,), _CONTACTO_KAM_TABLES)
+
+
+def list_contactos_institucion(institucion_id):
+    return _fetch_all(Contacto, SQL_CONTACTOS_INSTITUCION, (institucion_id,), _CONTACTO_TABLES)
+
+
+def contacto_existe(email, institucion_id):
+    return _scalar(SQL_CONTACTO_EXISTE, (email, institucion_id)) is not None
+
+
+# lower() de SQLite solo convierte A-Z; str.lower() también cambiaría letras
+# no ASCII y la clave dejaría de coincidir con la del índice idx_contactos_clave
+_MINUSCULAS_ASCII = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def clave_email(email):
+    """Email normalizado para detectar contactos repetidos (igual que lower(trim(email)) en SQL)"""
+    return (email or "").strip(" ").translate(_MINUSCULAS_ASCII)
+
+
+def contactos_existentes(claves):
+    """Contactos que ya existen para `claves` (email normalizado, institucion_id).
+
+    Devuelve un dict {clave: Contacto}. Todas las claves se cruzan con
+    contactos en una sola consulta: viajan como un arreglo JSON y se leen
+    con json_each.
+    """
+    claves = list(claves)
+    if not claves:
+        return {}
+    filas = fetch_all(SQL_CONTACTOS_EXISTENTES, (json.dumps(claves),))
+    return {(f[0], f[7]): Contacto(*f[1:]) for f in filas}
+
+
+def count_contactos():
+    return _scalar(SQL_COUNT_CONTACTOS)
+
+
+def create_contacto(nombre, apellidos, cargo, email, telefono, institucion_id):
+    return run_query(SQL_INSERT_CONTACTO, (nombre, apellidos, cargo, email, telefono, institucion_id)).lastrowid
+
+
+def create_contactos(filas, actualizar=False):
+    """Inserta varios contactos con un solo executemany; devuelve cuántas filas cambiaron.
+
+    `filas` son tuplas (nombre, apellidos, cargo, email, telefono, institucion_id).
+    Con actualizar=True los contactos que ya existen (mismo email e
+    institución) se actualizan en lugar de fallar.
+    """
+    return run_many(SQL_UPSERT_CONTACTO if actualizar else SQL_INSERT_CONTACTO, filas)
+
+
+def update_contacto(contacto_id, nombre, apellidos, cargo, email, telefono, institucion_id):
+    run_query(SQL_UPDATE_CONTACTO, (nombre, apellidos, cargo, email, telefono, institucion_id, contacto_id))
+
+
+def delete_contacto(contacto_id):
+    run_query(SQL_DELETE_CONTACTO, (contacto_id,))
+
+
+ORDEN_CONTACTOS = {
+    "nombre": (("c.nombre", "nombre", None), ("c.id", "id", None)),
+    "cargo": (("c.cargo", "cargo", None), ("c.id", "id", None)),
+    # Agrupados por institución en el orden de idx_contactos_institucion_orden
+    # (migración 10): el nombre de la institución está en otra tabla y ordenar
+    # por él obligaría a leer y ordenar todos los contactos en cada página
+    "institucion": (("COALESCE(c.institucion_id, 0)", "institucion_id", 0), ("c.id", "id", None)),
+    "id": (("c.id", "id", None),),
+}
+
+_SELECT_PAGE_CONTACTOS = f"""SELECT {_CONTACTO_COLS}, i.nombre
+    FROM contactos c
+    LEFT JOIN instituciones i ON i.id = c.institucion_id"""
+_COUNT_PAGE_CONTACTOS = "SELECT COUNT(*) FROM contactos c"
+_COUNT_PAGE_CONTACTOS_TEXTO = _COUNT_PAGE_CONTACTOS + " LEFT JOIN instituciones i ON i.id = c.institucion_id"
+
+
+def _filtros_contactos(texto=None, cargo=None, institucion_id=None, kam_id=None):
+    where, params = [], []
+    if kam_id is not None:
+        where.append("c.institucion_id IN (SELECT institucion_id FROM kam_institucion WHERE kam_id = ?)")
+        params.append(kam_id)
+    if institucion_id is not None:
+        where.append("c.institucion_id = ?")
+        params.append(institucion_id)
+    if cargo:
+        where.append("c.cargo = ?")
+        params.append(cargo)
+    if texto and texto.strip():
+        patron = _like(texto.strip())
+        where.append("(c.nombre LIKE ? ESCAPE '\\' OR c.apellidos LIKE ? ESCAPE '\\' "
+                     "OR c.email LIKE ? ESCAPE '\\' OR i.nombre LIKE ? ESCAPE '\\')")
+        params.extend([patron] * 4)
+    return where, params
+
+
+def page_contactos_sql(orden="nombre", descendente=False, despues=None, limite=PAGE_SIZE, **filtros):
+    """(sql, parámetros) de una página de contactos"""
+    where, params = _filtros_contactos(**filtros)
+    return _page_sql(_SELECT_PAGE_CONTACTOS, where, params, ORDEN_CONTACTOS[orden],
+                     descendente, despues, limite)
+
+
+def page_contactos(orden="nombre", descendente=False, despues=None, limite=PAGE_SIZE, **filtros):
+    """Página de contactos con el nombre de su institución: (filas, cursor siguiente o None).
+
+    Filtros: texto (nombre, apellidos, email o institución), cargo,
+    institucion_id, kam_id (solo instituciones asignadas al KAM).
+    """
+    sql, params = page_contactos_sql(orden, descendente, despues, limite, **filtros)
+    return _page(Contacto, sql, params, _CONTACTO_KAM_TABLES, ORDEN_CONTACTOS[orden], limite)
+
+
+def count_page_contactos_sql(**filtros):
+    """(sql, parámetros) del total de contactos que cumplen los filtros"""
+    where, params = _filtros_contactos(**filtros)
+    # La búsqueda por texto incluye el nombre de la institución; sin ella no hace falta el JOIN
+    sql = _COUNT_PAGE_CONTACTOS_TEXTO if (filtros.get("texto") or "").strip() else _COUNT_PAGE_CONTACTOS
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql, tuple(params)
+
+
+def count_page_contactos(**filtros):
+    """Total de contactos que cumplen los filtros de page_contactos"""
+    sql, params = count_page_contactos_sql(**filtros)
+    return _count(sql, params, _CONTACTO_KAM_TABLES)
+
+
+# -------------------------------
+# Contactos de Gmail
+# -------------------------------
+
+# Estado de la sincronización (ver utils/gmail_simple_contacts.py): hasta qué
+# UID se leyó cada carpeta del buzón de cada KAM. No pasan por la caché: la
+# sincronización siempre necesita el valor actual.
+SQL_GMAIL_SYNC = "SELECT carpeta, cuenta, uidvalidity, ultimo_uid, actualizado FROM gmail_sync WHERE kam_id = ?"
+SQL_GMAIL_SYNC_GUARDAR = """
+    INSERT INTO gmail_sync (kam_id, carpeta, cuenta, uidvalidity, ultimo_uid, actualizado)
+    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT (kam_id, carpeta) DO UPDATE SET
+        cuenta = excluded.cuenta,
+        uidvalidity = excluded.uidvalidity,
+        ultimo_uid = excluded.ultimo_uid,
+        actualizado = excluded.actualizado
+"""
+SQL_GMAIL_CONTACTOS_BORRAR_CARPETA = "DELETE FROM gmail_contactos WHERE kam_id = ? AND carpeta = ?"
+# Suma las apariciones de un bloque de correos a las ya guardadas
+SQL_GMAIL_CONTACTOS_SUMAR = """
+    INSERT INTO gmail_contactos (kam_id, carpeta, email_clave, email, nombre, frecuencia, ultimo_correo)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (kam_id, carpeta, email_clave) DO UPDATE SET
+        frecuencia = frecuencia + excluded.frecuencia,
+        nombre = CASE WHEN nombre = '' THEN excluded.nombre ELSE nombre END,
+        ultimo_correo = max(ultimo_correo, excluded.ultimo_correo)
+"""
+# Un contacto por dirección sumando todas las carpetas; MAX(nombre) prefiere un nombre no vacío
+SQL_GMAIL_CONTACTOS = """
+    SELECT MIN(email), MAX(nombre), SUM(frecuencia), MAX(ultimo_correo)
+    FROM gmail_contactos
+    WHERE kam_id = ?
+    GROUP BY email_clave
+    ORDER BY SUM(frecuencia) DESC, email_clave
+"""
+
+
+def gmail_sync(kam_id):
+    """Estado de la sincronización de Gmail del KAM: {carpeta: GmailCarpeta}"""
+    return {f[0]: GmailCarpeta(*f) for f in fetch_all(SQL_GMAIL_SYNC, (kam_id,))}
+
+
+def reiniciar_gmail_carpeta(kam_id, carpeta, cuenta, uidvalidity):
+    """Descarta lo acumulado de una carpeta para volver a leerla desde el primer UID"""
+    with transaction(tables=["gmail_contactos", "gmail_sync"]):
+        run_query(SQL_GMAIL_CONTACTOS_BORRAR_CARPETA, (kam_id, carpeta))
+        run_query(SQL_GMAIL_SYNC_GUARDAR, (kam_id, carpeta, cuenta, uidvalidity, 0))
+
+
+def guardar_bloque_gmail(kam_id, carpeta, cuenta, uidvalidity, ultimo_uid, contactos):
+    """Suma los contactos de un bloque de correos y avanza el último UID leído.
+
+    `contactos` son tuplas (email_clave, email, nombre, frecuencia,
+    ultimo_correo). Las dos escrituras van en la misma transacción: si la
+    sincronización se corta, el bloque no queda contado a medias y la
+    siguiente continúa desde el último bloque guardado.
+    """
+    with transaction(tables=["gmail_contactos", "gmail_sync"]):
+        run_many(SQL_GMAIL_CONTACTOS_SUMAR, [(kam_id, carpeta) + tuple(c) for c in contactos])
+        run_query(SQL_GMAIL_SYNC_GUARDAR, (kam_id, carpeta, cuenta, uidvalidity, ultimo_uid))
+
+
+def list_gmail_contactos(kam_id):
+    """Contactos acumulados del buzón del KAM, de mayor a menor frecuencia"""
+    return [GmailContacto(*f) for f in fetch_all(SQL_GMAIL_CONTACTOS, (kam_id,))]
+
+
+# -------------------------------
+# Roles
+# -------------------------------
+
+SQL_ROLES = "SELECT nombre FROM roles"
+SQL_INSERT_ROL = "INSERT INTO roles (nombre) VALUES (?)"
+SQL_INSERT_ROL_SI_NO_EXISTE = "INSERT OR IGNORE INTO roles (nombre) VALUES (?)"
+
+
+def list_roles():
+    """Nombres de los cargos/roles disponibles"""
+    return [r[0] for r in fetch_all_cached(SQL_ROLES, (), ("roles",))]
+
+
+def create_role(nombre):
+    run_query(SQL_INSERT_ROL, (nombre,))
+
+
+def create_roles(nombres):
+    """Crea los cargos que aún no existen"""
+    run_many(SQL_INSERT_ROL_SI_NO_EXISTE, [(n,) for n in nombres])
+
+
+# -------------------------------
+# Mensajes
+# -------------------------------
+
+_MENSAJE_COLS = "id, titulo, cuerpo, tipo, fecha_envio_programada, enviado"
+_MENSAJE_TABLES = ("mensajes",)
+
+SQL_MENSAJES = f"SELECT {_MENSAJE_COLS} FROM mensajes"
+SQL_MENSAJES_HISTORIAL = f"SELECT {_MENSAJE_COLS} FROM mensajes ORDER BY fecha_envio_programada DESC"
+SQL_MENSAJES_POR_TIPO = f"SELECT {_MENSAJE_COLS} FROM mensajes WHERE tipo = ?"
+SQL_MENSAJE_BY_ID = f"SELECT {_MENSAJE_COLS} FROM mensajes WHERE id = ?"
+SQL_INSERT_MENSAJE = "INSERT INTO mensajes (titulo, cuerpo, tipo, fecha_envio_programada) VALUES (?, ?, ?, ?)"
+SQL_UPDATE_MENSAJE = "UPDATE mensajes SET titulo = ?, cuerpo = ?, tipo = ?, fecha_envio_programada = ? WHERE id = ?"
+SQL_DELETE_MENSAJE = "DELETE FROM mensajes WHERE id = ?"
+SQL_DELETE_MENSAJES = "DELETE FROM mensajes"
+
+
+def list_mensajes():
+    return _fetch_all(Mensaje, SQL_MENSAJES, (), _MENSAJE_TABLES)
+
+
+def list_mensajes_historial():
+    """Mensajes ordenados del más reciente al más antiguo"""
+    return _fetch_all(Mensaje, SQL_MENSAJES_HISTORIAL, (), _MENSAJE_TABLES)
+
+
+def list_mensajes_por_tipo(tipo):
+    return _fetch_all(Mensaje, SQL_MENSAJES_POR_TIPO, (tipo,), _MENSAJE_TABLES)
+
+
+def get_mensaje(mensaje_id):
+    return _fetch_one(Mensaje, SQL_MENSAJE_BY_ID, (mensaje_id,), _MENSAJE_TABLES)
+
+
+def create_mensaje(titulo, cuerpo, tipo, fecha_envio_programada):
+    return run_query(SQL_INSERT_MENSAJE, (titulo, cuerpo, tipo, fecha_envio_programada)).lastrowid
+
+
+def update_mensaje(mensaje_id, titulo, cuerpo, tipo, fecha_envio_programada):
+    run_query(SQL_UPDATE_MENSAJE, (titulo, cuerpo, tipo, fecha_envio_programada, mensaje_id))
+
+
+def delete_mensaje(mensaje_id):
+    run_query(SQL_DELETE_MENSAJE, (mensaje_id,))
+
+
+def delete_all_mensajes():
+    run_query(SQL_DELETE_MENSAJES)
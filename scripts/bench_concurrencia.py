@@ -0,0 +1,154 @@
+"""
+Benchmark de lectura/escritura concurrente por perfil de ajuste de SQLite.
+
+Simula varias sesiones KAM que insertan contactos mientras sesiones de
+administración leen el listado de contactos, y mide para cada perfil de
+utils.db.DB_PROFILES las operaciones por segundo, la latencia p50/p95 y los
+errores "database is locked".
+
+Se trabaja sobre una copia temporal de la base de datos (por defecto
+database/muyulab.db), así que el archivo original no se modifica.
+
+Uso:
+    python scripts/bench_concurrencia.py [--db database/muyulab.db]
+        [--profiles produccion,basico] [--writers 4] [--readers 4] [--seconds 5]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.db import DB_PROFILES, ConnectionPool, get_pool, transaction  # noqa: E402
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def prepare_copy(db_path, workdir, profile):
+    """Copia la BD, aplica migraciones y devuelve la ruta de la copia"""
+    os.makedirs(os.path.join(workdir, "database"), exist_ok=True)
+    copy_path = os.path.join(workdir, "database", "muyulab.db")
+    if os.path.exists(db_path):
+        shutil.copy2(db_path, copy_path)
+    from db_setup import migrate
+    migrate(db_path=copy_path, verbose=False)
+    # Garantizar al menos una institución a la que asignar los contactos
+    with transaction(copy_path) as cur:
+        cur.execute("SELECT id FROM instituciones LIMIT 1")
+        row = cur.fetchone()
+        if row is None:
+            cur.execute("INSERT INTO instituciones (nombre, ciudad) VALUES ('Benchmark', 'Quito')")
+            institucion_id = cur.lastrowid
+        else:
+            institucion_id = row[0]
+    get_pool(copy_path).close_all()
+    # El modo de diario es persistente: se fija aquí según el perfil
+    conn = sqlite3.connect(copy_path)
+    mode = conn.execute(f"PRAGMA journal_mode = {DB_PROFILES[profile].get('journal_mode', 'DELETE')}").fetchone()[0]
+    conn.close()
+    return copy_path, institucion_id, mode
+
+
+def run_profile(db_path, profile, writers, readers, seconds):
+    """Ejecuta la carga mixta con un perfil y devuelve las métricas"""
+    workdir = tempfile.mkdtemp(prefix=f"muyulab_bench_{profile}_")
+    try:
+        copy_path, institucion_id, journal_mode = prepare_copy(db_path, workdir, profile)
+        pool = ConnectionPool(copy_path, profile=profile)
+        stop = threading.Event()
+        lock = threading.Lock()
+        stats = {"write": [], "read": [], "locked": 0, "errors": 0}
+
+        def writer(n):
+            i = 0
+            while not stop.is_set():
+                i += 1
+                start = time.perf_counter()
+                try:
+                    with pool.transaction() as cur:
+                        cur.execute(
+                            "INSERT INTO contactos (nombre, apellidos, cargo, email, telefono, institucion_id) VALUES (?, ?, ?, ?, ?, ?)",
+                            (f"Bench {n}", str(i), "Directivo", f"bench{n}.{i}@muyulab.com", "0999999999", institucion_id)
+                        )
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        stats["write"].append(elapsed)
+                except sqlite3.OperationalError as e:
+                    with lock:
+                        stats["locked" if "locked" in str(e) else "errors"] += 1
+
+        def reader():
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    with pool.connection() as conn:
+                        conn.execute(
+                            "SELECT nombre, apellidos, cargo, email, telefono FROM contactos ORDER BY id DESC LIMIT 200"
+                        ).fetchall()
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        stats["read"].append(elapsed)
+                except sqlite3.OperationalError as e:
+                    with lock:
+                        stats["locked" if "locked" in str(e) else "errors"] += 1
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+        threads += [threading.Thread(target=reader) for _ in range(readers)]
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        pool.close_all()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {"profile": profile, "journal_mode": journal_mode}
+    for kind in ("write", "read"):
+        values = stats[kind]
+        result[f"{kind}_ops_s"] = len(values) / seconds
+        result[f"{kind}_p50_ms"] = statistics.median(values) * 1000 if values else 0.0
+        result[f"{kind}_p95_ms"] = _percentile(values, 95) * 1000
+    result["locked"] = stats["locked"]
+    result["errors"] = stats["errors"]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrente por perfil de SQLite")
+    parser.add_argument('--db', default=os.path.join(ROOT, 'database', 'muyulab.db'), help='Base de datos a copiar')
+    parser.add_argument('--profiles', default=",".join(DB_PROFILES), help='Perfiles separados por coma')
+    parser.add_argument('--writers', type=int, default=4, help='Hilos que insertan contactos')
+    parser.add_argument('--readers', type=int, default=4, help='Hilos que leen el listado')
+    parser.add_argument('--seconds', type=float, default=5, help='Duración de cada corrida')
+    args = parser.parse_args()
+
+    profiles = [p.strip() for p in args.profiles.split(",") if p.strip()]
+    unknown = [p for p in profiles if p not in DB_PROFILES]
+    if unknown:
+        print(f"ERROR: perfiles desconocidos: {', '.join(unknown)}")
+        sys.exit(1)
+
+    print(f"{'perfil':<12} {'diario':>7} {'esc/s':>8} {'esc p95':>9} {'lec/s':>8} {'lec p95':>9} {'locked':>7} {'otros':>6}")
+    for profile in profiles:
+        r = run_profile(os.path.abspath(args.db), profile, args.writers, args.readers, args.seconds)
+        print(f"{r['profile']:<12} {r['journal_mode']:>7} {r['write_ops_s']:>8.0f} {r['write_p95_ms']:>7.1f}ms "
+              f"{r['read_ops_s']:>8.0f} {r['read_p95_ms']:>7.1f}ms {r['locked']:>7} {r['errors']:>6}")
+
+
+if __name__ == '__main__':
+    main()
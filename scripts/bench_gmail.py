@@ -0,0 +1,105 @@
+"""
+Benchmark de la sincronización de contactos de Gmail según las conexiones IMAP.
+
+Levanta el servidor de scripts/servidor_imap_local.py con un buzón sintético
+(en otro proceso, para que no compita con la app por el GIL) y, para cada
+cantidad de conexiones, mide una sincronización completa (todo el buzón) y
+una repetida (sin correos nuevos) de
+utils.gmail_simple_contacts.sync_gmail_contacts. Informa los correos por
+segundo y verifica que todas las corridas acumulen los mismos contactos.
+
+Se trabaja sobre una copia temporal de la base de datos (por defecto
+database/muyulab.db), así que el archivo original no se modifica.
+
+Uso:
+    python scripts/bench_gmail.py [--db database/muyulab.db] [--correos 20000]
+        [--conexiones 1,2,4,8] [--latencia 50] [--ms_por_correo 0.3]
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils import db, gmail_simple_contacts as gmail  # noqa: E402
+from utils.db import get_pool, run_query  # noqa: E402
+from db_setup import migrate  # noqa: E402
+from modules import utils as dao  # noqa: E402
+
+USUARIO = "kam@muyulab.com"
+KAM_ID = 1
+
+
+def iniciar_servidor(args):
+    """Arranca el servidor IMAP local en un puerto libre; devuelve (proceso, puerto)"""
+    proceso = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "scripts", "servidor_imap_local.py"), "--puerto", "0",
+         "--correos", str(args.correos), "--latencia", str(args.latencia),
+         "--ms_por_correo", str(args.ms_por_correo), "--cuerpo_kb", "0"],
+        stdout=subprocess.PIPE, text=True)
+    # Primera línea: "Servidor IMAP en 127.0.0.1:<puerto> (...)"
+    puerto = re.search(r":(\d+) ", proceso.stdout.readline())
+    if not puerto:
+        proceso.kill()
+        raise SystemExit("ERROR: no arrancó el servidor IMAP local")
+    return proceso, int(puerto.group(1))
+
+
+def sincronizar(conexiones):
+    """Una sincronización; devuelve (correos nuevos, segundos)"""
+    start = time.perf_counter()
+    nuevos, error = gmail.sync_gmail_contacts(KAM_ID, USUARIO, "clave", connections=conexiones)
+    if error:
+        raise SystemExit(f"ERROR: {error}")
+    return nuevos, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la sincronización de Gmail por conexiones")
+    parser.add_argument('--db', default=os.path.join(ROOT, 'database', 'muyulab.db'), help='Base de datos a copiar')
+    parser.add_argument('--correos', type=int, default=20000, help='Correos del buzón sintético')
+    parser.add_argument('--conexiones', default="1,2,4,8", help='Cantidades de conexiones, separadas por coma')
+    parser.add_argument('--latencia', type=float, default=50, help='Demora de cada respuesta del servidor en ms')
+    parser.add_argument('--ms_por_correo', type=float, default=0.3, help='Demora del FETCH por correo en ms')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="muyulab_gmail_")
+    copy_path = os.path.join(workdir, "muyulab.db")
+    servidor, puerto = iniciar_servidor(args)
+    gmail.IMAP_HOST, gmail.IMAP_PORT = "127.0.0.1", puerto
+    try:
+        if os.path.exists(args.db):
+            shutil.copy2(args.db, copy_path)
+        migrate(db_path=copy_path, verbose=False)
+        db.DB_PATH = copy_path
+
+        print(f"Buzón: {args.correos:,} correos, latencia {args.latencia} ms, {args.ms_por_correo} ms por correo")
+        print(f"{'conexiones':>10} {'completa':>10} {'correos/s':>10} {'repetida':>10}")
+        referencia = None
+        for conexiones in [int(c) for c in args.conexiones.split(",")]:
+            run_query("DELETE FROM gmail_sync WHERE kam_id = ?", (KAM_ID,))
+            run_query("DELETE FROM gmail_contactos WHERE kam_id = ?", (KAM_ID,))
+            nuevos, completa = sincronizar(conexiones)
+            _, repetida = sincronizar(conexiones)
+            contactos = dao.list_gmail_contactos(KAM_ID)
+            if referencia is None:
+                referencia = contactos
+            elif contactos != referencia:
+                raise SystemExit(f"ERROR: con {conexiones} conexiones los contactos acumulados no coinciden")
+            print(f"{conexiones:>10} {completa:>9.2f}s {nuevos / completa:>10,.0f} {repetida * 1000:>8.0f}ms")
+        print(f"\n{len(referencia):,} contactos, iguales en todas las corridas")
+        get_pool(copy_path).close_all()
+    finally:
+        servidor.terminate()
+        servidor.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
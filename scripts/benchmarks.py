@@ -0,0 +1,355 @@
+"""
+Suite de benchmarks de la carga de trabajo del CRM.
+
+Mide, sobre una base de datos generada con scripts/generar_datos_sinteticos.py:
+
+    kam_panel_frio          consultas de un rerun del panel KAM, sin caché
+    kam_panel_cache         las mismas consultas servidas desde utils.query_cache
+    reruns_hilos            20 reruns de listados paginados, cada uno en un hilo nuevo (como Streamlit)
+    admin_listados          listados de KAMs, instituciones y contactos del admin
+    listados_paginados      total y primeras páginas de "Ver contactos" (admin y KAM)
+    importacion_csv         carga masiva de un CSV de contactos
+    validacion_importacion  validación de un archivo de 100.000 filas (sin escribir)
+    dedupe_asignaciones     scripts/dedupe_kam_institucion.py sobre pares repetidos
+    historial_mensajes      lectura del historial de mensajes del panel KAM
+    exportacion_csv         exportación de todos los contactos a CSV comprimido
+    exportacion_xlsx        exportación a Excel de los contactos de un KAM
+
+Todo se ejecuta sobre una copia temporal, así que la base de datos indicada no
+cambia. Los resultados (p50/p95/mín. en ms) se guardan como línea base en JSON;
+con --comparar se contrastan con una línea base anterior y el script termina
+con código 1 si alguna medición empeora más que la tolerancia.
+
+Uso:
+    python scripts/benchmarks.py --db database/muyulab_sintetica.db
+        [--repeticiones 5] [--solo kam_panel_frio,importacion_csv]
+        [--guardar benchmarks/linea_base.json]
+        [--comparar benchmarks/linea_base.json] [--tolerancia 0.25]
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+import pandas as pd  # noqa: E402
+
+from utils import db, perf, query_cache  # noqa: E402
+from utils.db import get_pool  # noqa: E402
+from db_setup import migrate  # noqa: E402
+from modules import exportacion, importacion, utils as dao  # noqa: E402
+
+# Filas del CSV sintético de la importación
+FILAS_IMPORTACION = 2000
+# Filas del archivo de la validación (solo se valida, no se escribe)
+FILAS_VALIDACION = 100000
+# Reruns de reruns_hilos
+RERUNS_HILOS = 20
+# Proporción de asignaciones KAM ↔ institución que se duplican para el dedupe
+PROPORCION_DUPLICADOS = 0.05
+
+
+class Contexto:
+    """Datos compartidos por los benchmarks (copia de la BD y muestras)"""
+
+    def __init__(self, db_path, seed=42):
+        self.db_path = db_path
+        self.rng = random.Random(seed)
+        conn = sqlite3.connect(db_path)
+        self.kam_emails = [r[0] for r in conn.execute(
+            "SELECT k.email FROM kams k WHERE EXISTS (SELECT 1 FROM kam_institucion ki WHERE ki.kam_id = k.id)")]
+        self.instituciones = [r[0] for r in conn.execute("SELECT nombre FROM instituciones ORDER BY RANDOM() LIMIT 500")]
+        self.totales = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                        for t in ("kams", "instituciones", "kam_institucion", "contactos", "mensajes")}
+        conn.close()
+        if not self.kam_emails:
+            raise SystemExit("La base de datos no tiene KAMs con instituciones asignadas; genera datos primero.")
+
+
+# -------------------------------
+# Benchmarks
+# -------------------------------
+
+def kam_panel(ctx):
+    """Lecturas de un rerun del panel KAM (pestaña Contactos)"""
+    kam = dao.get_kam_by_email(ctx.rng.choice(ctx.kam_emails))
+    dao.list_instituciones_kam(kam.id)
+    dao.list_roles()
+    dao.list_contactos_kam(kam.id)
+    dao.list_mensajes_por_tipo("Seguimiento")
+
+
+def bench_kam_panel_frio(ctx):
+    query_cache.clear()
+    kam_panel(ctx)
+
+
+def preparar_kam_panel_cache(ctx):
+    # Un KAM fijo para que todas las lecturas salgan de la caché caliente
+    ctx.rng = random.Random(0)
+    kam_panel(ctx)
+    ctx.rng = random.Random(0)
+
+
+def bench_kam_panel_cache(ctx):
+    kam_panel(ctx)
+    ctx.rng = random.Random(0)
+
+
+def bench_admin_listados(ctx):
+    query_cache.clear()
+    dao.list_kams()
+    dao.list_instituciones()
+    dao.list_contactos()
+
+
+def bench_listados_paginados(ctx):
+    """Conteo y cinco páginas consecutivas, como al recorrer el listado"""
+    query_cache.clear()
+    kam = dao.get_kam_by_email(ctx.rng.choice(ctx.kam_emails))
+    for orden, filtros in (("nombre", {}), ("institucion", {"kam_id": kam.id})):
+        dao.count_page_contactos(**filtros)
+        despues = None
+        for _ in range(5):
+            _, despues = dao.page_contactos(orden, despues=despues, **filtros)
+            if despues is None:
+                break
+
+
+def bench_reruns_hilos(ctx):
+    """Cada rerun en un hilo nuevo: las conexiones del pool, con sus PRAGMA y
+    sentencias preparadas, deben reutilizarse entre hilos"""
+    for _ in range(RERUNS_HILOS):
+        hilo = threading.Thread(target=bench_listados_paginados, args=(ctx,))
+        hilo.start()
+        hilo.join()
+
+
+def preparar_importacion(ctx):
+    """CSV sintético y limpieza de las filas de la repetición anterior"""
+    db.run_query("DELETE FROM contactos WHERE email LIKE 'bench.import.%'", db_path=ctx.db_path)
+    db.run_query("DELETE FROM instituciones WHERE nombre LIKE 'Institución Benchmark %'", db_path=ctx.db_path)
+    if getattr(ctx, "csv_importacion", None) is None:
+        filas = []
+        for i in range(FILAS_IMPORTACION):
+            # Una de cada diez filas apunta a una institución nueva
+            institucion = ctx.rng.choice(ctx.instituciones) if i % 10 else f"Institución Benchmark {i}"
+            filas.append({
+                "nombre": f"Nombre{i}", "apellidos": f"Apellido{i}", "cargo": "Directivo",
+                "email": f"bench.import.{i}@muyulab.com", "telefono": f"09{i:08d}", "institucion": institucion,
+            })
+        buffer = io.StringIO()
+        pd.DataFrame(filas).to_csv(buffer, index=False)
+        ctx.csv_importacion = buffer.getvalue().encode("utf-8")
+
+
+def bench_importacion_csv(ctx):
+    """Mismo recorrido que la carga masiva de los paneles: área de carga, validación y escritura"""
+    archivo = io.BytesIO(ctx.csv_importacion)
+    carga = importacion.cargar(importacion.leer_bloques(archivo, "bench.csv"), dao.list_instituciones())
+    importacion.escribir(carga)
+
+
+def preparar_validacion(ctx):
+    """Archivo grande en memoria (solo se valida, no se escribe)"""
+    if getattr(ctx, "df_validacion", None) is None:
+        rng = random.Random(7)
+        ctx.df_validacion = pd.DataFrame({
+            "nombre": [f"Nombre{i}" if i % 50 else "" for i in range(FILAS_VALIDACION)],
+            "apellidos": [f"Apellido{i}" for i in range(FILAS_VALIDACION)],
+            "cargo": [rng.choice(["Directivo", "Contraparte", "Cargo nuevo"]) for _ in range(FILAS_VALIDACION)],
+            "email": [f"valida.{i}@muyulab.com" if i % 40 else "sin-arroba" for i in range(FILAS_VALIDACION)],
+            "telefono": [f"09{i:08d}" for i in range(FILAS_VALIDACION)],
+            "institucion": [rng.choice(ctx.instituciones).upper() if i % 10 else f"Nueva {i % 500}"
+                            for i in range(FILAS_VALIDACION)],
+        })
+        ctx.instituciones_validacion = dao.list_instituciones()
+
+
+def bench_validacion_importacion(ctx):
+    carga = importacion.cargar(ctx.df_validacion, ctx.instituciones_validacion)
+    importacion.descartar(carga.id)
+
+
+def preparar_dedupe(ctx):
+    """Quita el índice único y repite una parte de las asignaciones"""
+    with db.transaction(ctx.db_path) as cur:
+        cur.execute("DROP INDEX IF EXISTS idx_kam_institucion_unique")
+        cur.execute(f"""
+            INSERT INTO kam_institucion (kam_id, institucion_id)
+            SELECT kam_id, institucion_id FROM kam_institucion
+            WHERE abs(random()) % 1000 < {int(PROPORCION_DUPLICADOS * 1000)}
+        """)
+
+
+def bench_dedupe_asignaciones(ctx):
+    """Recorrido de scripts/dedupe_kam_institucion.py con --run --keep first"""
+    import dedupe_kam_institucion as dedupe
+    with get_pool(ctx.db_path).connection() as conn:
+        for kam_id, inst_id, _ in dedupe.find_duplicates(conn):
+            rows = dedupe.get_rows_for_pair(conn, kam_id, inst_id)
+            dedupe.delete_rows(conn, [r[0] for r in rows[1:]])
+
+
+def terminar_dedupe(ctx):
+    db.run_query("CREATE UNIQUE INDEX IF NOT EXISTS idx_kam_institucion_unique ON kam_institucion (kam_id, institucion_id)",
+                 db_path=ctx.db_path)
+
+
+def bench_historial_mensajes(ctx):
+    query_cache.clear()
+    dao.list_mensajes_historial()
+
+
+def bench_exportacion_csv(ctx):
+    with tempfile.TemporaryFile() as archivo:
+        exportacion.exportar("contactos", archivo, "csv.gz")
+
+
+def bench_exportacion_xlsx(ctx):
+    kam = dao.get_kam_by_email(ctx.kam_emails[0])
+    with tempfile.TemporaryFile() as archivo:
+        exportacion.exportar("contactos", archivo, "xlsx", kam_id=kam.id)
+
+
+# nombre -> (función medida, preparación antes de cada repetición, cierre)
+BENCHMARKS = {
+    "kam_panel_frio": (bench_kam_panel_frio, None, None),
+    "kam_panel_cache": (bench_kam_panel_cache, preparar_kam_panel_cache, None),
+    "admin_listados": (bench_admin_listados, None, None),
+    "listados_paginados": (bench_listados_paginados, None, None),
+    "reruns_hilos": (bench_reruns_hilos, None, None),
+    "importacion_csv": (bench_importacion_csv, preparar_importacion, None),
+    "validacion_importacion": (bench_validacion_importacion, preparar_validacion, None),
+    "dedupe_asignaciones": (bench_dedupe_asignaciones, preparar_dedupe, terminar_dedupe),
+    "historial_mensajes": (bench_historial_mensajes, None, None),
+    "exportacion_csv": (bench_exportacion_csv, None, None),
+    "exportacion_xlsx": (bench_exportacion_xlsx, None, None),
+}
+
+
+# -------------------------------
+# Ejecución y líneas base
+# -------------------------------
+
+def medir(ctx, nombre, repeticiones):
+    funcion, preparar, terminar = BENCHMARKS[nombre]
+    tiempos = []
+    for _ in range(repeticiones):
+        if preparar:
+            preparar(ctx)
+        start = time.perf_counter()
+        funcion(ctx)
+        tiempos.append((time.perf_counter() - start) * 1000)
+    if terminar:
+        terminar(ctx)
+    return {
+        "repeticiones": repeticiones,
+        "p50_ms": round(perf.percentile(tiempos, 50), 3),
+        "p95_ms": round(perf.percentile(tiempos, 95), 3),
+        "min_ms": round(min(tiempos), 3),
+    }
+
+
+def comparar(actual, base, tolerancia):
+    """Lista de (nombre, p50 base, p50 actual, cambio relativo, empeoró)"""
+    filas = []
+    for nombre, resultado in actual["resultados"].items():
+        anterior = base.get("resultados", {}).get(nombre)
+        if not anterior:
+            continue
+        cambio = (resultado["p50_ms"] - anterior["p50_ms"]) / anterior["p50_ms"] if anterior["p50_ms"] else 0.0
+        filas.append((nombre, anterior["p50_ms"], resultado["p50_ms"], cambio, cambio > tolerancia))
+    return filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de la plataforma sobre datos sintéticos")
+    parser.add_argument('--db', default=os.path.join(ROOT, 'database', 'muyulab_sintetica.db'), help='Base de datos a copiar')
+    parser.add_argument('--repeticiones', type=int, default=5, help='Repeticiones por benchmark')
+    parser.add_argument('--solo', help='Benchmarks a ejecutar, separados por coma')
+    parser.add_argument('--guardar', help='Archivo JSON donde guardar los resultados como línea base')
+    parser.add_argument('--comparar', help='Línea base JSON contra la que comparar')
+    parser.add_argument('--tolerancia', type=float, default=0.25, help='Empeoramiento relativo del p50 admitido')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"ERROR: no existe {args.db}. Genera datos con scripts/generar_datos_sinteticos.py")
+        sys.exit(1)
+    nombres = [n.strip() for n in args.solo.split(",")] if args.solo else list(BENCHMARKS)
+    desconocidos = [n for n in nombres if n not in BENCHMARKS]
+    if desconocidos:
+        print(f"ERROR: benchmarks desconocidos: {', '.join(desconocidos)}")
+        sys.exit(1)
+
+    workdir = tempfile.mkdtemp(prefix="muyulab_bench_")
+    copy_path = os.path.join(workdir, "muyulab.db")
+    try:
+        origen = sqlite3.connect(args.db)
+        destino = sqlite3.connect(copy_path)
+        origen.backup(destino)
+        origen.close()
+        destino.close()
+        # Como al arrancar la app: la copia queda con las migraciones actuales
+        migrate(db_path=copy_path, verbose=False)
+
+        # Las funciones del DAO usan la base de datos por defecto
+        db.DB_PATH = copy_path
+        ctx = Contexto(copy_path)
+        print("Datos: " + ", ".join(f"{k}={v:,}" for k, v in ctx.totales.items()))
+        print(f"{'benchmark':<24} {'p50':>10} {'p95':>10} {'mín':>10}")
+        resultados = {}
+        for nombre in nombres:
+            r = medir(ctx, nombre, args.repeticiones)
+            resultados[nombre] = r
+            print(f"{nombre:<24} {r['p50_ms']:>8.1f}ms {r['p95_ms']:>8.1f}ms {r['min_ms']:>8.1f}ms")
+        get_pool(copy_path).close_all()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    actual = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "datos": ctx.totales,
+        "resultados": resultados,
+    }
+
+    if args.guardar:
+        carpeta = os.path.dirname(args.guardar)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        with open(args.guardar, "w", encoding="utf-8") as f:
+            json.dump(actual, f, indent=2, ensure_ascii=False)
+        print(f"\nLínea base guardada en {args.guardar}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+        if base.get("datos") != actual["datos"]:
+            print("\nAVISO: la línea base se midió con otros volúmenes de datos")
+        print(f"\n{'benchmark':<24} {'base p50':>10} {'actual':>10} {'cambio':>8}")
+        regresiones = 0
+        for nombre, antes, ahora, cambio, empeoro in comparar(actual, base, args.tolerancia):
+            marca = "  << REGRESIÓN" if empeoro else ""
+            print(f"{nombre:<24} {antes:>8.1f}ms {ahora:>8.1f}ms {cambio:>+7.0%}{marca}")
+            regresiones += empeoro
+        if regresiones:
+            print(f"\n{regresiones} benchmark(s) empeoraron más de {args.tolerancia:.0%}.")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
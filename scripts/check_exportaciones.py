@@ -0,0 +1,108 @@
+"""
+Guardarraíl de las descargas de exportaciones de los paneles.
+
+Para cada tipo ("contactos", "instituciones") y formato de
+modules/exportacion.py, con y sin KAM, genera el archivo con
+archivo_exportacion (lo que ejecuta st.download_button al pulsar el botón)
+y lo pasa por el mismo conversor que usa Streamlit para los datos diferidos.
+Falla (código de salida 1) si Streamlit no acepta el valor devuelto o si el
+archivo no se puede abrir o no trae todas las filas.
+
+Se trabaja sobre una copia temporal de la base de datos (por defecto
+database/muyulab.db) con las migraciones actuales, así que el archivo
+original no cambia.
+
+Uso:
+    python scripts/check_exportaciones.py [--db database/muyulab.db]
+"""
+import argparse
+import csv
+import gzip
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import openpyxl  # noqa: E402
+from streamlit.errors import StreamlitAPIException  # noqa: E402
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime  # noqa: E402
+
+from utils import db  # noqa: E402
+from utils.db import fetch_one, get_pool  # noqa: E402
+from db_setup import migrate  # noqa: E402
+from modules import exportacion  # noqa: E402
+
+
+def filas_xlsx(datos):
+    """Filas de datos (sin encabezado) de todas las hojas de un .xlsx"""
+    libro = openpyxl.load_workbook(io.BytesIO(datos), read_only=True)
+    try:
+        return sum(hoja.max_row - 1 for hoja in libro.worksheets)
+    finally:
+        libro.close()
+
+
+def filas_csv_gz(datos):
+    """Filas de datos (sin encabezado) de un .csv.gz"""
+    texto = gzip.decompress(datos).decode("utf-8-sig")
+    return sum(1 for _ in csv.reader(io.StringIO(texto))) - 1
+
+
+CONTAR_FILAS = {"xlsx": filas_xlsx, "csv.gz": filas_csv_gz}
+
+
+def comprobar(tipo, formato, kam_id):
+    """Devuelve None si la descarga funciona o el motivo del fallo"""
+    try:
+        datos, _ = convert_data_to_bytes_and_infer_mime(
+            exportacion.archivo_exportacion(tipo, formato, kam_id),
+            unsupported_error=StreamlitAPIException("tipo no soportado"))
+    except StreamlitAPIException as e:
+        return f"Streamlit no acepta el valor devuelto: {e}"
+    esperadas = exportacion.exportar(tipo, io.BytesIO(), formato, kam_id=kam_id)
+    try:
+        filas = CONTAR_FILAS[formato](datos)
+    except Exception as e:
+        return f"el archivo no se puede leer: {e}"
+    if filas != esperadas:
+        return f"{filas} filas en el archivo, se esperaban {esperadas}"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica que las descargas de exportaciones funcionen")
+    parser.add_argument('--db', default=os.path.join(ROOT, 'database', 'muyulab.db'), help='Base de datos a copiar')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="muyulab_export_")
+    copy_path = os.path.join(workdir, "muyulab.db")
+    try:
+        if os.path.exists(args.db):
+            shutil.copy2(args.db, copy_path)
+        migrate(db_path=copy_path, verbose=False)
+        db.DB_PATH = copy_path
+        kam = fetch_one("SELECT kam_id FROM kam_institucion LIMIT 1")
+        fallos = 0
+        for tipo in exportacion.EXPORTACIONES:
+            for formato in exportacion.FORMATOS:
+                for kam_id in (None, kam[0] if kam else None):
+                    motivo = comprobar(tipo, formato, kam_id)
+                    nombre = f"{tipo}.{formato}" + (f" (KAM {kam_id})" if kam_id else "")
+                    print(f"[{'OK ' if motivo is None else 'ERR'}] {nombre}" + (f": {motivo}" if motivo else ""))
+                    fallos += motivo is not None
+        get_pool(copy_path).close_all()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if fallos:
+        print(f"\n{fallos} descarga(s) fallan.")
+        sys.exit(1)
+    print("\nTodas las descargas de exportaciones funcionan.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Guardarraíl de planes de consulta para los paneles.
+
+Ejecuta EXPLAIN QUERY PLAN sobre las consultas filtradas de los paneles KAM y
+de administración y falla (código de salida 1) si alguna recorre completa la
+tabla `contactos`, `kam_institucion`, `gmail_contactos` o `gmail_sync`, o si
+SQLite tiene que construir un índice automático sobre ellas.
+
+Se trabaja sobre una copia temporal de la base de datos a la que se aplican el
+esquema y las migraciones actuales, de modo que el archivo original no cambia.
+Los listados completos sin filtro (selectboxes) no se incluyen: leer toda la
+tabla es precisamente lo que piden. Los listados paginados sin filtro sí
+recorren la tabla, pero deben hacerlo en el orden de un índice para que LIMIT
+corte tras una página: se marca como error que necesiten ordenar con un
+B-tree temporal. Se revisan todos los órdenes de ORDEN_CONTACTOS y
+ORDEN_INSTITUCIONES, y las páginas siguientes deben además buscar en el
+índice a partir del cursor en lugar de recorrerlo desde el principio.
+
+Uso:
+    python scripts/check_query_plans.py [--db database/muyulab.db] [--verbose]
+"""
+import argparse
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+
+from modules import importacion, utils as dao  # noqa: E402
+
+GUARDED_TABLES = {"contactos", "kam_institucion", "gmail_contactos", "gmail_sync"}
+
+# (nombre, sql, parámetros) de cada consulta filtrada de los paneles; el texto
+# sale de modules/utils.py para verificar exactamente lo que ejecuta la app
+DASHBOARD_QUERIES = [
+    ("kam: datos del KAM por email", dao.SQL_KAM_BY_EMAIL, ("kam@muyulab.com",)),
+    ("kam: instituciones asignadas", dao.SQL_INSTITUCIONES_KAM, (1,)),
+    ("kam: contactos del KAM", dao.SQL_CONTACTOS_KAM, (1,)),
+    ("kam: contactos de una institución", dao.SQL_CONTACTOS_INSTITUCION, (1,)),
+    ("kam: contacto por id", dao.SQL_CONTACTO_BY_ID, (1,)),
+    ("kam: mensajes pregrabados por tipo", dao.SQL_MENSAJES_POR_TIPO, ("Seguimiento",)),
+    ("importación: contactos ya existentes", dao.SQL_CONTACTOS_EXISTENTES, ('[["a@b.com", 1], ["c@d.com", 2]]',)),
+    ("importación: contactos existentes del área de carga", importacion.SQL_MARCAR_EXISTENTES, (1,)),
+    ("importación: cambios por campo del área de carga", importacion.SQL_CAMBIOS_POR_CAMPO, (1,)),
+    ("importación: institución por nombre", dao.SQL_INSTITUCION_ID_BY_NOMBRE, ("Institución",)),
+    ("gmail: estado de la sincronización del KAM", dao.SQL_GMAIL_SYNC, (1,)),
+    ("gmail: contactos acumulados del KAM", dao.SQL_GMAIL_CONTACTOS, (1,)),
+    ("admin: filas de un par kam/institución",
+     "SELECT id FROM kam_institucion WHERE kam_id = ? AND institucion_id = ? ORDER BY id", (1, 1)),
+    ("kam: página de contactos del KAM", *dao.page_contactos_sql("institucion", kam_id=1)),
+    ("kam: conteo de contactos del KAM", *dao.count_page_contactos_sql(kam_id=1)),
+]
+
+# Valor de ejemplo para el cursor de cada columna de orden (texto si no está aquí)
+CURSOR_EJEMPLO = {"id": 1, "institucion_id": 1}
+
+
+def _cursor(orden):
+    return tuple(CURSOR_EJEMPLO.get(attr, "M") for _, attr, _ in orden)
+
+
+# Páginas de los listados sin filtro en cada orden que ofrecen los paneles
+# (ORDEN_CONTACTOS y ORDEN_INSTITUCIONES), ascendente y descendente: la
+# primera y una posterior (con cursor)
+_LISTADOS = (("contactos", dao.ORDEN_CONTACTOS, dao.page_contactos_sql),
+             ("instituciones", dao.ORDEN_INSTITUCIONES, dao.page_instituciones_sql))
+PAGED_QUERIES = [
+    (f"admin: página de {nombre} por {orden}{' desc' if desc else ''}", *page_sql(orden, descendente=desc))
+    for nombre, ordenes, page_sql in _LISTADOS
+    for orden in ordenes
+    for desc in (False, True)
+]
+NEXT_PAGE_QUERIES = [
+    (f"admin: página de {nombre} por {orden}{' desc' if desc else ''} (siguiente)",
+     *page_sql(orden, descendente=desc, despues=_cursor(columnas)))
+    for nombre, ordenes, page_sql in _LISTADOS
+    for orden, columnas in ordenes.items()
+    for desc in (False, True)
+]
+
+_ALIAS_RE = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+_SQL_WORDS = {"WHERE", "JOIN", "ON", "GROUP", "ORDER", "LEFT", "INNER", "LIMIT", "HAVING"}
+
+
+def table_aliases(sql):
+    """Mapa alias -> tabla para las tablas del FROM/JOIN de una consulta"""
+    aliases = {}
+    for table, alias in _ALIAS_RE.findall(sql):
+        aliases[table] = table
+        if alias and alias.upper() not in _SQL_WORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def plan_violations(conn, sql, params):
+    """Devuelve (plan, lista de pasos que recorren tablas vigiladas)"""
+    aliases = table_aliases(sql)
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    violations = []
+    for detail in plan:
+        match = re.match(r"(SCAN|SEARCH) (\w+)", detail)
+        if not match:
+            continue
+        table = aliases.get(match.group(2), match.group(2))
+        if table not in GUARDED_TABLES:
+            continue
+        if match.group(1) == "SCAN" or "AUTOMATIC" in detail:
+            violations.append(detail)
+    return plan, violations
+
+
+def sort_violations(conn, sql, params):
+    """Devuelve (plan, pasos que ordenan con un B-tree temporal)"""
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    return plan, [detail for detail in plan if "TEMP B-TREE" in detail]
+
+
+def next_page_violations(conn, sql, params):
+    """Como sort_violations y además los pasos que recorren una tabla desde el
+    principio: la página siguiente debe buscar en el índice a partir del cursor"""
+    plan, violations = sort_violations(conn, sql, params)
+    return plan, violations + [detail for detail in plan if detail.startswith("SCAN ")]
+
+
+def prepare_database(db_path, workdir):
+    """Copia la BD a un directorio temporal y le aplica init_db()"""
+    os.makedirs(os.path.join(workdir, "database"), exist_ok=True)
+    if db_path and os.path.exists(db_path):
+        shutil.copy2(db_path, os.path.join(workdir, "database", "muyulab.db"))
+    os.chdir(workdir)
+    from db_setup import init_db
+    init_db()
+    return os.path.join(workdir, "database", "muyulab.db")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica que las consultas de los paneles usen índices")
+    parser.add_argument('--db', default=os.path.join(ROOT, 'database', 'muyulab.db'), help='Base de datos a copiar (por defecto la del proyecto)')
+    parser.add_argument('--verbose', action='store_true', help='Mostrar el plan completo de cada consulta')
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.db)
+    workdir = tempfile.mkdtemp(prefix="muyulab_plans_")
+    try:
+        copy_path = prepare_database(db_path, workdir)
+        conn = sqlite3.connect(copy_path)
+        failures = 0
+        checks = ([(q, plan_violations) for q in DASHBOARD_QUERIES] + [(q, sort_violations) for q in PAGED_QUERIES]
+                  + [(q, next_page_violations) for q in NEXT_PAGE_QUERIES])
+        for (name, sql, params), check in checks:
+            plan, violations = check(conn, sql, params)
+            status = "OK " if not violations else "ERR"
+            print(f"[{status}] {name}")
+            if args.verbose or violations:
+                for detail in plan:
+                    print(f"       {detail}")
+            failures += bool(violations)
+        conn.close()
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failures:
+        print(f"\n{failures} consulta(s) recorren completas contactos o kam_institucion, o paginan sin índice.")
+        sys.exit(1)
+    print("\nTodas las consultas usan índices sobre contactos y kam_institucion y las páginas no ordenan en memoria.")
+
+
+if __name__ == '__main__':
+    main()
@@ -14,13 +14,15 @@ Opciones:
     --add-index  : Después de limpiar, crea un índice único (kam_id, institucion_id)
 
 """
-import sqlite3
 import argparse
 import shutil
 import os
 import sys
 from datetime import datetime
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.db import get_pool
+
 
 def backup_db(db_path):
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -62,29 +64,11 @@ def create_unique_index(conn):
     conn.commit()
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Dedupe kam_institucion y opcionalmente crear índice único")
-    parser.add_argument('--db', default='database/muyulab.db', help='Ruta al archivo de la base de datos sqlite')
-    parser.add_argument('--run', action='store_true', help='Ejecutar las eliminaciones (por defecto solo dry-run)')
-    parser.add_argument('--keep', choices=['first', 'last'], default='first', help='Qué fila conservar cuando hay duplicados')
-    parser.add_argument('--add-index', action='store_true', help='Crear índice único (kam_id, institucion_id) después de la limpieza')
-    args = parser.parse_args()
-
-    db_path = args.db
-    if not os.path.exists(db_path):
-        print(f"ERROR: No existe la base de datos en {db_path}")
-        sys.exit(1)
-
-    print(f"Usando DB: {db_path}")
-    backup_path = backup_db(db_path)
-    print(f"Backup creado en: {backup_path}")
-
-    conn = sqlite3.connect(db_path)
-
+def dedupe(conn, args):
+    """Lista (y con --run elimina) los pares repetidos y crea el índice si se pide"""
     dups = find_duplicates(conn)
     if not dups:
         print("No se encontraron pares (kam_id, institucion_id) duplicados.")
-        conn.close()
         return
 
     total_pairs = len(dups)
@@ -116,10 +100,31 @@ def main():
             print("Índice único creado: idx_kam_institucion_unique (kam_id, institucion_id)")
         else:
             print("--add-index se pasó pero no se está ejecutando (usa --run para aplicar cambios)")
-
-    conn.close()
     print("Hecho.")
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Dedupe kam_institucion y opcionalmente crear índice único")
+    parser.add_argument('--db', default='database/muyulab.db', help='Ruta al archivo de la base de datos sqlite')
+    parser.add_argument('--run', action='store_true', help='Ejecutar las eliminaciones (por defecto solo dry-run)')
+    parser.add_argument('--keep', choices=['first', 'last'], default='first', help='Qué fila conservar cuando hay duplicados')
+    parser.add_argument('--add-index', action='store_true', help='Crear índice único (kam_id, institucion_id) después de la limpieza')
+    args = parser.parse_args()
+
+    db_path = args.db
+    if not os.path.exists(db_path):
+        print(f"ERROR: No existe la base de datos en {db_path}")
+        sys.exit(1)
+
+    print(f"Usando DB: {db_path}")
+    backup_path = backup_db(db_path)
+    print(f"Backup creado en: {backup_path}")
+
+    pool = get_pool(db_path)
+    with pool.connection() as conn:
+        dedupe(conn, args)
+    pool.close_all()
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,63 @@
+"""
+Exportación de contactos o instituciones desde la línea de comandos.
+
+Usa el mismo camino que los botones de descarga de los paneles
+(modules/exportacion.py): las filas se leen del cursor por bloques y se
+escriben directamente en el archivo, así que la memoria no crece con la
+cantidad de contactos. El formato sale de la extensión del archivo.
+
+Uso:
+    python scripts/exportar_contactos.py contactos.xlsx [--db database/muyulab.db]
+        [--instituciones] [--kam kam@muyulab.com]
+
+Opciones:
+    --instituciones : Exporta las instituciones en lugar de los contactos
+    --kam           : Solo las instituciones asignadas a ese KAM y sus contactos
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import db  # noqa: E402
+from modules import exportacion, utils as dao  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta contactos o instituciones a Excel o CSV comprimido")
+    parser.add_argument('archivo', help='Archivo de salida .xlsx o .csv.gz')
+    parser.add_argument('--db', default=db.DB_PATH, help='Ruta al archivo de la base de datos sqlite')
+    parser.add_argument('--instituciones', action='store_true', help='Exportar instituciones en lugar de contactos')
+    parser.add_argument('--kam', help='Email del KAM cuyas instituciones se exportan')
+    args = parser.parse_args()
+
+    formato = exportacion.formato_de(args.archivo)
+    if not formato:
+        print("ERROR: Formato no soportado. Usa un archivo .xlsx o .csv.gz")
+        sys.exit(1)
+    if not os.path.exists(args.db):
+        print(f"ERROR: No existe la base de datos en {args.db}")
+        sys.exit(1)
+    db.DB_PATH = args.db
+
+    kam_id = None
+    if args.kam:
+        kam = dao.get_kam_by_email(args.kam)
+        if not kam:
+            print(f"ERROR: No existe un KAM con email {args.kam}")
+            sys.exit(1)
+        kam_id = kam.id
+
+    def avance(filas):
+        print(f"\r{filas:,} filas", end="", flush=True)
+
+    tipo = "instituciones" if args.instituciones else "contactos"
+    inicio = time.perf_counter()
+    total = exportacion.exportar(tipo, args.archivo, formato, kam_id=kam_id, progreso=avance)
+    print(f"\rExportadas {total:,} filas de {tipo} a {args.archivo} en {time.perf_counter() - inicio:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
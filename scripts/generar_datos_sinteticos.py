@@ -0,0 +1,218 @@
+"""
+Generador de datos sintéticos para medir la plataforma a escala real.
+
+Crea (o amplía) una base de datos con el esquema de db_setup y la llena con
+KAMs, instituciones, asignaciones KAM ↔ institución, contactos y mensajes con
+valores verosímiles. Los volúmenes se eligen con un preset o uno a uno.
+
+Presets (kams / instituciones / contactos / mensajes):
+    pequeno   10 /  1.000 /    20.000 /    50.000
+    mediano   30 /  5.000 /   200.000 /   500.000
+    grande    50 / 20.000 / 1.000.000 / 5.000.000
+
+Uso:
+    python scripts/generar_datos_sinteticos.py [--db database/muyulab_sintetica.db]
+        [--preset pequeno] [--kams N] [--instituciones N] [--contactos N]
+        [--mensajes N] [--seed 42] [--reemplazar]
+
+No se debe apuntar a database/muyulab.db: los datos son ficticios.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from db_setup import migrate  # noqa: E402
+from modules import utils as dao  # noqa: E402
+from utils.auth import hash_password  # noqa: E402
+
+PRESETS = {
+    "pequeno": {"kams": 10, "instituciones": 1000, "contactos": 20000, "mensajes": 50000},
+    "mediano": {"kams": 30, "instituciones": 5000, "contactos": 200000, "mensajes": 500000},
+    "grande": {"kams": 50, "instituciones": 20000, "contactos": 1000000, "mensajes": 5000000},
+}
+
+# Filas por executemany/commit durante la carga
+BATCH_SIZE = 50000
+
+NOMBRES = ["María", "José", "Ana", "Luis", "Carmen", "Jorge", "Lucía", "Carlos", "Rosa", "Pedro",
+           "Sofía", "Miguel", "Valentina", "Andrés", "Gabriela", "Diego", "Paola", "Fernando",
+           "Daniela", "Santiago", "Verónica", "Ricardo", "Camila", "Javier", "Mónica", "Esteban"]
+APELLIDOS = ["García", "Rodríguez", "López", "Pérez", "Sánchez", "Ramírez", "Torres", "Flores",
+             "Vera", "Zambrano", "Cedeño", "Mendoza", "Villegas", "Andrade", "Castillo", "Moreira",
+             "Ortiz", "Jaramillo", "Salazar", "Intriago", "Chávez", "Guerrero", "Molina", "Paredes"]
+PREFIJOS_INSTITUCION = ["Unidad Educativa", "U.E.", "Escuela", "Colegio", "Unidad Educativa Particular",
+                        "Escuela Fiscal", "Colegio Nacional", "Instituto"]
+CIUDADES = [("Quito", "Pichincha"), ("Guayaquil", "Guayas"), ("Cuenca", "Azuay"), ("Manta", "Manabí"),
+            ("Portoviejo", "Manabí"), ("Ambato", "Tungurahua"), ("Loja", "Loja"), ("Ibarra", "Imbabura"),
+            ("Machala", "El Oro"), ("Riobamba", "Chimborazo"), ("Esmeraldas", "Esmeraldas")]
+CARGOS = ["Directivo", "Contraparte", "Líder pedagógico", "Docente acompañado", "Usuario Muyu App"]
+TIPOS_MENSAJE = ["Seguimiento", "Recordatorio de agenda", "Entrega de informe", "Motivacional",
+                 "Resolución de dudas", "Tendencias"]
+TIPOS_PROGRAMA = ["Muyu Lab", "Muyu App", "Muyu Scalelab"]
+DOMINIOS = ["gmail.com", "hotmail.com", "outlook.com", "educacion.gob.ec", "yahoo.com"]
+
+
+def _sin_tildes(texto):
+    return texto.translate(str.maketrans("áéíóúñÁÉÍÓÚÑ", "aeiounAEIOUN")).lower()
+
+
+def _batches(rows, size=BATCH_SIZE):
+    """Agrupa un generador de filas en listas de `size` elementos"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(conn, sql, rows, etiqueta, total):
+    """Inserta por lotes mostrando el avance"""
+    start = time.perf_counter()
+    done = 0
+    for batch in _batches(rows):
+        conn.executemany(sql, batch)
+        conn.commit()
+        done += len(batch)
+        print(f"\r  {etiqueta}: {done:,}/{total:,}", end="", flush=True)
+    print(f"\r  {etiqueta}: {done:,} filas en {time.perf_counter() - start:.1f} s")
+
+
+def generar_kams(rng, n, offset):
+    password = hash_password("kam12345")
+    for i in range(offset, offset + n):
+        nombre = f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}"
+        email = f"kam{i}@muyulab.com"
+        yield (nombre, email, f"09{rng.randrange(10**8):08d}", None, None), (nombre, email, password, "KAM")
+
+
+def generar_instituciones(rng, n, offset):
+    for i in range(offset, offset + n):
+        ciudad, provincia = rng.choice(CIUDADES)
+        nombre = f"{rng.choice(PREFIJOS_INSTITUCION)} {rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)} N° {i}"
+        yield (nombre, f"Calle {rng.randrange(1, 200)} y Av. {rng.choice(APELLIDOS)}", ciudad, provincia,
+               "Ecuador", f"Año {rng.randrange(1, 7)}", rng.choice(TIPOS_PROGRAMA), rng.choice(["Pago", "Apadrinado"]))
+
+
+def generar_asignaciones(rng, kam_ids, inst_ids):
+    """Cada institución con un KAM; una de cada diez con un segundo KAM"""
+    for inst_id in inst_ids:
+        kams = rng.sample(kam_ids, 2 if len(kam_ids) > 1 and rng.random() < 0.1 else 1)
+        for kam_id in kams:
+            yield (kam_id, inst_id)
+
+
+def generar_contactos(rng, n, inst_ids, offset):
+    for i in range(offset, offset + n):
+        nombre = rng.choice(NOMBRES)
+        apellidos = f"{rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)}"
+        email = f"{_sin_tildes(nombre)}.{_sin_tildes(apellidos.split()[0])}{i}@{rng.choice(DOMINIOS)}"
+        yield (nombre, apellidos, rng.choice(CARGOS), email, f"09{rng.randrange(10**8):08d}", rng.choice(inst_ids))
+
+
+def generar_mensajes(rng, n):
+    inicio = datetime(2024, 1, 1)
+    for _ in range(n):
+        nombre = rng.choice(NOMBRES)
+        tipo = rng.choice(TIPOS_MENSAJE)
+        fecha = inicio + timedelta(minutes=rng.randrange(60 * 24 * 700))
+        cuerpo = (f"Hola {nombre},\n\nTe escribimos para dar {tipo.lower()} al programa Muyu Lab "
+                  f"en tu institución. Quedamos atentos a tus comentarios.")
+        yield (f"{tipo} {fecha:%d/%m}", cuerpo, tipo, fecha.strftime("%Y-%m-%d %H:%M:%S"), int(fecha < datetime(2025, 6, 1)))
+
+
+def _max_id(conn, table):
+    return conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+
+
+def generar(db_path, kams, instituciones, contactos, mensajes, seed=42):
+    """Llena la base de datos indicada y devuelve el total de filas por tabla"""
+    rng = random.Random(seed)
+    carpeta = os.path.dirname(db_path)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    migrate(db_path=db_path, verbose=False)
+
+    conn = sqlite3.connect(db_path)
+    # Carga masiva: sin fsync por transacción (el archivo es desechable)
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -262144")
+
+    offset = _max_id(conn, "kams") + 1
+    filas = list(generar_kams(rng, kams, offset))
+    conn.executemany("INSERT INTO kams (nombre, email, telefono, email_usuario, email_password) VALUES (?, ?, ?, ?, ?)",
+                     [k for k, _ in filas])
+    conn.executemany("INSERT OR IGNORE INTO users (nombre, email, password, rol) VALUES (?, ?, ?, ?)",
+                     [u for _, u in filas])
+    conn.commit()
+    print(f"  kams: {kams:,} filas")
+
+    primer_inst = _max_id(conn, "instituciones") + 1
+    _insert(conn, "INSERT INTO instituciones (nombre, direccion, ciudad, provincia, pais, anio_programa, tipo_programa, plan) "
+                  "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            generar_instituciones(rng, instituciones, primer_inst), "instituciones", instituciones)
+
+    kam_ids = [r[0] for r in conn.execute("SELECT id FROM kams")]
+    nuevas = [r[0] for r in conn.execute("SELECT id FROM instituciones WHERE id >= ?", (primer_inst,))]
+    asignaciones = list(generar_asignaciones(rng, kam_ids, nuevas))
+    _insert(conn, "INSERT OR IGNORE INTO kam_institucion (kam_id, institucion_id) VALUES (?, ?)",
+            asignaciones, "kam_institucion", len(asignaciones))
+
+    inst_ids = [r[0] for r in conn.execute("SELECT id FROM instituciones")]
+    if contactos and inst_ids:
+        _insert(conn, "INSERT INTO contactos (nombre, apellidos, cargo, email, telefono, institucion_id) VALUES (?, ?, ?, ?, ?, ?)",
+                generar_contactos(rng, contactos, inst_ids, _max_id(conn, "contactos") + 1), "contactos", contactos)
+    _insert(conn, "INSERT INTO mensajes (titulo, cuerpo, tipo, fecha_envio_programada, enviado) VALUES (?, ?, ?, ?, ?)",
+            generar_mensajes(rng, mensajes), "mensajes", mensajes)
+
+    conn.execute("ANALYZE")
+    conn.commit()
+    totales = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+               for t in ("kams", "instituciones", "kam_institucion", "contactos", "mensajes")}
+    conn.close()
+    # Claves normalizadas y trigramas, como los tendrían las instituciones creadas desde la app
+    dao.sincronizar_claves_instituciones(db_path=db_path)
+    return totales
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera datos sintéticos con el esquema de la plataforma")
+    parser.add_argument('--db', default=os.path.join(ROOT, 'database', 'muyulab_sintetica.db'), help='Base de datos a generar')
+    parser.add_argument('--preset', choices=list(PRESETS), default='pequeno', help='Volúmenes predefinidos')
+    for tabla in ("kams", "instituciones", "contactos", "mensajes"):
+        parser.add_argument(f'--{tabla}', type=int, help=f'Cantidad de {tabla} (sustituye al preset)')
+    parser.add_argument('--seed', type=int, default=42, help='Semilla para obtener siempre los mismos datos')
+    parser.add_argument('--reemplazar', action='store_true', help='Borrar la base de datos si ya existe')
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.db)
+    if os.path.abspath(db_path) == os.path.abspath(os.path.join(ROOT, 'database', 'muyulab.db')):
+        print("ERROR: no se generan datos sintéticos sobre la base de datos real")
+        sys.exit(1)
+    if args.reemplazar:
+        for sufijo in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + sufijo):
+                os.remove(db_path + sufijo)
+
+    volumenes = dict(PRESETS[args.preset])
+    for tabla in volumenes:
+        if getattr(args, tabla) is not None:
+            volumenes[tabla] = getattr(args, tabla)
+
+    print(f"Generando en {db_path}: " + ", ".join(f"{k}={v:,}" for k, v in volumenes.items()))
+    start = time.perf_counter()
+    totales = generar(db_path, seed=args.seed, **volumenes)
+    print(f"Listo en {time.perf_counter() - start:.1f} s. Totales: " + ", ".join(f"{k}={v:,}" for k, v in totales.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Carga masiva de contactos desde la línea de comandos.
+
+Usa el mismo camino que la carga masiva de los paneles (modules/importacion.py):
+lee el archivo por bloques en el área de carga, muestra el resumen de la
+validación y, con --run, inserta los contactos nuevos en una sola transacción
+(se omiten los repetidos dentro del archivo y, salvo con --actualizar, los que
+ya existen). Sin --run la carga se descarta. Sirve para
+cargas grandes, para refrescar periódicamente los datos de contactos y para
+medir la importación sin Streamlit.
+
+Uso:
+    python scripts/importar_contactos.py contactos.csv [--db database/muyulab.db] [--run]
+        [--actualizar] [--kam kam@muyulab.com] [--errores 20]
+
+Opciones:
+    --run         : Inserta los contactos nuevos (por defecto solo valida)
+    --actualizar  : Actualiza también los contactos existentes que traen cambios
+                    (nombre, apellidos, cargo o teléfono; las celdas vacías no borran datos)
+    --kam         : Resuelve las instituciones contra las asignadas a ese KAM, como el panel de KAM
+    --errores     : Filas con errores y cambios que se listan (por defecto 20)
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_setup import migrate  # noqa: E402
+from utils import db  # noqa: E402
+from modules import importacion, utils as dao  # noqa: E402
+
+
+def mostrar_validacion(validacion, max_errores):
+    print(f"Filas: {validacion.total:,} · válidas: {validacion.validos:,} · con errores: {validacion.invalidos:,}")
+    print(f"Nuevos: {validacion.nuevos:,} · ya existen: {validacion.existentes:,} · "
+          f"con cambios: {validacion.cambiados:,} · repetidos en el archivo: {validacion.duplicados:,}")
+    if validacion.instituciones_nuevas:
+        print(f"Instituciones nuevas ({len(validacion.instituciones_nuevas)}): "
+              f"{', '.join(validacion.instituciones_nuevas[:20])}")
+        for nombre, (parecida, parecido) in list(validacion.sugerencias.items())[:20]:
+            print(f"  ¿'{nombre}' es '{parecida.nombre.strip()}'? ({parecido:.0%} de parecido)")
+    if validacion.cargos_nuevos:
+        print(f"Cargos nuevos ({len(validacion.cargos_nuevos)}): {', '.join(validacion.cargos_nuevos[:20])}")
+    errores = validacion.muestra_errores.head(max_errores)
+    for fila, email, mensaje in zip(errores["fila"], errores["email"], errores["errores"]):
+        print(f"  fila {fila}: {mensaje} ({email or 'sin email'})")
+    if validacion.invalidos > len(errores):
+        print(f"  ... y {validacion.invalidos - len(errores):,} filas más con errores")
+    if validacion.cambiados:
+        print("Cambios por campo: " + ", ".join(f"{campo} {n:,}" for campo, n in validacion.cambios_por_campo.items()))
+        cambios = validacion.muestra_cambios.head(max_errores)
+        for fila, email, campo, antes, despues in zip(cambios["Fila"], cambios["Email"], cambios["Campo"],
+                                                     cambios["Antes"], cambios["Después"]):
+            print(f"  fila {fila} ({email}): {campo} '{antes}' -> '{despues}'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga masiva de contactos desde CSV o Excel")
+    parser.add_argument('archivo', help='Archivo .csv o .xlsx')
+    parser.add_argument('--db', default=db.DB_PATH, help='Ruta al archivo de la base de datos sqlite')
+    parser.add_argument('--run', action='store_true', help='Insertar los contactos nuevos (por defecto solo valida)')
+    parser.add_argument('--actualizar', action='store_true',
+                        help='Actualizar los contactos existentes que traen cambios')
+    parser.add_argument('--kam', help='Email del KAM cuyas instituciones se usan')
+    parser.add_argument('--errores', type=int, default=20, help='Filas con errores y cambios que se listan')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.archivo):
+        print(f"ERROR: No existe el archivo {args.archivo}")
+        sys.exit(1)
+    if not importacion.formato_soportado(args.archivo):
+        print("ERROR: Formato de archivo no soportado. Usa CSV o Excel (.xlsx)")
+        sys.exit(1)
+    if not os.path.exists(args.db):
+        print(f"ERROR: No existe la base de datos en {args.db}")
+        sys.exit(1)
+    db.DB_PATH = args.db
+    # La carga usa la clave única de contactos (migración 6) y el área de carga (7)
+    migrate(db_path=args.db, verbose=False)
+
+    if args.kam:
+        kam = dao.get_kam_by_email(args.kam)
+        if not kam:
+            print(f"ERROR: No existe un KAM con email {args.kam}")
+            sys.exit(1)
+        instituciones = dao.list_instituciones_kam(kam.id)
+    else:
+        instituciones = dao.list_instituciones()
+
+    inicio = time.perf_counter()
+    validacion = importacion.cargar(importacion.leer_bloques(args.archivo), instituciones,
+                                    archivo=os.path.basename(args.archivo))
+    if validacion.faltantes:
+        print(f"ERROR: Faltan las columnas: {', '.join(validacion.faltantes)}")
+        sys.exit(1)
+    mostrar_validacion(validacion, args.errores)
+    print(f"Validación: {time.perf_counter() - inicio:.2f} s")
+
+    if not args.run:
+        importacion.descartar(validacion.id)
+        print("Solo validación (usa --run para insertar).")
+        return
+    if not validacion.nuevos + (validacion.cambiados if args.actualizar else 0):
+        importacion.descartar(validacion.id)
+        print("No hay contactos nuevos ni cambios para escribir.")
+        return
+
+    def avance(hechos, total, mensaje):
+        print(f"\r{mensaje}", end="", flush=True)
+
+    inicio = time.perf_counter()
+    resultado = importacion.escribir(validacion, actualizar=args.actualizar, progreso=avance)
+    print()
+    print(f"Insertados: {resultado['insertados']:,} · actualizados: {resultado['actualizados']:,} · "
+          f"ya existían: {resultado['existentes']:,} · "
+          f"repetidos: {resultado['duplicados']:,} · "
+          f"instituciones creadas: {len(resultado['instituciones_creadas'])} · "
+          f"cargos creados: {len(resultado['cargos_creados'])}")
+    print(f"Escritura: {time.perf_counter() - inicio:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""
+Servidor IMAP local de prueba para la importación desde Gmail.
+
+Implementa el subconjunto de IMAP4rev1 que usa utils/gmail_simple_contacts.py
+(LOGIN, LIST, SELECT/EXAMINE, SEARCH, FETCH y sus variantes UID) sobre
+buzones sintéticos en memoria, con las carpetas de Gmail. Sirve para probar
+y medir la extracción de contactos sin red ni credenciales reales: con
+--latencia cada respuesta se demora como si el servidor estuviera lejos, y
+con --cuerpo_kb cada correo lleva un cuerpo de ese tamaño (lo que cuesta
+descargar el mensaje completo). Con --ms_por_correo el FETCH tarda además
+ese tiempo por cada correo devuelto, como un servidor que entrega los
+mensajes a un ritmo limitado por conexión: es lo que gana leer por varias
+conexiones a la vez.
+
+Uso:
+    python scripts/servidor_imap_local.py [--puerto 1143] [--correos 2000]
+        [--latencia 50] [--ms_por_correo 0.2] [--cuerpo_kb 50] [--semilla 7]
+
+La app se conecta a él con MUYULAB_IMAP_HOST=127.0.0.1 y MUYULAB_IMAP_PORT=1143
+(sin SSL); usuario y contraseña pueden ser cualquiera.
+"""
+import argparse
+import random
+import re
+import socketserver
+import threading
+import time
+from email.utils import format_datetime, formataddr
+from datetime import datetime, timedelta, timezone
+
+UIDVALIDITY = 1
+CARPETAS = {
+    "INBOX": "",
+    "[Gmail]/Sent Mail": "\\Sent",
+    "[Gmail]/All Mail": "\\All",
+}
+
+_NOMBRES = ["Ana", "Luis", "María", "José", "Carmen", "Jorge", "Lucía", "Pedro", "Sofía", "Diego"]
+_APELLIDOS = ["Pérez", "López", "Andrade", "Chávez", "Rodríguez", "Vera", "Salazar", "Paredes"]
+_DOMINIOS = ["ue-sanjose.edu.ec", "colegio-vera.edu.ec", "gmail.com", "muyulab.com"]
+
+_COMANDO = re.compile(rb'(\S+) (UID )?(\S+) ?(.*)', re.IGNORECASE)
+_CAMPOS = re.compile(rb'BODY(?:\.PEEK)?\[HEADER\.FIELDS \(([^)]*)\)\]', re.IGNORECASE)
+
+
+def generar_buzones(correos, cuerpo_kb, usuario="kam@muyulab.com", semilla=7):
+    """{carpeta: [(uid, mensaje en bytes)]} con `correos` correos repartidos entre las carpetas"""
+    rng = random.Random(semilla)
+    personas = [(f"{rng.choice(_NOMBRES)} {rng.choice(_APELLIDOS)}", f"contacto{i}@{rng.choice(_DOMINIOS)}")
+                for i in range(max(correos // 10, 1))]
+    cuerpo = ("Texto de prueba del correo. " * 40 + "\r\n") * max(cuerpo_kb, 0)
+    inicio = datetime(2024, 1, 1, 8, 0, tzinfo=timezone(timedelta(hours=-5)))
+    buzones = {carpeta: [] for carpeta in CARPETAS}
+    enviados = list(CARPETAS)[1]
+    for i in range(correos):
+        carpeta = enviados if i % 3 == 0 else "INBOX"
+        nombre, direccion = rng.choice(personas)
+        # formataddr codifica los nombres con tildes (=?utf-8?...?=) como los clientes de correo
+        cc = ", ".join(formataddr(p) for p in rng.sample(personas, k=min(rng.randint(0, 2), len(personas))))
+        if carpeta == enviados:
+            remitente, destino = usuario, formataddr((nombre, direccion))
+        else:
+            remitente, destino = formataddr((nombre, direccion)), usuario
+        cabeceras = [
+            f"From: {remitente}",
+            f"To: {destino}",
+            f"Date: {format_datetime(inicio + timedelta(hours=i))}",
+            f"Subject: Seguimiento {i}",
+            f"Message-ID: <{i}@muyulab.test>",
+        ]
+        if cc:
+            cabeceras.insert(2, f"Cc: {cc}")
+        mensaje = ("\r\n".join(cabeceras) + "\r\n\r\n" + cuerpo).encode("utf-8")
+        # Los UIDs no son consecutivos, como en un buzón con correos borrados
+        buzones[carpeta].append((len(buzones[carpeta]) * 2 + 1, mensaje))
+        buzones["[Gmail]/All Mail"].append((len(buzones["[Gmail]/All Mail"]) + 1, mensaje))
+    return buzones
+
+
+def _conjunto(texto, maximo):
+    """Números de un conjunto IMAP ('1:5,7,10:*') hasta `maximo` (inclusive)"""
+    numeros = []
+    for parte in texto.split(","):
+        if ":" in parte:
+            desde, hasta = parte.split(":")
+            desde = maximo if desde == "*" else int(desde)
+            hasta = maximo if hasta == "*" else int(hasta)
+            desde, hasta = min(desde, hasta), max(desde, hasta)
+            numeros.extend(range(desde, min(hasta, maximo) + 1))
+        else:
+            numero = maximo if parte == "*" else int(parte)
+            if numero <= maximo:
+                numeros.append(numero)
+    return numeros
+
+
+def _cabeceras(mensaje, campos):
+    """Las cabeceras pedidas del mensaje, como las devuelve HEADER.FIELDS"""
+    cabecera = mensaje.split(b"\r\n\r\n", 1)[0]
+    pedidas = {c.upper() for c in campos}
+    lineas = [l for l in cabecera.split(b"\r\n") if l.split(b":", 1)[0].upper() in pedidas]
+    return b"\r\n".join(lineas) + b"\r\n\r\n"
+
+
+class ManejadorIMAP(socketserver.StreamRequestHandler):
+    """Una sesión IMAP: lee comandos por línea y responde sobre los buzones del servidor"""
+
+    # Las respuestas se escriben en varias partes; sin esto cada una espera al ACK retrasado del cliente
+    disable_nagle_algorithm = True
+
+    def enviar(self, datos):
+        self.wfile.write(datos)
+
+    def handle(self):
+        self.carpeta = None
+        self.enviar(b"* OK [CAPABILITY IMAP4rev1] Servidor IMAP local de Muyu Lab listo\r\n")
+        for linea in self.rfile:
+            partes = _COMANDO.match(linea.rstrip(b"\r\n"))
+            if not partes:
+                self.enviar(b"* BAD comando no reconocido\r\n")
+                continue
+            tag, uid, comando, args = partes.groups()
+            if self.server.latencia:
+                time.sleep(self.server.latencia)
+            metodo = getattr(self, "cmd_" + comando.decode().lower(), None)
+            if metodo is None:
+                self.enviar(tag + b" BAD comando no soportado\r\n")
+                continue
+            if metodo(tag, args, bool(uid)) == "salir":
+                break
+
+    def cmd_capability(self, tag, args, uid):
+        self.enviar(b"* CAPABILITY IMAP4rev1\r\n" + tag + b" OK CAPABILITY completado\r\n")
+
+    def cmd_noop(self, tag, args, uid):
+        self.enviar(tag + b" OK NOOP completado\r\n")
+
+    def cmd_login(self, tag, args, uid):
+        self.enviar(tag + b" OK LOGIN completado\r\n")
+
+    def cmd_logout(self, tag, args, uid):
+        self.enviar(b"* BYE\r\n" + tag + b" OK LOGOUT completado\r\n")
+        return "salir"
+
+    def cmd_list(self, tag, args, uid):
+        for carpeta, atributo in CARPETAS.items():
+            atributos = ("\\HasNoChildren " + atributo).strip()
+            self.enviar(f'* LIST ({atributos}) "/" "{carpeta}"\r\n'.encode())
+        self.enviar(tag + b" OK LIST completado\r\n")
+
+    def cmd_select(self, tag, args, uid):
+        carpeta = args.decode().strip().strip('"')
+        if carpeta not in self.server.buzones:
+            self.carpeta = None
+            self.enviar(tag + b" NO no existe la carpeta\r\n")
+            return
+        self.carpeta = self.server.buzones[carpeta]
+        siguiente = self.carpeta[-1][0] + 1 if self.carpeta else 1
+        self.enviar(f"* {len(self.carpeta)} EXISTS\r\n* 0 RECENT\r\n"
+                    f"* OK [UIDVALIDITY {UIDVALIDITY}] UIDs válidos\r\n"
+                    f"* OK [UIDNEXT {siguiente}] siguiente UID\r\n".encode()
+                    + tag + b" OK [READ-ONLY] SELECT completado\r\n")
+
+    cmd_examine = cmd_select
+
+    def cmd_close(self, tag, args, uid):
+        self.carpeta = None
+        self.enviar(tag + b" OK CLOSE completado\r\n")
+
+    def _mensajes(self, conjunto, uid):
+        """[(número de secuencia, uid, mensaje)] del conjunto pedido"""
+        if uid:
+            maximo = self.carpeta[-1][0] if self.carpeta else 0
+            pedidos = set(_conjunto(conjunto, maximo))
+            return [(n, u, m) for n, (u, m) in enumerate(self.carpeta, 1) if u in pedidos]
+        return [(n, *self.carpeta[n - 1]) for n in _conjunto(conjunto, len(self.carpeta)) if n >= 1]
+
+    def cmd_search(self, tag, args, uid):
+        if self.carpeta is None:
+            self.enviar(tag + b" BAD no hay carpeta seleccionada\r\n")
+            return
+        criterio = args.decode().upper().split()
+        if criterio and criterio[0] == "CHARSET":
+            criterio = criterio[2:]
+        if len(criterio) == 2 and criterio[0] == "UID":
+            encontrados = self._mensajes(criterio[1], True)
+        else:
+            encontrados = [(n, u, m) for n, (u, m) in enumerate(self.carpeta, 1)]
+        numeros = " ".join(str(u if uid else n) for n, u, _ in encontrados)
+        self.enviar(f"* SEARCH {numeros}\r\n".encode().replace(b" \r\n", b"\r\n")
+                    + tag + b" OK SEARCH completado\r\n")
+
+    def cmd_fetch(self, tag, args, uid):
+        if self.carpeta is None:
+            self.enviar(tag + b" BAD no hay carpeta seleccionada\r\n")
+            return
+        conjunto, _, items = args.partition(b" ")
+        campos = _CAMPOS.search(items)
+        completo = b"RFC822" in items.upper() and not campos
+        mensajes = self._mensajes(conjunto.decode(), uid)
+        if self.server.demora_correo:
+            time.sleep(self.server.demora_correo * len(mensajes))
+        for numero, uid_mensaje, mensaje in mensajes:
+            partes = []
+            if uid or b"UID" in items.upper():
+                partes.append(b"UID %d" % uid_mensaje)
+            if campos:
+                datos = _cabeceras(mensaje, campos.group(1).split())
+                partes.append(b"BODY[HEADER.FIELDS (" + campos.group(1).upper() + b")] {%d}\r\n" % len(datos) + datos)
+            elif completo:
+                partes.append(b"RFC822 {%d}\r\n" % len(mensaje) + mensaje)
+            self.enviar(b"* %d FETCH (" % numero + b" ".join(partes) + b")\r\n")
+        self.enviar(tag + b" OK FETCH completado\r\n")
+
+
+class ServidorIMAP(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, direccion, buzones, latencia=0.0, demora_correo=0.0):
+        super().__init__(direccion, ManejadorIMAP)
+        self.buzones = buzones
+        self.latencia = latencia
+        self.demora_correo = demora_correo
+
+
+def iniciar(puerto=0, correos=2000, latencia_ms=0, ms_por_correo=0, cuerpo_kb=50, semilla=7):
+    """Arranca el servidor en un hilo; devuelve (servidor, puerto). Se detiene con servidor.shutdown()"""
+    servidor = ServidorIMAP(("127.0.0.1", puerto), generar_buzones(correos, cuerpo_kb, semilla=semilla),
+                            latencia_ms / 1000, ms_por_correo / 1000)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, servidor.server_address[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor IMAP local con buzones sintéticos")
+    parser.add_argument('--puerto', type=int, default=1143, help='Puerto en 127.0.0.1')
+    parser.add_argument('--correos', type=int, default=2000, help='Correos en total (INBOX y enviados)')
+    parser.add_argument('--latencia', type=float, default=0, help='Demora de cada respuesta en ms')
+    parser.add_argument('--ms_por_correo', type=float, default=0, help='Demora del FETCH por cada correo devuelto, en ms')
+    parser.add_argument('--cuerpo_kb', type=int, default=50, help='Tamaño aproximado del cuerpo de cada correo')
+    parser.add_argument('--semilla', type=int, default=7, help='Semilla de los datos sintéticos')
+    args = parser.parse_args()
+
+    servidor = ServidorIMAP(("127.0.0.1", args.puerto), generar_buzones(args.correos, args.cuerpo_kb, semilla=args.semilla),
+                            args.latencia / 1000, args.ms_por_correo / 1000)
+    # Con --puerto 0 el sistema elige uno libre: se informa el real
+    print(f"Servidor IMAP en 127.0.0.1:{servidor.server_address[1]} ({args.correos:,} correos, latencia {args.latencia} ms)", flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    main()
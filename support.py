@@ -1,13 +1,12 @@
 import streamlit as st
-import sqlite3
 import json
 from datetime import datetime
 from openai import OpenAI
+from utils.db import run_query, fetch_all
 
-# Conexión a SQLite
-conn = sqlite3.connect("tickets.db")
-c = conn.cursor()
-c.execute("""CREATE TABLE IF NOT EXISTS tickets (
+# Base de datos de tickets (las conexiones las reutiliza el pool de utils.db)
+TICKETS_DB = "tickets.db"
+run_query("""CREATE TABLE IF NOT EXISTS tickets (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     usuario TEXT,
     descripcion TEXT,
@@ -16,8 +15,7 @@ c.execute("""CREATE TABLE IF NOT EXISTS tickets (
     prioridad TEXT,
     estado TEXT,
     fecha TEXT
-)""")
-conn.commit()
+)""", db_path=TICKETS_DB)
 
 # Cliente OpenAI
 client = OpenAI()
@@ -55,20 +53,20 @@ if st.button("Enviar incidencia"):
             raise ValueError("Missing required fields in OpenAI response")
         
         # Guardar en BD
-        c.execute("INSERT INTO tickets (usuario, descripcion, resumen, categoria, prioridad, estado, fecha) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                  (usuario, descripcion, datos["resumen"], datos["categoria"], datos["prioridad"], "nuevo", datetime.now().isoformat()))
-        conn.commit()
+        run_query("INSERT INTO tickets (usuario, descripcion, resumen, categoria, prioridad, estado, fecha) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                  (usuario, descripcion, datos["resumen"], datos["categoria"], datos["prioridad"], "nuevo", datetime.now().isoformat()),
+                  db_path=TICKETS_DB)
         st.success("✅ Incidencia registrada con éxito")
         
     except (json.JSONDecodeError, ValueError, KeyError) as e:
         st.error(f"❌ Error procesando la respuesta: {str(e)}")
         # Fallback: save with default values
-        c.execute("INSERT INTO tickets (usuario, descripcion, resumen, categoria, prioridad, estado, fecha) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                  (usuario, descripcion, descripcion[:100], "general", "media", "nuevo", datetime.now().isoformat()))
-        conn.commit()
+        run_query("INSERT INTO tickets (usuario, descripcion, resumen, categoria, prioridad, estado, fecha) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                  (usuario, descripcion, descripcion[:100], "general", "media", "nuevo", datetime.now().isoformat()),
+                  db_path=TICKETS_DB)
         st.warning("⚠️ Incidencia guardada con valores por defecto")
 
 # Panel básico
 st.subheader("📊 Tickets registrados")
-tickets = c.execute("SELECT * FROM tickets").fetchall()
+tickets = fetch_all("SELECT * FROM tickets", db_path=TICKETS_DB)
 st.table(tickets)
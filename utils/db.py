@@ -0,0 +1,460 @@
+"""
+Capa de conexión compartida a SQLite.
+
+Cada base de datos tiene un pool acotado (hasta POOL_SIZE conexiones) del
+que cada operación toma una conexión libre y al que la devuelve al terminar.
+Streamlit ejecuta cada rerun en un hilo nuevo, así que las conexiones no se
+atan a los hilos: el rerun siguiente, o la sesión de otro usuario, reutiliza
+la misma conexión con sus PRAGMA ya aplicados y sus sentencias preparadas.
+
+Al abrir cada conexión se aplica un perfil de ajuste (WAL, busy_timeout,
+mmap, caché...). El perfil se elige con la variable de entorno
+MUYULAB_DB_PROFILE; por defecto se usa "produccion".
+
+Las escrituras hechas con estas funciones invalidan en utils.query_cache los
+resultados de las tablas afectadas (ver fetch_all_cached). Las escrituras de
+otros procesos (otro servidor de Streamlit, scripts de mantenimiento) se
+detectan con PRAGMA data_version y la tabla `cambios` (ver sync_changes).
+Cada llamada queda registrada en utils.perf (duración, filas y origen).
+"""
+
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from utils import perf, query_cache
+
+DB_PATH = "database/muyulab.db"
+
+# Perfiles de ajuste aplicados con PRAGMA a cada conexión nueva
+DB_PROFILES = {
+    # Lectores y escritores concurrentes sin "database is locked"
+    "produccion": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,   # 256 MB
+        "cache_size": -65536,     # 64 MB (en KiB si es negativo)
+        "temp_store": "MEMORY",
+    },
+    # WAL con menos memoria, para equipos de desarrollo
+    "desarrollo": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "temp_store": "MEMORY",
+    },
+    # Valores por defecto de SQLite (diario rollback); sirve de referencia
+    "basico": {},
+}
+DEFAULT_PROFILE = "produccion"
+
+# Sentencias preparadas que conserva cada conexión (sqlite3 usa 128 por defecto)
+STATEMENT_CACHE_SIZE = 256
+
+# Conexiones que abre como máximo cada pool y segundos que se espera una libre
+POOL_SIZE = 8
+POOL_TIMEOUT = 30
+
+# Tabla afectada por una sentencia de escritura (para invalidar la caché)
+_WRITE_RE = re.compile(
+    r"^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+[\"`\[]?(\w+)",
+    re.IGNORECASE
+)
+_DDL_RE = re.compile(r"^\s*(?:CREATE|ALTER|DROP)\b", re.IGNORECASE)
+
+# Orden de aplicación: busy_timeout primero para que el cambio a WAL espere
+# si otra conexión tiene la base de datos bloqueada.
+_PRAGMA_ORDER = ("busy_timeout", "journal_mode", "synchronous", "mmap_size", "cache_size", "temp_store")
+
+
+def get_profile_name():
+    """Perfil configurado en MUYULAB_DB_PROFILE (o el de por defecto)"""
+    name = os.environ.get("MUYULAB_DB_PROFILE", DEFAULT_PROFILE).strip().lower()
+    return name if name in DB_PROFILES else DEFAULT_PROFILE
+
+
+def apply_profile(conn, profile=None):
+    """Aplica a una conexión los PRAGMA del perfil indicado"""
+    settings = DB_PROFILES[profile or get_profile_name()]
+    for pragma in _PRAGMA_ORDER:
+        if pragma not in settings:
+            continue
+        try:
+            conn.execute(f"PRAGMA {pragma} = {settings[pragma]}")
+        except sqlite3.OperationalError:
+            # Por ejemplo, no se puede pasar a WAL mientras otro proceso
+            # mantiene un bloqueo; la conexión sigue siendo válida.
+            pass
+    return conn
+
+
+class ConnectionPool:
+    """Pool acotado de conexiones SQLite que se prestan y se devuelven.
+
+    Las conexiones libres esperan en una cola y se abren a medida que hacen
+    falta, hasta `size`. El préstamo es reentrante dentro de un hilo: las
+    llamadas anidadas, y todo un bloque transaction(), usan la conexión que
+    el hilo ya tiene prestada.
+    """
+
+    def __init__(self, db_path, profile=None, size=POOL_SIZE):
+        self.db_path = db_path
+        self.profile = profile or get_profile_name()
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._connections = []
+        # Conexión prestada al hilo actual y profundidad de transaction()
+        self._local = threading.local()
+        # Conexión aparte que solo lee PRAGMA data_version y la tabla cambios
+        self._monitor = None
+        self._monitor_lock = threading.Lock()
+        self._data_version = None
+        self._schema_version = None
+        self._counters = None
+
+    def _connect(self):
+        """Abre una conexión nueva a la base de datos del pool"""
+        carpeta = os.path.dirname(self.db_path)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        # check_same_thread=False: la conexión pasa de un hilo a otro, pero
+        # el pool garantiza que la use uno solo a la vez.
+        # cached_statements: las consultas de modules/utils.py se preparan una
+        # vez por conexión y se reutilizan mientras su texto sea el mismo.
+        conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        return apply_profile(conn, self.profile)
+
+    def _checkout(self):
+        """Toma una conexión libre, abre una nueva o espera a que se devuelva alguna"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            nueva = len(self._connections) < self.size
+            if nueva:
+                # Se reserva el lugar antes de conectar, fuera del lock
+                self._connections.append(None)
+        if not nueva:
+            try:
+                return self._idle.get(timeout=POOL_TIMEOUT)
+            except queue.Empty:
+                raise sqlite3.OperationalError(
+                    f"No hay conexiones libres para {self.db_path} ({self.size} en uso)") from None
+        try:
+            conn = self._connect()
+        except BaseException:
+            with self._lock:
+                self._connections.remove(None)
+            raise
+        with self._lock:
+            self._connections[self._connections.index(None)] = conn
+        return conn
+
+    def _checkin(self, conn):
+        """Devuelve una conexión a la cola, sin transacciones pendientes"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Conexión inservible (p. ej. cerrada por close_all): no vuelve
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Presta una conexión al hilo actual y la devuelve al salir"""
+        local = self._local
+        conn = getattr(local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+        conn = self._checkout()
+        local.conn, local.depth = conn, 0
+        try:
+            yield conn
+        finally:
+            if getattr(local, "conn", None) is conn:
+                local.conn, local.depth = None, 0
+            self._checkin(conn)
+
+    def in_transaction(self):
+        """Indica si el hilo actual está dentro de un bloque transaction()"""
+        return getattr(self._local, "depth", 0) > 0
+
+    @contextmanager
+    def transaction(self, immediate=False, tables=None):
+        """Bloque transaccional: confirma al salir o revierte si hay error.
+
+        Los bloques anidados se integran en la transacción más externa.
+        Con immediate=True se abre con BEGIN IMMEDIATE, de modo que también
+        las sentencias DDL quedan dentro de la transacción. Al cerrar el
+        bloque más externo se invalida la caché de consultas de esta base de
+        datos, porque el cursor entregado puede escribir en cualquier tabla;
+        si todos los bloques indican en `tables` las tablas que escriben,
+        solo se invalidan esas. La conexión queda prestada al hilo hasta
+        que termina el bloque.
+        """
+        with self.connection() as conn:
+            local = self._local
+            if immediate and local.depth == 0 and not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            if local.depth == 0:
+                local.tables = set()
+            if local.tables is not None:
+                local.tables = None if tables is None else local.tables | set(tables)
+            local.depth += 1
+            try:
+                yield conn.cursor()
+            except BaseException:
+                local.depth -= 1
+                if local.depth == 0:
+                    conn.rollback()
+                    self._invalidate_written()
+                raise
+            else:
+                local.depth -= 1
+                if local.depth == 0:
+                    conn.commit()
+                    self._invalidate_written()
+
+    def _invalidate_written(self):
+        """Invalida en la caché lo escrito por la transacción que termina"""
+        if self._local.tables is None:
+            query_cache.bump_all(self.db_path)
+        else:
+            query_cache.bump(self.db_path, self._local.tables)
+
+    def sync_changes(self):
+        """Invalida la caché de consultas si otra conexión modificó la BD.
+
+        PRAGMA data_version solo cambia cuando otra conexión (de este u otro
+        proceso) confirma una escritura, así que normalmente basta con leer
+        un entero. Si cambió, los contadores de la tabla `cambios`, que
+        mantienen los triggers, indican qué tablas invalidar. Un cambio de
+        esquema, o una BD sin tabla `cambios`, invalida todo.
+        """
+        with self._monitor_lock:
+            try:
+                if self._monitor is None:
+                    self._monitor = self._connect()
+                data_version = self._monitor.execute("PRAGMA data_version").fetchone()[0]
+                if data_version == self._data_version:
+                    return
+                schema_version = self._monitor.execute("PRAGMA schema_version").fetchone()[0]
+                try:
+                    counters = dict(self._monitor.execute("SELECT tabla, contador FROM cambios"))
+                except sqlite3.OperationalError:
+                    counters = None
+            except sqlite3.Error:
+                # Sin monitor no se puede confiar en lo guardado
+                query_cache.bump_all(self.db_path)
+                return
+            previous = self._counters
+            first = self._data_version is None
+            schema_changed = schema_version != self._schema_version
+            self._data_version = data_version
+            self._schema_version = schema_version
+            self._counters = counters
+        if first or schema_changed or counters is None or previous is None:
+            query_cache.bump_all(self.db_path)
+        else:
+            changed = [t for t, n in counters.items() if previous.get(t) != n]
+            if changed:
+                query_cache.bump(self.db_path, changed)
+
+    def close_all(self):
+        """Cierra todas las conexiones abiertas por el pool (no debe haber ninguna prestada)"""
+        with self._lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except (sqlite3.Error, AttributeError):
+                    pass
+            self._connections.clear()
+            self._idle = queue.LifoQueue()
+        with self._monitor_lock:
+            if self._monitor is not None:
+                try:
+                    self._monitor.close()
+                except sqlite3.Error:
+                    pass
+            self._monitor = None
+            self._data_version = None
+        self._local = threading.local()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path=None):
+    """Obtiene el pool del proceso para la base de datos indicada"""
+    db_path = db_path or DB_PATH
+    pool = _pools.get(db_path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(db_path, ConnectionPool(db_path))
+    return pool
+
+
+def connection(db_path=None):
+    """Context manager que presta una conexión del pool (no se debe cerrar)"""
+    return get_pool(db_path).connection()
+
+
+def transaction(db_path=None, immediate=False, tables=None):
+    """Context manager que entrega un cursor dentro de una transacción"""
+    return get_pool(db_path).transaction(immediate=immediate, tables=tables)
+
+
+def _execute(pool, conn, query, params=()):
+    """Ejecuta una sentencia en `conn` (confirmando fuera de transacción) y devuelve el cursor"""
+    cur = conn.cursor()
+    if pool.in_transaction():
+        cur.execute(query, params)
+        return cur
+    changes = conn.total_changes
+    try:
+        cur.execute(query, params)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if conn.total_changes != changes or _DDL_RE.match(query):
+        _invalidate(pool.db_path, query)
+    return cur
+
+
+def _invalidate(db_path, query):
+    """Invalida en la caché la tabla escrita por la sentencia (o toda la BD)"""
+    match = _WRITE_RE.match(query)
+    if match:
+        query_cache.bump(db_path, [match.group(1)])
+    else:
+        query_cache.bump_all(db_path)
+
+
+# Lo que devuelve run_query: la conexión ya ha vuelto al pool, así que no se
+# entrega el cursor (las lecturas van por fetch_all/fetch_one)
+Resultado = namedtuple("Resultado", ["rowcount", "lastrowid"])
+
+
+def run_query(query, params=(), db_path=None):
+    """Ejecuta una sentencia de escritura y devuelve Resultado(rowcount, lastrowid).
+
+    Fuera de un bloque transaction() las escrituras se confirman al
+    momento, igual que hacían los antiguos helpers de cada módulo.
+    """
+    start = time.perf_counter()
+    pool = get_pool(db_path)
+    with pool.connection() as conn:
+        cur = _execute(pool, conn, query, params)
+        resultado = Resultado(cur.rowcount, cur.lastrowid)
+        cur.close()
+    perf.record(query, start, rows=resultado.rowcount if resultado.rowcount >= 0 else None)
+    return resultado
+
+
+def run_insert_query(query, params=(), db_path=None):
+    """Función específica para inserts que asegura el commit"""
+    run_query(query, params, db_path=db_path)
+    return True
+
+
+def run_many(query, seq_params, db_path=None):
+    """executemany dentro de una única transacción (solo invalida la tabla escrita)"""
+    start = time.perf_counter()
+    match = _WRITE_RE.match(query)
+    with transaction(db_path, tables=[match.group(1)] if match else None) as cur:
+        cur.executemany(query, seq_params)
+        rowcount = cur.rowcount
+    perf.record(query, start, rows=rowcount)
+    return rowcount
+
+
+def fetch_all(query, params=(), db_path=None):
+    """Ejecuta un SELECT y devuelve todas las filas"""
+    start = time.perf_counter()
+    pool = get_pool(db_path)
+    with pool.connection() as conn:
+        rows = _execute(pool, conn, query, params).fetchall()
+    perf.record(query, start, rows=len(rows))
+    return rows
+
+
+def fetch_one(query, params=(), db_path=None):
+    """Ejecuta un SELECT y devuelve la primera fila (o None)"""
+    start = time.perf_counter()
+    pool = get_pool(db_path)
+    with pool.connection() as conn:
+        row = _execute(pool, conn, query, params).fetchone()
+    perf.record(query, start, rows=int(row is not None))
+    return row
+
+
+def iter_rows(query, params=(), db_path=None, size=1000):
+    """Ejecuta un SELECT y entrega las filas en bloques de `size` (fetchmany).
+
+    Para recorrer resultados grandes sin tenerlos todos en memoria. El cursor
+    queda abierto, y la conexión prestada, hasta que el generador se agota o
+    se cierra.
+    """
+    start = time.perf_counter()
+    pool = get_pool(db_path)
+    total = 0
+    with pool.connection() as conn:
+        cur = _execute(pool, conn, query, params)
+        try:
+            while True:
+                rows = cur.fetchmany(size)
+                if not rows:
+                    break
+                total += len(rows)
+                yield rows
+        finally:
+            cur.close()
+            perf.record(query, start, rows=total)
+
+
+def fetch_all_cached(query, params=(), tables=(), row_factory=None, db_path=None):
+    """SELECT servido desde utils.query_cache mientras no cambien `tables`.
+
+    `tables` son las tablas de las que depende el resultado; cualquier
+    escritura en ellas, de este proceso o de otro, invalida la copia. Devuelve
+    una lista nueva en cada llamada para que el llamador pueda modificarla.
+    Dentro de un bloque transaction() se consulta siempre la base de datos.
+    """
+    start = time.perf_counter()
+    pool = get_pool(db_path)
+    if pool.in_transaction():
+        with pool.connection() as conn:
+            cur = _execute(pool, conn, query, params)
+            cur.row_factory = row_factory
+            rows = cur.fetchall()
+        perf.record(query, start, rows=len(rows))
+        return rows
+    pool.sync_changes()
+    key = (query, tuple(params), row_factory)
+    rows = query_cache.get_cache().get(pool.db_path, key, tables)
+    cached = rows is not None
+    if not cached:
+        version = query_cache.get_cache().snapshot(pool.db_path, tables)
+        with pool.connection() as conn:
+            cur = _execute(pool, conn, query, params)
+            cur.row_factory = row_factory
+            rows = cur.fetchall()
+        query_cache.get_cache().put(pool.db_path, key, version, rows)
+    perf.record(query, start, rows=len(rows), cached=cached)
+    return list(rows)
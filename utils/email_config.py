@@ -1,15 +1,9 @@
 import streamlit as st
-import sqlite3
-
-DB_PATH = "database/muyulab.db"
+from utils.db import fetch_one
 
 def get_kam_email_settings(kam_email):
     """Obtiene la configuración de email de un KAM"""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT email_usuario, email_password FROM kams WHERE email = ?", (kam_email,))
-    result = cur.fetchone()
-    conn.close()
+    result = fetch_one("SELECT email_usuario, email_password FROM kams WHERE email = ?", (kam_email,))
     return result if result else (None, None)
 
 def validate_email_credentials(email_user, email_pass):
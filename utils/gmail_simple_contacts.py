@@ -1,15 +1,58 @@
 """
 Extracción de contactos desde Gmail usando credenciales de email existentes.
 Usa IMAP para acceder al buzón y extraer contactos de correos enviados/recibidos.
+
+sync_gmail_contacts lee el buzón completo la primera vez y guarda, por KAM y
+carpeta, las apariciones de cada dirección y el último UID leído (tablas
+gmail_contactos y gmail_sync). Las siguientes veces solo pide los correos con
+UID mayor, así que repetir la importación cuesta lo que llegó desde la
+anterior. Si el servidor cambia el UIDVALIDITY de una carpeta (los UID
+anteriores dejan de valer) esa carpeta se vuelve a leer desde el principio.
+Las carpetas, y los bloques de UID de cada una, se leen en paralelo por un
+pool de conexiones IMAP (IMAPPool).
 """
 
 import imaplib
 import email
-from email.header import decode_header
+from email.header import decode_header, make_header
+from email.utils import getaddresses, parsedate_to_datetime
+import os
+import queue
 import re
+import threading
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import timezone
 import streamlit as st
 
+from modules import utils as dao
+
+# Solo las cabeceras que se usan, sin cuerpo ni adjuntos. PEEK no marca los
+# correos como leídos.
+HEADERS_FETCH = '(BODY.PEEK[HEADER.FIELDS (FROM TO CC DATE)])'
+
+# Mensajes por FETCH: cada bloque es una sola ida y vuelta al servidor
+FETCH_BLOCK = 500
+
+# Servidor IMAP; se puede cambiar con MUYULAB_IMAP_HOST y MUYULAB_IMAP_PORT,
+# p. ej. para usar el servidor de prueba de scripts/servidor_imap_local.py
+IMAP_HOST = os.environ.get('MUYULAB_IMAP_HOST', 'imap.gmail.com')
+IMAP_PORT = int(os.environ.get('MUYULAB_IMAP_PORT', 993))
+
+# Con estos hosts la conexión es sin SSL (solo para el servidor de prueba)
+LOCAL_HOSTS = ('127.0.0.1', 'localhost')
+
+# Conexiones simultáneas al buzón al sincronizar (Gmail admite hasta 15 por cuenta)
+MAX_CONNECTIONS = 4
+
+# Carpetas que se analizan: Enviados (en inglés o en español) e Inbox
+FOLDERS = [
+    '"[Gmail]/Sent Mail"',
+    '"[Gmail]/Enviados"',
+    'INBOX'
+]
+
 def extract_email_info(email_string):
     """
     Extrae nombre y email de strings como 'Juan Pérez <juan@example.com>' o 'juan@example.com'
@@ -37,7 +80,10 @@ def connect_to_gmail(email_user, email_password):
     """
     try:
         # Conectar a Gmail IMAP
-        mail = imaplib.IMAP4_SSL('imap.gmail.com', 993)
+        if IMAP_HOST in LOCAL_HOSTS:
+            mail = imaplib.IMAP4(IMAP_HOST, IMAP_PORT)
+        else:
+            mail = imaplib.IMAP4_SSL(IMAP_HOST, IMAP_PORT)
         mail.login(email_user, email_password)
         return mail, None
     except imaplib.IMAP4.error as e:
@@ -45,166 +91,273 @@ def connect_to_gmail(email_user, email_password):
     except Exception as e:
         return None, f"Error de conexión: {str(e)}"
 
-def extract_contacts_from_emails(email_user, email_password, max_emails=200):
+def decode_name(name):
+    """Decodifica nombres con codificación MIME (=?UTF-8?...?=) y quita comillas"""
+    try:
+        name = str(make_header(decode_header(name)))
+    except Exception:
+        pass
+    return name.strip().strip('"').strip()
+
+def header_date(msg):
+    """Fecha (UTC, 'AAAA-MM-DD') de la cabecera Date, o None si falta o no se entiende"""
+    try:
+        fecha = parsedate_to_datetime(msg.get('Date', ''))
+    except (TypeError, ValueError, IndexError):
+        return None
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(timezone.utc)
+    return fecha.date().isoformat()
+
+def add_addresses(contacts, header_values, email_user, fecha):
+    """Suma una aparición a cada dirección de las cabeceras (menos la del usuario)"""
+    for name, email_addr in getaddresses(header_values):
+        if '@' not in email_addr or email_addr.lower() == email_user.lower():
+            continue
+        contacto = contacts[email_addr.lower()]
+        contacto['email'] = email_addr
+        if name and not contacto['nombre']:
+            contacto['nombre'] = decode_name(name)
+        contacto['count'] += 1
+        if fecha and (not contacto['ultimo'] or fecha > contacto['ultimo']):
+            contacto['ultimo'] = fecha
+
+def new_contacts():
+    """Acumulador de contactos: dirección en minúsculas -> email, nombre, apariciones y último correo"""
+    return defaultdict(lambda: {'email': '', 'nombre': '', 'count': 0, 'ultimo': None})
+
+def process_headers(contacts, raw_headers, folder, email_user):
+    """Cuenta los contactos de las cabeceras de un correo (From y Cc; To solo en enviados)"""
+    msg = email.message_from_bytes(raw_headers)
+    fecha = header_date(msg)
+    add_addresses(contacts, msg.get_all('From', []), email_user, fecha)
+    if folder != 'INBOX':
+        add_addresses(contacts, msg.get_all('To', []), email_user, fecha)
+    add_addresses(contacts, msg.get_all('Cc', []), email_user, fecha)
+
+def contact_dict(email_addr, full_name, frecuencia, ultimo):
+    """Contacto con los campos que usa la UI (el nombre se separa en nombre y apellidos)"""
+    parts = (full_name or '').split(' ', 1)
+    return {
+        'nombre': parts[0],
+        'apellidos': parts[1] if len(parts) > 1 else '',
+        'email': email_addr,
+        'telefono': '',
+        'cargo': 'Contacto',
+        'institucion': 'Red de contactos',
+        'frecuencia': frecuencia,
+        'ultimo_correo': ultimo or ''
+    }
+
+def folder_uidvalidity(mail):
+    """UIDVALIDITY de la carpeta recién seleccionada (viene en la respuesta de SELECT)"""
+    _, data = mail.response('UIDVALIDITY')
+    return int(data[0]) if data and data[0] else 0
+
+def new_uids(mail, ultimo_uid):
+    """UIDs de la carpeta seleccionada mayores que `ultimo_uid`, en orden"""
+    status, data = mail.uid('SEARCH', f'UID {ultimo_uid + 1}:*')
+    if status != 'OK' or not data or not data[0]:
+        return []
+    # 'N:*' incluye siempre el último correo aunque su UID sea menor que N
+    return sorted(uid for uid in map(int, data[0].split()) if uid > ultimo_uid)
+
+def uid_blocks(uids, size=FETCH_BLOCK):
+    """Bloques de hasta `size` UIDs como (conjunto 'a:b', cantidad, último UID).
+
+    Los UID que faltan dentro de un rango son de correos borrados: los
+    nuevos siempre reciben un UID mayor que todos los existentes.
+    """
+    for start in range(0, len(uids), size):
+        block = uids[start:start + size]
+        yield f"{block[0]}:{block[-1]}", len(block), block[-1]
+
+class IMAPPool:
     """
-    Extrae contactos únicos desde los correos de Gmail.
+    Conexiones IMAP autenticadas a un mismo buzón, compartidas entre hilos.
     
-    Args:
-        email_user: Email del usuario
-        email_password: Contraseña de aplicación de Gmail
-        max_emails: Número máximo de correos a analizar
-        
-    Returns:
-        list: Lista de diccionarios con contactos únicos
-        str: Mensaje de error si falla
+    Cada conexión la usa un solo hilo a la vez. Se abren a medida que hacen
+    falta, hasta `size`, y recuerdan qué carpeta tienen seleccionada para no
+    repetir el SELECT en cada bloque.
     """
-    mail, error = connect_to_gmail(email_user, email_password)
-    if error:
-        return None, error
     
+    def __init__(self, email_user, email_password, size=MAX_CONNECTIONS, first=None):
+        self.email_user = email_user
+        self.email_password = email_password
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._selected = {}
+        if first is not None:
+            self._open = 1
+            self._idle.put(first)
+    
+    def _get(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            new = self._open < self.size
+            if new:
+                self._open += 1
+        if not new:
+            return self._idle.get()
+        mail, error = connect_to_gmail(self.email_user, self.email_password)
+        if error:
+            with self._lock:
+                self._open -= 1
+            raise imaplib.IMAP4.error(error)
+        return mail
+    
+    @contextmanager
+    def connection(self):
+        """Presta una conexión; si algo falla mientras se usa, se cierra en lugar de devolverla"""
+        mail = self._get()
+        try:
+            yield mail
+        except BaseException:
+            self._discard(mail)
+            raise
+        self._idle.put(mail)
+    
+    def select(self, mail, folder, force=False):
+        """SELECT de solo lectura, salvo que la conexión ya tenga `folder` seleccionada"""
+        if not force and self._selected.get(id(mail)) == folder:
+            return 'OK'
+        status, _ = mail.select(folder, readonly=True)
+        self._selected[id(mail)] = folder if status == 'OK' else None
+        return status
+    
+    def _discard(self, mail):
+        self._selected.pop(id(mail), None)
+        with self._lock:
+            self._open -= 1
+        try:
+            mail.logout()
+        except Exception:
+            pass
+    
+    def close(self):
+        """Cierra las conexiones libres (al terminar, todas lo están)"""
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+def scan_folder(pool, folder, anterior, cuenta):
+    """
+    Selecciona una carpeta y busca los UID que faltan leer.
+    
+    Devuelve (uidvalidity, reiniciar, uids) o None si la carpeta no existe.
+    Con `reiniciar` lo acumulado de la carpeta ya no vale (cambió la cuenta o
+    el UIDVALIDITY) y `uids` son todos los de la carpeta.
+    """
+    with pool.connection() as mail:
+        if pool.select(mail, folder, force=True) != 'OK':
+            return None
+        uidvalidity = folder_uidvalidity(mail)
+        reiniciar = not (anterior and anterior.cuenta == cuenta and anterior.uidvalidity == uidvalidity)
+        return uidvalidity, reiniciar, new_uids(mail, 0 if reiniciar else anterior.ultimo_uid)
+
+def fetch_block(pool, folder, message_set, email_user):
+    """Contactos de un bloque de UIDs de una carpeta"""
+    with pool.connection() as mail:
+        pool.select(mail, folder)
+        status, msg_data = mail.uid('FETCH', message_set, HEADERS_FETCH)
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"FETCH {message_set} en {folder}: {status}")
+    contacts = new_contacts()
+    for response_part in msg_data:
+        if isinstance(response_part, tuple):
+            process_headers(contacts, response_part[1], folder, email_user)
+    return contacts
+
+def sync_folders(pool, kam_id, email_user, progress_callback=None):
+    """
+    Lee los correos nuevos de FOLDERS en paralelo y suma sus contactos; devuelve cuántos leyó.
+    
+    Las carpetas se buscan a la vez y sus UID nuevos se reparten en bloques
+    de FETCH_BLOCK que los hilos piden por las conexiones de `pool`. Los
+    bloques se guardan desde este hilo y, dentro de cada carpeta, en orden
+    de UID: uno que termina antes que los anteriores espera en memoria, así
+    el último UID guardado nunca salta un bloque sin contar.
+    """
+    cuenta = email_user.lower()
+    estado = dao.gmail_sync(kam_id)
+    executor = ThreadPoolExecutor(max_workers=pool.size)
     try:
-        contacts = defaultdict(lambda: {'email': '', 'nombre': '', 'count': 0})
-        
-        # Analizar carpetas: Enviados e Inbox
-        folders_to_check = [
-            '"[Gmail]/Sent Mail"',  # Enviados
-            '"[Gmail]/Enviados"',   # Enviados (español)
-            'INBOX'                  # Recibidos
-        ]
+        scans = [(folder, executor.submit(scan_folder, pool, folder, estado.get(folder.strip('"')), cuenta))
+                 for folder in FOLDERS]
         
-        total_processed = 0
-        
-        for folder in folders_to_check:
-            try:
-                # Seleccionar carpeta
-                status, _ = mail.select(folder, readonly=True)
-                if status != 'OK':
-                    continue
-                
-                # Buscar últimos correos
-                status, messages = mail.search(None, 'ALL')
-                if status != 'OK':
-                    continue
-                
-                email_ids = messages[0].split()
-                # Tomar los últimos N correos
-                recent_ids = email_ids[-max_emails:] if len(email_ids) > max_emails else email_ids
-                
-                for email_id in recent_ids:
-                    if total_processed >= max_emails:
-                        break
-                    
-                    try:
-                        # Obtener el correo
-                        status, msg_data = mail.fetch(email_id, '(RFC822)')
-                        if status != 'OK':
-                            continue
-                        
-                        # Parse del email
-                        for response_part in msg_data:
-                            if isinstance(response_part, tuple):
-                                msg = email.message_from_bytes(response_part[1])
-                                
-                                # Extraer From
-                                from_header = msg.get('From', '')
-                                if from_header:
-                                    name, email_addr = extract_email_info(from_header)
-                                    if email_addr and email_addr.lower() != email_user.lower():
-                                        contacts[email_addr.lower()]['email'] = email_addr
-                                        if name and not contacts[email_addr.lower()]['nombre']:
-                                            contacts[email_addr.lower()]['nombre'] = name
-                                        contacts[email_addr.lower()]['count'] += 1
-                                
-                                # Extraer To (solo de enviados)
-                                if folder != 'INBOX':
-                                    to_header = msg.get('To', '')
-                                    if to_header:
-                                        # Puede tener múltiples destinatarios
-                                        to_addresses = to_header.split(',')
-                                        for to_addr in to_addresses:
-                                            name, email_addr = extract_email_info(to_addr)
-                                            if email_addr and email_addr.lower() != email_user.lower():
-                                                contacts[email_addr.lower()]['email'] = email_addr
-                                                if name and not contacts[email_addr.lower()]['nombre']:
-                                                    contacts[email_addr.lower()]['nombre'] = name
-                                                contacts[email_addr.lower()]['count'] += 1
-                                
-                                # Extraer Cc
-                                cc_header = msg.get('Cc', '')
-                                if cc_header:
-                                    cc_addresses = cc_header.split(',')
-                                    for cc_addr in cc_addresses:
-                                        name, email_addr = extract_email_info(cc_addr)
-                                        if email_addr and email_addr.lower() != email_user.lower():
-                                            contacts[email_addr.lower()]['email'] = email_addr
-                                            if name and not contacts[email_addr.lower()]['nombre']:
-                                                contacts[email_addr.lower()]['nombre'] = name
-                                            contacts[email_addr.lower()]['count'] += 1
-                        
-                        total_processed += 1
-                        
-                    except Exception as e:
-                        # Ignorar errores en correos individuales
-                        continue
-                
-                if total_processed >= max_emails:
-                    break
-                    
-            except Exception as e:
-                # Ignorar errores en carpetas individuales
+        blocks = {}
+        uidvalidities = {}
+        for folder, future in scans:
+            scan = future.result()
+            if scan is None:
                 continue
+            uidvalidity, reiniciar, uids = scan
+            carpeta = folder.strip('"')
+            if reiniciar:
+                dao.reiniciar_gmail_carpeta(kam_id, carpeta, cuenta, uidvalidity)
+            uidvalidities[carpeta] = uidvalidity
+            for index, (message_set, count, last_uid) in enumerate(uid_blocks(uids)):
+                future = executor.submit(fetch_block, pool, folder, message_set, email_user)
+                blocks[future] = (carpeta, index, count, last_uid)
         
-        # Cerrar conexión
-        mail.close()
-        mail.logout()
-        
-        # Convertir a lista y ordenar por frecuencia
-        contacts_list = []
-        for email_addr, data in contacts.items():
-            # Separar nombre en nombre y apellidos
-            full_name = data['nombre'] or ''
-            parts = full_name.split(' ', 1)
-            nombre = parts[0] if parts else ''
-            apellidos = parts[1] if len(parts) > 1 else ''
-            
-            contacts_list.append({
-                'nombre': nombre,
-                'apellidos': apellidos,
-                'email': data['email'],
-                'telefono': '',
-                'cargo': 'Contacto',
-                'institucion': 'Red de contactos',
-                'frecuencia': data['count']
-            })
-        
-        # Ordenar por frecuencia descendente
-        contacts_list.sort(key=lambda x: x['frecuencia'], reverse=True)
-        
-        return contacts_list, None
-        
-    except Exception as e:
-        return None, f"Error procesando correos: {str(e)}"
+        total = sum(count for _, _, count, _ in blocks.values())
+        next_index = defaultdict(int)
+        done = defaultdict(dict)
+        processed = 0
+        for future in as_completed(blocks):
+            carpeta, index, count, last_uid = blocks[future]
+            done[carpeta][index] = (future.result(), count, last_uid)
+            while next_index[carpeta] in done[carpeta]:
+                contacts, count, last_uid = done[carpeta].pop(next_index[carpeta])
+                dao.guardar_bloque_gmail(kam_id, carpeta, cuenta, uidvalidities[carpeta], last_uid, [
+                    (clave, data['email'], data['nombre'], data['count'], data['ultimo'] or '')
+                    for clave, data in contacts.items()
+                ])
+                next_index[carpeta] += 1
+                processed += count
+                if progress_callback:
+                    progress_callback(f"Analizando correos nuevos: {processed:,} de {total:,}",
+                                      processed / total)
+        return processed
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
 
-def get_contacts_from_gmail_simple(email_user, email_password, max_emails=200, progress_callback=None):
+def sync_gmail_contacts(kam_id, email_user, email_password, progress_callback=None, connections=MAX_CONNECTIONS):
     """
-    Versión simplificada para usar en la UI con callback de progreso.
+    Sincroniza los contactos acumulados del KAM con los correos nuevos de su buzón.
+    
+    Las carpetas y los bloques de correos se leen en paralelo por hasta
+    `connections` conexiones IMAP. Cada bloque leído queda guardado al
+    momento: si la sincronización se corta, la siguiente sigue desde el
+    último bloque guardado de cada carpeta.
     
-    Args:
-        email_user: Email del usuario
-        email_password: Contraseña de aplicación
-        max_emails: Número máximo de correos a analizar
-        progress_callback: Función para actualizar progreso (opcional)
-        
     Returns:
-        list: Lista de contactos o None si falla
+        int: Correos nuevos analizados (None si falla)
         str: Mensaje de error si falla
     """
     if progress_callback:
-        progress_callback("Conectando a Gmail...", 0.1)
+        progress_callback("Conectando a Gmail...", 0.0)
     
-    contacts, error = extract_contacts_from_emails(email_user, email_password, max_emails)
-    
-    if progress_callback:
-        progress_callback("Contactos extraídos!", 1.0)
+    mail, error = connect_to_gmail(email_user, email_password)
+    if error:
+        return None, error
     
-    return contacts, error
+    pool = IMAPPool(email_user, email_password, size=connections, first=mail)
+    try:
+        return sync_folders(pool, kam_id, email_user, progress_callback), None
+    except Exception as e:
+        return None, f"Error procesando correos: {str(e)}"
+    finally:
+        pool.close()
+
+def stored_contacts(kam_id):
+    """Contactos acumulados del KAM para la UI, ordenados por frecuencia descendente"""
+    return [contact_dict(c.email, c.nombre, c.frecuencia, c.ultimo_correo)
+            for c in dao.list_gmail_contactos(kam_id)]
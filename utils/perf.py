@@ -0,0 +1,174 @@
+"""
+Instrumentación de las llamadas a la base de datos.
+
+utils.db registra aquí cada consulta: duración, filas, función que la llamó
+y huella de la sentencia (el SQL normalizado, sin literales). app.py marca el
+inicio de cada rerun con start_rerun() para poder agrupar por rerun y por
+sesión. Los registros se guardan en memoria en un buffer circular y se
+consultan desde la sección "Rendimiento" del panel de administración.
+
+Se desactiva con la variable de entorno MUYULAB_PERF=0.
+"""
+
+import hashlib
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+
+ENABLED = os.environ.get("MUYULAB_PERF", "1") != "0"
+
+# Registros que se conservan (los más antiguos se descartan)
+MAX_RECORDS = 20000
+
+_records = deque(maxlen=MAX_RECORDS)
+_local = threading.local()
+_rerun_ids = itertools.count(1)
+
+# Archivos de la capa de datos que no cuentan como "quién llamó"
+_INTERNAL_FILES = tuple(
+    os.path.join("utils", name) for name in ("db.py", "perf.py", "query_cache.py")
+) + (os.path.join("modules", "utils.py"),)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SPACE_RE = re.compile(r"\s+")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+_fingerprints = {}
+
+
+def normalize_sql(sql):
+    """SQL en una línea con los literales reemplazados por ?"""
+    text = _STRING_RE.sub("?", sql)
+    text = _NUMBER_RE.sub("?", text)
+    text = _IN_LIST_RE.sub("(?...)", text)
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def fingerprint(sql):
+    """(huella, SQL normalizado) de una sentencia; se memoriza por texto"""
+    cached = _fingerprints.get(sql)
+    if cached is None:
+        normalized = normalize_sql(sql)
+        cached = (hashlib.sha1(normalized.encode()).hexdigest()[:10], normalized)
+        if len(_fingerprints) < 5000:
+            _fingerprints[sql] = cached
+    return cached
+
+
+def start_rerun(session_id):
+    """Marca el inicio de un rerun de Streamlit en el hilo actual"""
+    _local.session_id = session_id
+    _local.rerun_id = next(_rerun_ids)
+    return _local.rerun_id
+
+
+def _caller():
+    """Primera función fuera de la capa de datos en la pila de llamadas"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not filename.endswith(_INTERNAL_FILES) and "contextlib" not in filename:
+            module = os.path.splitext(os.path.basename(filename))[0]
+            return f"{module}.{frame.f_code.co_name}:{frame.f_lineno}"
+        frame = frame.f_back
+    return "?"
+
+
+def record(sql, start, rows=None, cached=False):
+    """Registra una llamada; `start` es el time.perf_counter() inicial"""
+    if not ENABLED:
+        return
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    fp, normalized = fingerprint(sql)
+    _records.append({
+        "ts": time.time(),
+        "fingerprint": fp,
+        "sql": normalized,
+        "ms": elapsed_ms,
+        "rows": rows,
+        "cached": cached,
+        "caller": _caller(),
+        "rerun_id": getattr(_local, "rerun_id", None),
+        "session_id": getattr(_local, "session_id", None),
+    })
+
+
+def records():
+    """Copia de los registros actuales"""
+    return list(_records)
+
+
+def clear():
+    _records.clear()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def summary_by_statement(items=None):
+    """Métricas por huella de sentencia, de mayor a menor tiempo total"""
+    groups = {}
+    for r in records() if items is None else items:
+        groups.setdefault(r["fingerprint"], []).append(r)
+    summary = []
+    for fp, group in groups.items():
+        times = [r["ms"] for r in group]
+        summary.append({
+            "fingerprint": fp,
+            "sql": group[-1]["sql"],
+            "llamadas": len(group),
+            "desde_cache": sum(1 for r in group if r["cached"]),
+            "p50_ms": percentile(times, 50),
+            "p95_ms": percentile(times, 95),
+            "max_ms": max(times),
+            "total_ms": sum(times),
+            "filas_prom": sum(r["rows"] or 0 for r in group) / len(group),
+            "llamado_desde": group[-1]["caller"],
+        })
+    summary.sort(key=lambda s: s["total_ms"], reverse=True)
+    return summary
+
+
+def summary_by_rerun(items=None):
+    """Llamadas y tiempo acumulado de cada rerun registrado"""
+    groups = {}
+    for r in records() if items is None else items:
+        if r["rerun_id"] is not None:
+            groups.setdefault(r["rerun_id"], []).append(r)
+    summary = []
+    for rerun_id, group in groups.items():
+        summary.append({
+            "rerun_id": rerun_id,
+            "session_id": group[0]["session_id"],
+            "inicio": group[0]["ts"],
+            "llamadas": len(group),
+            "desde_cache": sum(1 for r in group if r["cached"]),
+            "total_ms": sum(r["ms"] for r in group),
+        })
+    summary.sort(key=lambda s: s["rerun_id"])
+    return summary
+
+
+def summary_by_session(items=None):
+    """Reruns, llamadas y tiempo acumulado por sesión"""
+    sessions = {}
+    for rerun in summary_by_rerun(items):
+        s = sessions.setdefault(rerun["session_id"], {
+            "session_id": rerun["session_id"], "reruns": 0, "llamadas": 0, "total_ms": 0.0
+        })
+        s["reruns"] += 1
+        s["llamadas"] += rerun["llamadas"]
+        s["total_ms"] += rerun["total_ms"]
+    for s in sessions.values():
+        s["llamadas_por_rerun"] = s["llamadas"] / s["reruns"]
+    return sorted(sessions.values(), key=lambda s: s["total_ms"], reverse=True)
@@ -0,0 +1,128 @@
+"""
+Caché en memoria de resultados de consultas con invalidación por versión.
+
+Cada resultado se guarda junto con la "generación" de las tablas de las que
+depende. Toda escritura hecha a través de utils.db incrementa la generación
+de la tabla afectada, de modo que la siguiente lectura detecta que la copia
+quedó obsoleta y vuelve a consultar la base de datos. Las entradas se
+descartan en orden LRU al superar el límite.
+"""
+
+import threading
+from collections import OrderedDict
+
+# Límites por defecto: número de consultas distintas y filas por resultado
+MAX_ENTRIES = 256
+MAX_ROWS = 5000
+
+
+class QueryCache:
+    """Caché LRU de resultados, versionada por tabla."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_rows=MAX_ROWS):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._epochs = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _keys(db_path, tables):
+        """Claves de generación de las tablas; los nombres de SQLite no
+        distinguen mayúsculas, así que se normalizan aquí y solo aquí"""
+        return [(db_path, table.lower()) for table in tables]
+
+    def _version(self, db_path, tables):
+        return (self._epochs.get(db_path, 0),) + tuple(
+            self._generations.get(key, 0) for key in self._keys(db_path, tables)
+        )
+
+    def snapshot(self, db_path, tables):
+        """Versión actual de las tablas indicadas (se toma antes de consultar)"""
+        with self._lock:
+            return self._version(db_path, tables)
+
+    def get(self, db_path, key, tables):
+        """Resultado guardado si sigue vigente, o None"""
+        full_key = (db_path, key)
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None:
+                version, rows = entry
+                if version == self._version(db_path, tables):
+                    self._entries.move_to_end(full_key)
+                    self.hits += 1
+                    return rows
+                del self._entries[full_key]
+                self.invalidations += 1
+            self.misses += 1
+            return None
+
+    def put(self, db_path, key, version, rows):
+        """Guarda un resultado con la versión tomada antes de la consulta"""
+        if len(rows) > self.max_rows:
+            return
+        full_key = (db_path, key)
+        with self._lock:
+            self._entries[full_key] = (version, rows)
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def bump(self, db_path, tables):
+        """Marca como modificadas las tablas indicadas"""
+        with self._lock:
+            for key in self._keys(db_path, tables):
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+    def bump_all(self, db_path):
+        """Invalida todos los resultados de una base de datos"""
+        with self._lock:
+            self._epochs[db_path] = self._epochs.get(db_path, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Contadores de uso de la caché"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+# Instancia compartida por todo el proceso
+_cache = QueryCache()
+
+
+def get_cache():
+    return _cache
+
+
+def bump(db_path, tables):
+    _cache.bump(db_path, tables)
+
+
+def bump_all(db_path):
+    _cache.bump_all(db_path)
+
+
+def stats():
+    return _cache.stats()
+
+
+def clear():
+    _cache.clear()